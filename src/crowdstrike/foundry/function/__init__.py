@@ -1,4 +1,5 @@
 """CrowdStrike Foundry Functions FDK."""
+import os
 import sys
 from typing import Union
 from crowdstrike.foundry.function.model import (
@@ -87,6 +88,9 @@ class Function:
                 # run in CLI mode without starting an http server
                 from crowdstrike.foundry.function.runner_cli import CLIRunner
                 self._runner = Runner(CLIRunner())
+            elif os.environ.get('CS_FN_RUNNER', '').strip().lower() == 'async':
+                from crowdstrike.foundry.function.runner_async import AsyncHTTPRunner
+                self._runner = Runner(AsyncHTTPRunner())
             else:
                 from crowdstrike.foundry.function.runner_http import HTTPRunner
                 self._runner = Runner(HTTPRunner())
@@ -103,11 +107,66 @@ class Function:
         self._loader.load()
         return self._runner.run(*args, **kwargs)
 
-    def handler(self, method: str, path: str):
+    def metrics(self) -> dict:
+        """Fetch the metrics recorded for the requests served so far.
+
+        :return: Request counts, error counts by status code and latency histograms for each route.
+        See :meth:`Metrics.snapshot` for the layout.
+        """
+        return self._router.metrics.snapshot()
+
+    def cache_stats(self) -> dict:
+        """Fetch the counters of the response caches of handlers registered with one.
+
+        :return: Hits, misses, evictions and entries held for each route with a cache.
+        See :meth:`ResponseCache.stats` for the layout.
+        """
+        return self._router.metrics.cache_stats()
+
+    def coalescing_stats(self) -> dict:
+        """Fetch the counters of request coalescing for handlers registered with it.
+
+        :return: Handler invocations and requests sharing another's response for each route coalescing requests.
+        See :meth:`SingleFlight.stats` for the layout.
+        """
+        return self._router.metrics.coalescing_stats()
+
+    def middleware(self, m):
+        """Apply a :class:`Middleware` to every handler.
+
+        :param m: :class:`Middleware` to apply.
+        :return: The given middleware.
+        """
+        self._router.use(m)
+        return m
+
+    def handler(
+            self,
+            method: str,
+            path: str,
+            cache=None,
+            coalesce=None,
+            middleware=(),
+            request_schema=None,
+            response_schema=None,
+            timeout=None,
+    ):
         """Define the decorator for handlers.
 
+        Handlers may be plain functions or coroutine (`async def`) functions.
+
         :param method: HTTP method or verb to bind to this handler.
         :param path: URL path at which this handler resides.
+        :param cache: :class:`CachePolicy` with which to cache the handler's successful responses, if any.
+        :param coalesce: :class:`CoalescePolicy` with which concurrent identical requests share one invocation of the
+        handler, if any.
+        :param middleware: :class:`Middleware` to apply to this handler alone, inside any applied to every handler.
+        :param request_schema: JSON Schema against which request bodies are validated before the handler runs, or the
+        path of a file holding one, such as `request_schema.json`, relative to the directory of the handler's source.
+        :param response_schema: JSON Schema against which a sample of the handler's successful response bodies are
+        validated, or the path of a file holding one.
+        :param timeout: Seconds the handler may run for before the request is answered with a 504, in place of
+        `CS_FN_HANDLER_TIMEOUT`. 0 for no limit.
         """
 
         def call(func):
@@ -116,6 +175,12 @@ class Function:
                 func=func,
                 method=method,
                 path=path,
+                cache=cache,
+                coalesce=coalesce,
+                middleware=middleware,
+                request_schema=request_schema,
+                response_schema=response_schema,
+                timeout=timeout,
             ))
 
         return call
@@ -126,8 +191,6 @@ def cloud() -> str:
 
     :return: Cloud in which this function is executing.
     """
-    import os
-
     _default = 'auto'
     c = os.environ.get('CS_CLOUD', _default)
     c = c.lower().replace('-', '').strip()
@@ -0,0 +1,127 @@
+"""Admission control for CrowdStrike Foundry Function FDK."""
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Union
+
+ADMITTED = 'admitted'
+REJECTED = 'rejected'
+SHED = 'shed'
+
+
+@dataclass
+class AdmissionOptions:
+    """Defines how many requests the HTTP server takes on at once."""
+
+    # Requests handled at once, beyond which further requests wait their turn. 0 for no limit.
+    max_concurrent: int = field(default=0)
+    # Requests which may wait their turn, beyond which further requests are rejected.
+    max_queued: int = field(default=0)
+    # Seconds a request may wait its turn before it is shed. 0 for no limit.
+    max_queue_age: float = field(default=0.0)
+    # Seconds after which callers are told to retry rejected and shed requests.
+    retry_after: int = field(default=1)
+
+    @staticmethod
+    def from_env() -> 'AdmissionOptions':
+        """Read the options from the environment.
+
+        :return: Options given by `CS_FN_MAX_CONCURRENCY`, `CS_FN_MAX_QUEUED`, `CS_FN_MAX_QUEUE_AGE_MS` and
+        `CS_FN_RETRY_AFTER`, with defaults for any not provided.
+        """
+        defaults = AdmissionOptions()
+        return AdmissionOptions(
+            max_concurrent=int(os.environ.get('CS_FN_MAX_CONCURRENCY', defaults.max_concurrent)),
+            max_queued=int(os.environ.get('CS_FN_MAX_QUEUED', defaults.max_queued)),
+            max_queue_age=float(os.environ.get('CS_FN_MAX_QUEUE_AGE_MS', defaults.max_queue_age * 1000)) / 1000,
+            retry_after=int(os.environ.get('CS_FN_RETRY_AFTER', defaults.retry_after)),
+        )
+
+
+class AdmissionController:
+    """Admits requests up to a limit, queueing a bounded number of further requests and turning away the rest.
+
+    Requests which cannot be queued are rejected straight away, and requests which wait longer than allowed are shed,
+    so that callers hear back quickly rather than waiting on a server which is already behind.
+    """
+
+    def __init__(self, options: Union[AdmissionOptions, None] = None, clock=time.monotonic):
+        """Initialize the controller.
+
+        :param options: :class:`AdmissionOptions` governing how many requests are taken on at once.
+        Defaults to :meth:`AdmissionOptions.from_env`.
+        :param clock: Function returning the current time in seconds, against which queue ages are measured.
+        """
+        self.options = options if options is not None else AdmissionOptions.from_env()
+        if self.options.max_concurrent < 0:
+            raise ValueError(f'max_concurrent must not be negative, got {self.options.max_concurrent}')
+        if self.options.max_queued < 0:
+            raise ValueError(f'max_queued must not be negative, got {self.options.max_queued}')
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._active = 0
+        self._queued = 0
+        self._counts = {ADMITTED: 0, REJECTED: 0, SHED: 0}
+
+    def acquire(self, arrived: Union[float, None] = None) -> str:
+        """Wait for a request's turn to be handled.
+
+        A request admitted with :data:`ADMITTED` must be followed by a call to :meth:`release` once it is done.
+
+        :param arrived: Time, from the controller's clock, at which the request arrived. Defaults to now.
+        :return: :data:`ADMITTED` if the request may be handled, :data:`REJECTED` if too many requests are already
+        waiting, or :data:`SHED` if the request waited longer than allowed.
+        """
+        limit = self.options.max_concurrent
+        max_age = self.options.max_queue_age
+        with self._cond:
+            now = self._clock()
+            if arrived is None:
+                arrived = now
+            if limit <= 0 or self._active < limit:
+                return self._admit(arrived, now)
+            if self._queued >= self.options.max_queued:
+                self._counts[REJECTED] += 1
+                return REJECTED
+            self._queued += 1
+            try:
+                while self._active >= limit:
+                    if max_age > 0:
+                        remaining = arrived + max_age - now
+                        if remaining <= 0:
+                            self._counts[SHED] += 1
+                            return SHED
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                    now = self._clock()
+            finally:
+                self._queued -= 1
+            return self._admit(arrived, now)
+
+    def _admit(self, arrived: float, now: float) -> str:
+        # Also catches requests which were held up before they reached the controller.
+        if 0 < self.options.max_queue_age <= now - arrived:
+            self._counts[SHED] += 1
+            # Pass on any turn this request was woken for.
+            self._cond.notify()
+            return SHED
+        self._active += 1
+        self._counts[ADMITTED] += 1
+        return ADMITTED
+
+    def release(self):
+        """Mark an admitted request as done, letting a waiting request take its turn."""
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the controller.
+
+        :return: Number of requests `admitted`, `rejected` and `shed` so far, along with the number currently being
+        handled (`active`) and waiting their turn (`queued`).
+        """
+        with self._cond:
+            return dict(self._counts, active=self._active, queued=self._queued)
@@ -0,0 +1,464 @@
+"""Benchmarks for CrowdStrike Foundry Functions FDK.
+
+Run `python -m crowdstrike.foundry.function.bench --help` for usage. Two suites are provided:
+
+* `load` starts a function with the chosen runner and drives it over HTTP, reporting the request rate and latency.
+* `micro` times the FDK's own per-request work, such as routing and mapping, independently of any handler.
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from http.client import HTTPConnection, HTTPException
+from socket import create_connection, socket
+from subprocess import DEVNULL, Popen, TimeoutExpired
+from timeit import Timer
+from typing import Any, Callable, Dict, List, Tuple, Union
+from crowdstrike.foundry.function.mapping import canonize_header, dict_to_request, response_to_dict
+from crowdstrike.foundry.function.metrics import percentile
+from crowdstrike.foundry.function.model import Request, Response
+from crowdstrike.foundry.function.router import Route, Router
+
+PROFILE_JSON = 'json'
+PROFILE_MULTIPART = 'multipart'
+PROFILE_HEADERS = 'headers'
+
+RUNNER_HTTP = 'http'
+RUNNER_ASYNC = 'async'
+
+_BOUNDARY = 'cs-fn-bench-boundary'
+
+
+@dataclass
+class LoadResult:
+    """Outcome of a load test."""
+
+    # Seconds taken by each completed request.
+    latencies: List[float] = field(default_factory=list)
+    # Number of responses received with each status code.
+    statuses: Dict[int, int] = field(default_factory=dict)
+    # Number of requests which failed without a response.
+    failures: int = field(default=0)
+    # Seconds from the first request being sent to the last response being received.
+    elapsed: float = field(default=0.0)
+
+    @property
+    def requests(self) -> int:
+        """Number of requests sent."""
+        return len(self.latencies) + self.failures
+
+    @property
+    def errors(self) -> int:
+        """Number of requests which failed, or whose response status was not 2xx."""
+        return self.failures + sum(n for code, n in self.statuses.items() if not 200 <= code < 300)
+
+    def summary(self) -> Dict[str, Any]:
+        """Summarize the result.
+
+        :return: Request and error counts, requests per second, and latency percentiles in milliseconds.
+        """
+        ordered = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'statuses': {str(code): n for code, n in sorted(self.statuses.items())},
+            'elapsed_s': round(self.elapsed, 3),
+            'rps': round(len(ordered) / self.elapsed, 1) if self.elapsed > 0 else 0.0,
+            'p50_ms': round(1000 * percentile(ordered, 50), 3),
+            'p95_ms': round(1000 * percentile(ordered, 95), 3),
+            'p99_ms': round(1000 * percentile(ordered, 99), 3),
+            'max_ms': round(1000 * percentile(ordered, 100), 3),
+        }
+
+
+def build_payload(
+        profile: str,
+        method: str = 'POST',
+        path: str = '/',
+        body_size: int = 1024,
+        file_size: int = 1024 * 1024,
+        header_count: int = 50,
+) -> Tuple[Dict[str, str], bytes]:
+    """Build the HTTP request sent to a function for the given payload profile.
+
+    :param profile: `json` for a JSON body, `multipart` for a JSON body and an uploaded file, or `headers` for a
+    JSON body accompanied by many request headers.
+    :param method: HTTP method of the request made of the function.
+    :param path: Path of the request made of the function.
+    :param body_size: Approximate size of the request body, in bytes.
+    :param file_size: Size of the uploaded file for the `multipart` profile, in bytes.
+    :param header_count: Number of request headers for the `headers` profile.
+    :return: HTTP headers and body.
+    :raise ValueError: Unknown profile.
+    """
+    meta = {'method': method, 'url': path}
+    body = {'items': ['x' * 60 for _ in range(max(1, body_size // 64))]}
+
+    if profile == PROFILE_JSON:
+        meta['body'] = body
+        return {'Content-Type': 'application/json'}, json.dumps(meta).encode('utf-8')
+
+    if profile == PROFILE_HEADERS:
+        headers = {f'X-Bench-Header-{i}': f'value-{i}' for i in range(header_count)}
+        meta['body'] = body
+        meta['params'] = {'header': {k.lower(): [v] for k, v in headers.items()}}
+        headers['Content-Type'] = 'application/json'
+        return headers, json.dumps(meta).encode('utf-8')
+
+    if profile == PROFILE_MULTIPART:
+        parts = []
+        for name, value in [('meta', meta), ('body', body)]:
+            parts.append(
+                f'--{_BOUNDARY}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8')
+                + json.dumps(value).encode('utf-8') + b'\r\n'
+            )
+        parts.append(
+            f'--{_BOUNDARY}\r\nContent-Disposition: form-data; name="file"; filename="sample.bin"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+            + os.urandom(file_size) + b'\r\n'
+        )
+        parts.append(f'--{_BOUNDARY}--\r\n'.encode('utf-8'))
+        return {'Content-Type': f'multipart/form-data; boundary={_BOUNDARY}'}, b''.join(parts)
+
+    raise ValueError(f'unsupported payload profile: {profile}')
+
+
+def start_function(
+        main: str,
+        runner: str = RUNNER_HTTP,
+        port: Union[int, None] = None,
+        env: Union[Dict[str, str], None] = None,
+) -> Tuple[Popen, int]:
+    """Start a function in a new process.
+
+    :param main: Path to the function's entry point, usually `main.py`. It is run from its own directory.
+    :param runner: `http` or `async`.
+    :param port: Port on which the function listens. Defaults to a free port.
+    :param env: Additional environment variables, such as `CS_FN_HTTP_CONCURRENCY`.
+    :return: Process running the function, and the port on which it listens.
+    :raise ValueError: Unknown runner.
+    """
+    if runner not in (RUNNER_HTTP, RUNNER_ASYNC):
+        raise ValueError(f'unsupported runner: {runner}')
+    if port is None:
+        with socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+
+    proc_env = dict(os.environ)
+    proc_env.update(env or {})
+    proc_env['PORT'] = str(port)
+    proc_env['CS_FN_RUNNER'] = runner
+    main = os.path.abspath(main)
+    proc = Popen([sys.executable, main], cwd=os.path.dirname(main), env=proc_env, stdout=DEVNULL, stderr=DEVNULL)
+    return proc, port
+
+
+def wait_until_listening(proc: Popen, port: int, timeout: float = 30.0):
+    """Wait for a function started by :func:`start_function` to accept connections.
+
+    :param proc: Process running the function.
+    :param port: Port on which the function listens.
+    :param timeout: Seconds to wait.
+    :raise RuntimeError: The function exited or did not start listening in time.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f'function exited with status {proc.returncode} before listening')
+        try:
+            create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'function did not listen on port {port} within {timeout}s')
+            time.sleep(0.05)
+
+
+def stop_function(proc: Popen, timeout: float = 10.0):
+    """Stop a function started by :func:`start_function`.
+
+    :param proc: Process running the function.
+    :param timeout: Seconds to wait for the function to exit before it is killed.
+    """
+    proc.terminate()
+    try:
+        proc.wait(timeout=timeout)
+    except TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def run_load(
+        port: int,
+        headers: Dict[str, str],
+        body: bytes,
+        concurrency: int = 1,
+        requests: Union[int, None] = None,
+        duration: Union[float, None] = None,
+        host: str = '127.0.0.1',
+) -> LoadResult:
+    """Send the same request to a function repeatedly from several connections at once.
+
+    Each connection sends its next request as soon as it has received the previous response, reconnecting if the
+    function closed the connection.
+
+    :param port: Port on which the function listens.
+    :param headers: HTTP headers of each request.
+    :param body: HTTP body of each request.
+    :param concurrency: Number of connections sending requests at once.
+    :param requests: Total number of requests to send. Either this or `duration` must be given.
+    :param duration: Seconds for which to send requests.
+    :param host: Host on which the function listens.
+    :return: :class:`LoadResult` of the requests sent.
+    :raise ValueError: Neither `requests` nor `duration` was given.
+    """
+    if requests is None and duration is None:
+        raise ValueError('either requests or duration is required')
+
+    started = time.perf_counter()
+    budget = _RequestBudget(requests, started + duration if duration is not None else None)
+    results = [LoadResult() for _ in range(concurrency)]
+    threads = [
+        threading.Thread(target=_send_requests, args=(host, port, headers, body, budget, r), daemon=True)
+        for r in results
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    total = LoadResult(elapsed=time.perf_counter() - started)
+    for r in results:
+        total.latencies.extend(r.latencies)
+        total.failures += r.failures
+        for code, n in r.statuses.items():
+            total.statuses[code] = total.statuses.get(code, 0) + n
+    return total
+
+
+class _RequestBudget:
+    """Hands out turns to send a request until the number of requests, or the time, allowed runs out."""
+
+    def __init__(self, requests: Union[int, None], deadline: Union[float, None]):
+        self._lock = threading.Lock()
+        self._remaining = requests
+        self._deadline = deadline
+
+    def take(self) -> bool:
+        """Take a turn to send a request, or return False if none are left."""
+        if self._deadline is not None and time.perf_counter() >= self._deadline:
+            return False
+        if self._remaining is None:
+            return True
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            return True
+
+
+def _send_requests(
+        host: str,
+        port: int,
+        headers: Dict[str, str],
+        body: bytes,
+        budget: _RequestBudget,
+        result: LoadResult,
+):
+    conn = HTTPConnection(host, port, timeout=30)
+    try:
+        while budget.take():
+            t0 = time.perf_counter()
+            try:
+                conn.request('POST', '/', body=body, headers=headers)
+                resp = conn.getresponse()
+                resp.read()
+            except (OSError, HTTPException):
+                # Such as the function closing the connection without answering, or answering with garbage.
+                # The connection is reopened by the next request.
+                conn.close()
+                result.failures += 1
+                continue
+            result.latencies.append(time.perf_counter() - t0)
+            result.statuses[resp.status] = result.statuses.get(resp.status, 0) + 1
+    finally:
+        conn.close()
+
+
+def per_call_usec(f: Callable[[], Any], number: int = 20000, repeat: int = 5) -> float:
+    """Time a function, taking the best of several runs to discount interference from the rest of the machine.
+
+    :param f: Function to time.
+    :param number: Number of calls per run.
+    :param repeat: Number of runs.
+    :return: Time per call, in microseconds.
+    """
+    return min(Timer(f).repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def realistic_request() -> dict:
+    """Request payload resembling one sent by the Foundry gateway."""
+    return {
+        'access_token': 'x' * 64,
+        'body': {'ids': [f'{i:032x}' for i in range(20)], 'filter': "platform_name:'Windows'", 'limit': 100},
+        'context': {'cid': 'c' * 32},
+        'fn_id': 'd31cd12d3e29422484a0d1ba0ac60e79',
+        'fn_version': 3,
+        'method': 'POST',
+        'params': {
+            'header': {
+                'accept': ['application/json'],
+                'content-type': ['application/json'],
+                'user-agent': ['foundry-gateway/1.0'],
+                'x-cs-executionid': ['e' * 32],
+                'x-cs-origin': ['workflow'],
+                'x-cs-traceid': ['t' * 32],
+            },
+            'query': {'offset': ['0'], 'sort': ['hostname.asc']},
+        },
+        'trace_id': 't' * 32,
+        'url': '/hosts-query',
+    }
+
+
+def realistic_response() -> Response:
+    """Response resembling one returned by a handler querying the Falcon APIs."""
+    return Response(
+        body={'resources': [{'device_id': f'{i:032x}', 'hostname': f'host-{i}'} for i in range(20)]},
+        code=200,
+        header={'X-Cs-Traceid': ['t' * 32]},
+    )
+
+
+def header_names(count: int = 50) -> List[str]:
+    """Lower case header names, such as arrive from the Foundry gateway, including those the FDK looks for."""
+    names = ['accept', 'content-type', 'user-agent', 'x-cs-executionid', 'x-cs-origin', 'x-cs-traceid']
+    return [f'x-custom-header-{i}' for i in range(max(0, count - len(names)))] + names
+
+
+def micro_benchmarks() -> Dict[str, Callable[[], Any]]:
+    """Functions exercising the FDK's per-request work, by name."""
+    router = Router({})
+    router.register(Route(method='POST', path='/hosts-query', func=lambda req, config, logger: Response(code=200)))
+    req = Request(method='POST', url='/hosts-query')
+    payload = realistic_request()
+    resp = realistic_response()
+    names = header_names()
+
+    return {
+        'Router.route': lambda: router.route(req),
+        'dict_to_request': lambda: dict_to_request(payload),
+        'response_to_dict': lambda: response_to_dict(resp),
+        'canonize_header x50': lambda: [canonize_header(name) for name in names],
+    }
+
+
+def run_micro(number: int = 20000, repeat: int = 5) -> Dict[str, float]:
+    """Run the micro benchmarks.
+
+    :param number: Number of calls per run.
+    :param repeat: Number of runs, of which the fastest is taken.
+    :return: Time per call of each benchmark, in microseconds.
+    """
+    return {name: per_call_usec(f, number=number, repeat=repeat) for name, f in micro_benchmarks().items()}
+
+
+def _env_var(value: str) -> Tuple[str, str]:
+    name, sep, v = value.partition('=')
+    if sep == '' or name == '':
+        raise argparse.ArgumentTypeError(f'must be given as NAME=VALUE: {value}')
+    return name, v
+
+
+def _new_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='python -m crowdstrike.foundry.function.bench',
+        description='Measure the throughput and latency of a function, or of the FDK itself.',
+    )
+    parser.add_argument('--json', action='store_true', help='Write results as JSON, for comparison between runs.')
+    suites = parser.add_subparsers(dest='suite', required=True)
+
+    load = suites.add_parser('load', help='Start a function and drive it with HTTP requests.')
+    load.add_argument('main', help="Path to the function's main.py.")
+    load.add_argument('--runner', choices=[RUNNER_HTTP, RUNNER_ASYNC], default=RUNNER_HTTP,
+                      help='Runner with which to serve the function. Defaults to http.')
+    load.add_argument('--env', type=_env_var, action='append', default=[], metavar='NAME=VALUE',
+                      help='Environment variable for the function, such as CS_FN_HTTP_CONCURRENCY=pool.')
+    load.add_argument('--concurrency', type=int, default=1, help='Connections sending requests at once.')
+    load.add_argument('--requests', type=int, default=None, help='Total requests to send. Defaults to 1000.')
+    load.add_argument('--duration', type=float, default=None, help='Seconds for which to send requests.')
+    load.add_argument('--warmup', type=int, default=50, help='Requests sent before measuring. Defaults to 50.')
+    load.add_argument('--profile', choices=[PROFILE_JSON, PROFILE_MULTIPART, PROFILE_HEADERS], default=PROFILE_JSON,
+                      help='Payload of each request. Defaults to json.')
+    load.add_argument('--method', default='POST', help='Method of the request made of the function.')
+    load.add_argument('--path', default='/', help='Path of the request made of the function.')
+    load.add_argument('--body-size', type=int, default=1024, help='Approximate request body size in bytes.')
+    load.add_argument('--file-size', type=int, default=1024 * 1024,
+                      help='Size in bytes of the file uploaded by the multipart profile.')
+    load.add_argument('--header-count', type=int, default=50, help='Headers sent by the headers profile.')
+
+    micro = suites.add_parser('micro', help="Time the FDK's per-request work.")
+    micro.add_argument('--number', type=int, default=20000, help='Calls per run. Defaults to 20000.')
+    micro.add_argument('--repeat', type=int, default=5, help='Runs, of which the fastest is taken. Defaults to 5.')
+    return parser
+
+
+def _run_load_suite(args) -> Dict[str, Any]:
+    headers, body = build_payload(
+        args.profile, method=args.method, path=args.path,
+        body_size=args.body_size, file_size=args.file_size, header_count=args.header_count,
+    )
+    requests = args.requests
+    if requests is None and args.duration is None:
+        requests = 1000
+
+    proc, port = start_function(args.main, runner=args.runner, env=dict(args.env))
+    try:
+        wait_until_listening(proc, port)
+        if args.warmup > 0:
+            run_load(port, headers, body, concurrency=args.concurrency, requests=args.warmup)
+        result = run_load(port, headers, body, concurrency=args.concurrency, requests=requests, duration=args.duration)
+    finally:
+        stop_function(proc)
+
+    summary = {'runner': args.runner, 'profile': args.profile, 'concurrency': args.concurrency}
+    summary.update(result.summary())
+    return summary
+
+
+def main(argv: Union[List[str], None] = None) -> int:
+    """Run a benchmark suite from the command line.
+
+    :param argv: Command line arguments. Defaults to those of the process.
+    :return: Exit status.
+    """
+    parser = _new_parser()
+    args = parser.parse_args(argv)
+
+    if args.suite == 'load':
+        summary = _run_load_suite(args)
+        if args.json:
+            print(json.dumps(summary))
+        else:
+            print(
+                f"{summary['requests']} requests ({summary['errors']} errors) in {summary['elapsed_s']}s: "
+                f"{summary['rps']} requests/s; latency p50 {summary['p50_ms']}ms, p95 {summary['p95_ms']}ms, "
+                f"p99 {summary['p99_ms']}ms, max {summary['max_ms']}ms"
+            )
+        return 0 if summary['errors'] == 0 else 1
+
+    results = run_micro(number=args.number, repeat=args.repeat)
+    if args.json:
+        print(json.dumps({name: round(usec, 3) for name, usec in results.items()}))
+    else:
+        for name, usec in results.items():
+            print(f'{name}: {usec:.2f}us')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
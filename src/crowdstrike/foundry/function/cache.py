@@ -0,0 +1,141 @@
+"""Response caching for CrowdStrike Foundry Function FDK."""
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
+from crowdstrike.foundry.function.keys import RequestKey
+from crowdstrike.foundry.function.mapping import response_to_dict
+from crowdstrike.foundry.function.model import APIError, Request, Response
+
+
+@dataclass
+class CachePolicy:
+    """Defines how the responses of a route are cached.
+
+    The cache key is built from the fields named in `key`, see :class:`RequestKey`. The access token, and anything
+    else identifying the caller, is not part of the key, so a response cached for one caller is served to every other.
+    """
+
+    # Seconds for which a response is served from the cache.
+    ttl: float = field(default=60.0)
+    # Number of responses held, beyond which the least recently used is evicted.
+    max_entries: int = field(default=1024)
+    # Request fields from which the cache key is built.
+    key: Sequence[str] = field(default=())
+
+
+class ResponseCache:
+    """Holds the responses of one route, serialized, for the duration of a :class:`CachePolicy`.
+
+    Only successful (2xx) responses without errors are cached, and requests carrying uploaded files are never served
+    from the cache. Responses are held encoded, so a cached response cannot be changed by whoever received it, and
+    every hit is given a response of its own.
+    """
+
+    def __init__(
+            self,
+            policy: CachePolicy,
+            codec: Union[JSONCodec, None] = None,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        """Initialize the cache.
+
+        :param policy: :class:`CachePolicy` governing what is cached, and for how long.
+        :param codec: :class:`JSONCodec` with which responses are encoded. Defaults to :func:`get_codec`.
+        :param clock: Source of the current time, in seconds.
+        :raise ValueError: Invalid policy.
+        """
+        if policy.ttl <= 0:
+            raise ValueError(f'cache ttl must be positive: {policy.ttl}')
+        if policy.max_entries <= 0:
+            raise ValueError(f'cache max_entries must be positive: {policy.max_entries}')
+        self.policy = policy
+        self._codec = codec if codec is not None else get_codec()
+        self._clock = clock
+        self._key = RequestKey(policy.key, self._codec)
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[bytes, Tuple[float, bytes]]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, req: Request) -> Union[bytes, None]:
+        """Build the cache key of a request.
+
+        :param req: :class:`Request` being handled.
+        :return: Key of the request, or None if the request must not be served from the cache.
+        """
+        return self._key.build(req)
+
+    def get(self, key: Union[bytes, None]) -> Union[Response, None]:
+        """Fetch the response cached under a key.
+
+        :param key: Key of the request, from :meth:`key`.
+        :return: A copy of the cached :class:`Response`, or None if nothing is cached under the key.
+        """
+        if key is None:
+            return None
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return _payload_to_response(self._codec.loads(entry[1]))
+
+    def put(self, key: Union[bytes, None], resp: Any) -> bool:
+        """Cache the response to a request, if it is cacheable.
+
+        :param key: Key of the request, from :meth:`key`.
+        :param resp: Response returned by the handler.
+        :return: True if the response was cached.
+        """
+        if key is None or not isinstance(resp, Response) or resp.errors or not 200 <= resp.code < 300:
+            return False
+        try:
+            payload = self._codec.dumps(response_to_dict(resp))
+        except (TypeError, ValueError):
+            return False
+        expires = self._clock() + self.policy.ttl
+        with self._lock:
+            self._entries[key] = (expires, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.policy.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def clear(self):
+        """Discard every cached response."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the cache.
+
+        :return: Number of `hits`, `misses` and `evictions` so far, and the number of responses held (`entries`).
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+            }
+
+
+def _payload_to_response(d: dict) -> Response:
+    errors: List[APIError] = [APIError(code=e.get('code', 0), message=e.get('message', '')) for e in d.get('errors', [])]
+    return Response(
+        body=d.get('body', {}),
+        code=d.get('code', 0),
+        errors=errors,
+        header=d.get('header', {}),
+    )
@@ -0,0 +1,171 @@
+"""Request coalescing for CrowdStrike Foundry Function FDK."""
+import asyncio
+import copy
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Sequence, Union
+from crowdstrike.foundry.function.keys import RequestKey
+from crowdstrike.foundry.function.model import Request
+
+
+@dataclass
+class CoalescePolicy:
+    """Defines which concurrent requests to a route share a single invocation of its handler.
+
+    Requests are coalesced when their keys, built from the fields named in `key`, are equal. See :class:`RequestKey`.
+    """
+
+    # Request fields from which the key is built.
+    key: Sequence[str] = field(default=())
+
+
+class _Call:
+    __slots__ = ('done', 'waiters', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error: Union[BaseException, None] = None
+
+
+class SingleFlight:
+    """Lets concurrent requests with the same key wait on one invocation of the handler and share its result.
+
+    The first request with a given key invokes the handler, while those arriving before it completes wait for it
+    instead. Each waiting request receives its own copy of the :class:`Response`, or the exception the handler raised.
+    Requests arriving once the handler has completed invoke it anew. Requests carrying uploaded files are never
+    coalesced. Should a coroutine invocation be cancelled, such as by its request timing out, the requests waiting on
+    it are not cancelled along with it, but share a new invocation instead.
+
+    Synchronous and coroutine handlers are coalesced separately: synchronous callers wait on one another across
+    threads, and coroutine callers on one another within the event loop.
+    """
+
+    def __init__(self, policy: CoalescePolicy):
+        """Initialize the single flight.
+
+        :param policy: :class:`CoalescePolicy` governing which requests are coalesced.
+        :raise ValueError: Invalid policy.
+        """
+        self.policy = policy
+        self._key = RequestKey(policy.key)
+        self._lock = threading.Lock()
+        self._calls: Dict[bytes, _Call] = {}
+        self._futures: Dict[bytes, asyncio.Future] = {}
+        self._future_waiters: Dict[bytes, int] = {}
+        self.executions = 0
+        self.shared = 0
+
+    def key(self, req: Request) -> Union[bytes, None]:
+        """Build the coalescing key of a request.
+
+        :param req: :class:`Request` being handled.
+        :return: Key of the request, or None if the request must not be coalesced.
+        """
+        return self._key.build(req)
+
+    def do(self, key: Union[bytes, None], f: Callable[[], Any]) -> Any:
+        """Call a function, unless a call with the same key is in flight, in which case wait on its result instead.
+
+        :param key: Key of the request, from :meth:`key`. None always calls the function.
+        :param f: Function running the handler.
+        :return: Result of `f`, or a copy of the result of the call in flight.
+        """
+        if key is None:
+            return f()
+        with self._lock:
+            call = self._calls.get(key, None)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+            else:
+                call.waiters += 1
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        result = None
+        try:
+            result = f()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # No request can join once the call is removed, so every waiter is counted by then.
+            with self._lock:
+                del self._calls[key]
+                waiters = call.waiters
+            # The caller's result may be changed once returned, so waiters copy a snapshot of their own.
+            if call.error is None and waiters > 0:
+                call.result = copy.deepcopy(result)
+            call.done.set()
+        return result
+
+    async def do_async(self, key: Union[bytes, None], f: Callable[[], Awaitable[Any]]) -> Any:
+        """Asynchronous counterpart of :meth:`do`, for coroutine handlers awaited on an event loop.
+
+        :param key: Key of the request, from :meth:`key`. None always awaits the function.
+        :param f: Coroutine function running the handler.
+        :return: Result of `f`, or a copy of the result of the call in flight.
+        """
+        if key is None:
+            return await f()
+        future = self._futures.get(key, None)
+        while future is not None:
+            self._future_waiters[key] += 1
+            try:
+                # Shielded, so a waiter being cancelled leaves the call in flight for the others.
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled() or _cancelling():
+                    raise
+                # The call in flight was cancelled, such as by its own request's timeout, which is no reason to fail
+                # this request as well. Take another turn, leading a new call if no other waiter has yet.
+                future = self._futures.get(key, None)
+                continue
+            with self._lock:
+                self.shared += 1
+            return copy.deepcopy(result)
+
+        future = asyncio.get_running_loop().create_future()
+        self._futures[key] = future
+        self._future_waiters[key] = 0
+        with self._lock:
+            self.executions += 1
+        try:
+            result = await f()
+        except BaseException as e:
+            if self._future_waiters[key] > 0 and not isinstance(e, asyncio.CancelledError):
+                future.set_exception(e)
+            else:
+                future.cancel()
+            raise
+        else:
+            future.set_result(copy.deepcopy(result) if self._future_waiters[key] > 0 else None)
+            return result
+        finally:
+            del self._futures[key]
+            del self._future_waiters[key]
+
+    def stats(self) -> Dict[str, int]:
+        """Counters of the single flight.
+
+        :return: Number of handler invocations (`executions`), and of requests which shared the result of another
+        (`shared`).
+        """
+        with self._lock:
+            return {'executions': self.executions, 'shared': self.shared}
+
+
+def _cancelling() -> bool:
+    # Whether the current task itself is being cancelled. Only known from Python 3.11, before which it is assumed not.
+    task = asyncio.current_task()
+    cancelling = getattr(task, 'cancelling', None)
+    return cancelling is not None and cancelling() > 0
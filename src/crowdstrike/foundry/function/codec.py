@@ -0,0 +1,129 @@
+"""JSON codecs for CrowdStrike Foundry Function FDK."""
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Union
+
+CODEC_AUTO = 'auto'
+CODEC_JSON = 'json'
+CODEC_ORJSON = 'orjson'
+
+
+class JSONCodec(ABC):
+    """Base class for JSON codecs, which decode from and encode to bytes."""
+
+    name = ''
+
+    @abstractmethod
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Decode a JSON document.
+
+        :param data: UTF-8 encoded JSON document, or the document as a string.
+        :return: Decoded value.
+        """
+        pass
+
+    @abstractmethod
+    def dumps(self, value: Any) -> bytes:
+        """Encode a value as a JSON document.
+
+        :param value: Value to encode.
+        :return: UTF-8 encoded JSON document.
+        """
+        pass
+
+
+class StdlibJSONCodec(JSONCodec):
+    """JSON codec backed by the standard library's :mod:`json` module."""
+
+    name = CODEC_JSON
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Decode a JSON document.
+
+        :param data: UTF-8 encoded JSON document, or the document as a string.
+        :return: Decoded value.
+        """
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        """Encode a value as a JSON document.
+
+        :param value: Value to encode.
+        :return: UTF-8 encoded JSON document.
+        """
+        return json.dumps(value).encode('utf-8')
+
+
+class OrjsonCodec(JSONCodec):
+    """JSON codec backed by `orjson`, which must be installed separately.
+
+    Output is compact, without the spaces the standard library places between items.
+    Values `orjson` cannot encode, such as integers wider than 64 bits, are encoded by the standard library instead.
+    """
+
+    name = CODEC_ORJSON
+
+    def __init__(self):
+        """Initialize the codec."""
+        import orjson
+        self._orjson = orjson
+        self._fallback = StdlibJSONCodec()
+
+    def loads(self, data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """Decode a JSON document.
+
+        :param data: UTF-8 encoded JSON document, or the document as a string.
+        :return: Decoded value.
+        """
+        return self._orjson.loads(data)
+
+    def dumps(self, value: Any) -> bytes:
+        """Encode a value as a JSON document.
+
+        :param value: Value to encode.
+        :return: UTF-8 encoded JSON document.
+        """
+        try:
+            return self._orjson.dumps(value, option=self._orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return self._fallback.dumps(value)
+
+
+_codecs: Dict[str, JSONCodec] = {}
+
+
+def get_codec(name: Union[str, None] = None) -> JSONCodec:
+    """Fetch a :class:`JSONCodec` by name.
+
+    :param name: `json`, `orjson`, or `auto` to use `orjson` if it is installed and `json` otherwise.
+    Defaults to the `CS_FN_JSON_CODEC` environment variable, or `json`, so that installing `orjson` alone does not
+    change the bytes a function writes.
+    :return: Shared :class:`JSONCodec` instance.
+    :raise ValueError: Unknown codec name.
+    :raise ImportError: `orjson` was requested but is not installed.
+    """
+    if name is None:
+        name = os.environ.get('CS_FN_JSON_CODEC', CODEC_JSON)
+    name = name.strip().lower()
+
+    codec = _codecs.get(name, None)
+    if codec is None:
+        codec = _new_codec(name)
+        _codecs[name] = codec
+    return codec
+
+
+def _new_codec(name: str) -> JSONCodec:
+    if name == CODEC_JSON:
+        return StdlibJSONCodec()
+    if name == CODEC_ORJSON:
+        return OrjsonCodec()
+    if name == CODEC_AUTO:
+        try:
+            return OrjsonCodec()
+        except ImportError:
+            return StdlibJSONCodec()
+    raise ValueError(f'unsupported JSON codec: {name}')
@@ -1,15 +1,21 @@
 """File system config loader for CrowdStrike Foundry Functions FDK."""
-import json
 import os
+from typing import Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
 from crowdstrike.foundry.function.config_loader import ConfigLoaderBase
 
 
 class FileSystemConfigLoader(ConfigLoaderBase):
     """Loads configuration from the local filesystem."""
 
-    def __init__(self):
-        """Initialize the file system config loader."""
+    def __init__(self, codec: Union[JSONCodec, None] = None):
+        """Initialize the file system config loader.
+
+        :param codec: :class:`JSONCodec` with which to decode the configuration.
+        Defaults to the codec named by `CS_FN_JSON_CODEC`, see :func:`get_codec`.
+        """
         ConfigLoaderBase.__init__(self)
+        self._codec = codec if codec is not None else get_codec()
 
     def load(self):
         """Load the configuration located at the path specified in the `CS_FN_CONFIG_PATH` environment variable.
@@ -26,7 +32,5 @@ class FileSystemConfigLoader(ConfigLoaderBase):
         if not os.path.exists(file_path):
             raise FileNotFoundError(file_path)
 
-        with open(file_path) as fp:
-            contents = ' '.join(fp.readlines())
-
-        return json.loads(contents)
+        with open(file_path, 'rb') as fp:
+            return self._codec.loads(fp.read())
@@ -0,0 +1,87 @@
+"""Request deadlines for CrowdStrike Foundry Function FDK."""
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Union
+from crowdstrike.foundry.function.mapping import canonize_header
+from crowdstrike.foundry.function.model import Request
+
+
+@dataclass
+class TimeoutOptions:
+    """Defines how long handlers may run."""
+
+    # Seconds a handler may run for, unless its route sets its own timeout. 0 for no limit.
+    timeout: float = field(default=0.0)
+    # Request header giving the milliseconds the caller is prepared to wait, shortening the timeout. Empty to ignore
+    # headers.
+    header: str = field(default='X-Cs-Fn-Deadline-Ms')
+    # Synchronous handlers which may run under a timeout at once, including those which overran and were left behind,
+    # beyond which further requests are turned away.
+    max_running: int = field(default=64)
+
+    @staticmethod
+    def from_env() -> 'TimeoutOptions':
+        """Read the options from the environment.
+
+        :return: Options given by `CS_FN_HANDLER_TIMEOUT`, `CS_FN_DEADLINE_HEADER` and `CS_FN_HANDLER_MAX_RUNNING`,
+        with defaults for any not provided.
+        """
+        defaults = TimeoutOptions()
+        return TimeoutOptions(
+            timeout=float(os.environ.get('CS_FN_HANDLER_TIMEOUT', defaults.timeout)),
+            header=os.environ.get('CS_FN_DEADLINE_HEADER', defaults.header).strip(),
+            max_running=int(os.environ.get('CS_FN_HANDLER_MAX_RUNNING', defaults.max_running)),
+        )
+
+
+class Deadlines:
+    """Sets the deadline of each request, from the timeout of its route or the budget given by the caller."""
+
+    def __init__(self, options: Union[TimeoutOptions, None] = None):
+        """Initialize the deadlines.
+
+        :param options: :class:`TimeoutOptions` governing how long handlers may run.
+        Defaults to :meth:`TimeoutOptions.from_env`.
+        """
+        self.options = options if options is not None else TimeoutOptions.from_env()
+        if self.options.max_running < 1:
+            raise ValueError(f'max_running must be at least 1, got {self.options.max_running}')
+        self._header = canonize_header(self.options.header) if self.options.header != '' else ''
+
+    def start(self, req: Request, route_timeout: Union[float, None] = None) -> Union[float, None]:
+        """Set the deadline of a request about to be handled.
+
+        The shorter of the timeout and the budget given by the request's header applies. The header only ever
+        shortens a timeout, so that callers cannot place a deadline on handlers which have none. Budgets which are not
+        a positive number of milliseconds are ignored.
+
+        :param req: :class:`Request` about to be handled, whose :attr:`Request.deadline` is set.
+        :param route_timeout: Timeout of the request's route, in seconds, in place of the global timeout.
+        0 for no limit, or None to apply the global timeout.
+        :return: Seconds the handler may run for, or None if there is no limit.
+        """
+        timeout = route_timeout if route_timeout is not None else self.options.timeout
+        if timeout <= 0:
+            req.deadline = 0.0
+            return None
+        budget = self._budget(req)
+        if budget is not None and budget < timeout:
+            timeout = budget
+        req.deadline = time.monotonic() + timeout
+        return timeout
+
+    def _budget(self, req: Request) -> Union[float, None]:
+        if self._header == '' or req.params is None:
+            return None
+        values = req.params.header.get(self._header, None)
+        if not values:
+            return None
+        try:
+            budget = float(values[0]) / 1000
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(budget) or budget <= 0:
+            return None
+        return budget
@@ -0,0 +1,84 @@
+"""Request keys for CrowdStrike Foundry Function FDK."""
+from typing import Any, Sequence, Tuple, Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
+from crowdstrike.foundry.function.mapping import canonize_header
+from crowdstrike.foundry.function.model import Request
+
+KEY_URL = 'url'
+KEY_PATH = 'path'
+KEY_QUERY = 'query'
+KEY_HEADER = 'header'
+KEY_BODY = 'body'
+
+
+class RequestKey:
+    """Builds a key identifying requests from selected fields, such that requests with equal fields have equal keys.
+
+    Each field is one of:
+
+    * `url`: the URL of the request.
+    * `path.<name>`: the value of a path parameter.
+    * `query.<name>`: the values of a query parameter.
+    * `header.<name>`: the values of a request header.
+    * `body.<name>`: a field of the request body, where `<name>` may descend into nested objects, e.g. `body.host.id`.
+
+    Without any fields, requests are keyed by their method, URL, query parameters and entire body, so that only
+    requests asking for the same thing share a key.
+    """
+
+    def __init__(self, fields: Sequence[str] = (), codec: Union[JSONCodec, None] = None):
+        """Initialize the key.
+
+        :param fields: Request fields from which the key is built.
+        :param codec: :class:`JSONCodec` with which field values are encoded. Defaults to :func:`get_codec`.
+        :raise ValueError: Unsupported field.
+        """
+        self._fields = [_parse_field(f) for f in fields]
+        self._codec = codec if codec is not None else get_codec()
+
+    def build(self, req: Request) -> Union[bytes, None]:
+        """Build the key of a request.
+
+        :param req: :class:`Request` being handled.
+        :return: Key of the request, or None if the request carries uploaded files or fields which cannot be encoded,
+        and so cannot be told apart from others.
+        """
+        if req.files:
+            return None
+        if not self._fields:
+            query = req.params.query if req.params is not None else {}
+            values = [req.method, req.url, sorted(query.items()), req.body]
+        else:
+            values = [_field_value(req, kind, name) for kind, name in self._fields]
+        try:
+            return self._codec.dumps(values)
+        except (TypeError, ValueError):
+            return None
+
+
+def _parse_field(spec: str) -> Tuple[str, str]:
+    kind, _, name = spec.strip().partition('.')
+    if kind == KEY_URL and name == '':
+        return kind, name
+    if kind in {KEY_PATH, KEY_QUERY, KEY_BODY} and name != '':
+        return kind, name
+    if kind == KEY_HEADER and name != '':
+        return kind, canonize_header(name)
+    raise ValueError(f'unsupported key field: {spec}')
+
+
+def _field_value(req: Request, kind: str, name: str) -> Any:
+    if kind == KEY_URL:
+        return req.url
+    if kind == KEY_PATH:
+        return req.path_params.get(name, None)
+    if kind == KEY_QUERY:
+        return req.params.query.get(name, None) if req.params is not None else None
+    if kind == KEY_HEADER:
+        return req.params.header.get(name, None) if req.params is not None else None
+    value = req.body
+    for part in name.split('.'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part, None)
+    return value
@@ -0,0 +1,243 @@
+"""Logging for CrowdStrike Foundry Function FDK."""
+import atexit
+import copy
+import os
+import threading
+import time
+from logging import Filter, Formatter, Handler, Logger, LogRecord, StreamHandler, getLogger
+from logging.handlers import QueueHandler, QueueListener
+from queue import Full, Queue
+from sys import stdout
+from typing import IO, Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
+from crowdstrike.foundry.function.context import ctx_request
+
+LOGGER_NAME = 'cs-logger'
+
+FORMAT_TEXT = 'text'
+FORMAT_JSON = 'json'
+
+_FORMAT = '%(asctime)s [%(levelname)s]  %(filename)s %(funcName)s:%(lineno)d  ->  %(message)s'
+
+_lock = threading.Lock()
+# The handler attached to the logger, and the listener draining its queue when records are written off-thread.
+_handler: Union[Handler, None] = None
+_listener: Union['_Listener', None] = None
+
+
+class RequestContextFilter(Filter):
+    """Adds the `trace_id`, `fn_id`, `fn_version` and `route` of the request being handled to each record.
+
+    Records logged outside of a request are given empty values.
+    """
+
+    def filter(self, record: LogRecord) -> bool:
+        """Add the request's fields to the record.
+
+        :param record: :class:`LogRecord` being logged.
+        :return: True, as no records are filtered out.
+        """
+        req = ctx_request.get()
+        if req is None:
+            record.trace_id = ''
+            record.fn_id = ''
+            record.fn_version = 0
+            record.route = ''
+        else:
+            record.trace_id = req.trace_id
+            record.fn_id = req.fn_id
+            record.fn_version = req.fn_version
+            record.route = req.route
+        return True
+
+
+class JSONFormatter(Formatter):
+    """Formats each record as a single line JSON object, including the fields of :class:`RequestContextFilter`.
+
+    Messages are only formatted from their arguments for records at enabled levels, so those logged at disabled
+    levels, such as `logger.debug('payload: %s', payload)`, cost next to nothing.
+    """
+
+    def __init__(self, codec: Union[JSONCodec, None] = None):
+        """Initialize the formatter.
+
+        :param codec: :class:`JSONCodec` with which to encode records. Defaults to :func:`get_codec`.
+        """
+        Formatter.__init__(self)
+        self._codec = codec if codec is not None else get_codec()
+
+    def format(self, record: LogRecord) -> str:
+        """Format the record as JSON.
+
+        :param record: :class:`LogRecord` to format.
+        :return: JSON object, without a trailing newline.
+        """
+        d = {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f'.{int(record.msecs):03d}Z',
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'file': record.filename,
+            'func': record.funcName,
+            'line': record.lineno,
+        }
+        if hasattr(record, 'trace_id'):
+            d['trace_id'] = record.trace_id
+            d['fn_id'] = record.fn_id
+            d['fn_version'] = record.fn_version
+            d['route'] = record.route
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            d['exception'] = record.exc_text
+        if record.stack_info:
+            d['stack'] = record.stack_info
+        return self._codec.dumps(d).decode('utf-8')
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Queues records for a :class:`QueueListener`, dropping them rather than blocking once the queue is full."""
+
+    def __init__(self, queue: Queue):
+        QueueHandler.__init__(self, queue)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+        self._exception_formatter = Formatter()
+
+    def prepare(self, record: LogRecord) -> LogRecord:
+        # Resolve anything which cannot safely cross threads, but leave the formatting to the listener's handler.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+class _Listener(QueueListener):
+    """Writes out records queued by a :class:`_DroppingQueueHandler`."""
+
+    def enqueue_sentinel(self):
+        # Wait for room, as the queue may be full when the listener is stopped.
+        self.queue.put(self._sentinel)
+
+
+def setup_logger(
+        level: Union[str, int, None] = None,
+        queue_size: Union[int, None] = None,
+        formatter: Union[Formatter, None] = None,
+        stream: Union[IO[str], None] = None,
+        log_format: Union[str, None] = None,
+) -> Logger:
+    """Configure the logger provided to handlers, writing to standard output.
+
+    With a queue, records are written by a background thread, so handlers never wait on standard output. Once the
+    queue is full, further records are dropped and counted rather than held up, see :func:`dropped_records`.
+
+    Repeated calls configure the same logger, adjusting its level but never adding further handlers.
+
+    :param level: Level below which records are discarded. Defaults to `CS_FN_LOG_LEVEL` or `DEBUG`.
+    :param queue_size: Number of records which may await writing. 0 writes records synchronously.
+    Defaults to `CS_FN_LOG_QUEUE_SIZE` or 10000. Only applies to the first call.
+    :param formatter: :class:`Formatter` for records. Defaults to one for `log_format`. Only applies to the first call.
+    :param stream: Stream to which records are written. Defaults to standard output. Only applies to the first call.
+    :param log_format: `text` for the FDK's own format, or `json` for :class:`JSONFormatter`.
+    Defaults to `CS_FN_LOG_FORMAT` or `text`. Only applies to the first call.
+    :return: The configured :class:`Logger`.
+    :raise ValueError: Unsupported log format.
+    """
+    global _handler, _listener
+
+    if level is None:
+        level = os.environ.get('CS_FN_LOG_LEVEL', 'DEBUG').strip().upper()
+    logger = getLogger(LOGGER_NAME)
+    logger.setLevel(level)
+
+    with _lock:
+        if _handler is not None:
+            return logger
+
+        if queue_size is None:
+            queue_size = int(os.environ.get('CS_FN_LOG_QUEUE_SIZE', '10000'))
+        if formatter is None:
+            formatter = _new_formatter(log_format)
+        writer = StreamHandler(stream if stream is not None else stdout)
+        writer.setFormatter(formatter)
+
+        if queue_size <= 0:
+            _handler = writer
+        else:
+            _handler = _DroppingQueueHandler(Queue(maxsize=queue_size))
+            _listener = _Listener(_handler.queue, writer, respect_handler_level=True)
+            _listener.start()
+        # Applied as records are logged, while the request being handled is still known.
+        _handler.addFilter(RequestContextFilter())
+        logger.addHandler(_handler)
+        return logger
+
+
+def _new_formatter(log_format: Union[str, None]) -> Formatter:
+    if log_format is None:
+        log_format = os.environ.get('CS_FN_LOG_FORMAT', FORMAT_TEXT)
+    log_format = log_format.strip().lower()
+    if log_format == FORMAT_TEXT:
+        return Formatter(_FORMAT)
+    if log_format == FORMAT_JSON:
+        return JSONFormatter()
+    raise ValueError(f'unsupported log format: {log_format}')
+
+
+def dropped_records() -> int:
+    """Number of log records dropped so far because the queue was full."""
+    handler = _handler
+    return handler.dropped if isinstance(handler, _DroppingQueueHandler) else 0
+
+
+def flush_logs():
+    """Write out any queued records, waiting until they have been written.
+
+    Records logged afterwards are queued and written as usual.
+    """
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        _listener.start()
+
+
+def shutdown_logging():
+    """Write out any queued records and detach the FDK's handler from the logger."""
+    global _handler, _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        if _handler is not None:
+            getLogger(LOGGER_NAME).removeHandler(_handler)
+            _handler = None
+
+
+def _restart_after_fork():
+    # Only the forking thread survives in the child, so the listener must be started anew, on a queue of its own.
+    global _lock, _listener
+
+    _lock = threading.Lock()
+    if _listener is None:
+        return
+    _handler.queue = Queue(maxsize=_handler.queue.maxsize)
+    _listener = _Listener(_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(shutdown_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
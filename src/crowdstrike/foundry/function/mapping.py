@@ -2,7 +2,8 @@
 
 
 from dataclasses import dataclass, fields, is_dataclass
-from typing import Union
+from functools import lru_cache
+from typing import Any, Callable, Union
 from crowdstrike.foundry.function.model import Request, RequestParams, Response
 
 
@@ -12,22 +13,15 @@ def response_to_dict(r: Response) -> dict:
     :param r: :class:`Response` instance to convert.
     :return: Dictionary version of the provided instance.
     """
-    body = r.body
-    errors = []
-    header = {}
-
-    if r.errors is not None:
-        for e in r.errors:
-            errors.append({'code': e.code, 'message': e.message})
-    if r.header is not None:
-        header = r.header
-
     d = {'code': r.code}
+    body = r.body
     if body is not None:
         d['body'] = body
-    if len(errors) > 0:
-        d['errors'] = errors
-    if len(header) > 0:
+    errors = r.errors
+    if errors:
+        d['errors'] = [{'code': e.code, 'message': e.message} for e in errors]
+    header = r.header
+    if header:
         d['header'] = header
 
     return d
@@ -39,13 +33,10 @@ def dict_to_request(d: dict) -> Request:
     :param d: Dictionary instance to attempt to map.
     :return: :class:`Request` instance populated by the given dictionary.
     """
-    req = dict_to_dataclass(d, Request())
-    req.params = dict_to_dataclass(d.get('params', None), RequestParams())
-    if req.params.header is not None and len(req.params.header) > 0:
-        h = {}
-        for k, v in req.params.header.items():
-            h[canonize_header(k)] = v
-        req.params.header = h
+    req = compile_mapper(Request)(d, Request())
+    req.params = compile_mapper(RequestParams)(d.get('params', None), RequestParams())
+    if req.params.header:
+        req.params.header = {canonize_header(k): v for k, v in req.params.header.items()}
     return req
 
 
@@ -56,38 +47,60 @@ def dict_to_dataclass(d: Union[dict, None], dc) -> Union[None, dataclass]:
     :param dc: Dataclass to receive the values.
     :return: Provided dataclass object.
     """
-    if not is_dataclass(dc):
+    if not is_dataclass(dc) or isinstance(dc, type):
         raise TypeError(f'provided argument dc is of type {type(dc)} instead of dataclass')
-    if d is None:
-        return dc
+    return compile_mapper(type(dc))(d, dc)
+
+
+@lru_cache(maxsize=None)
+def compile_mapper(cls: type) -> Callable[[Union[dict, None], Any], Any]:
+    """Generate a function which maps the contents of a dictionary onto instances of the given dataclass.
 
-    for f in fields(dc):
+    The generated function behaves as :func:`dict_to_dataclass`, but with the dictionary key of each field
+    resolved up front rather than on every call. Mappers are cached per dataclass.
+
+    Fields whose metadata sets `mapped` to False, such as those the FDK fills in itself, are never taken from the
+    dictionary, so that callers cannot supply them.
+
+    :param cls: Dataclass type.
+    :return: Function taking the dictionary and the dataclass object to receive its values, returning the latter.
+    """
+    if not is_dataclass(cls) or not isinstance(cls, type):
+        raise TypeError(f'provided argument cls is {cls} instead of dataclass type')
+
+    lines = [
+        'def map_dict(d, dc):',
+        '    if d is None:',
+        '        return dc',
+    ]
+    for f in fields(cls):
+        if f.metadata.get('mapped', True) is False:
+            continue
         d_key = f.name
         if len(f.metadata) > 0:
             k = f.metadata.get('key', '')
             if k != '':
                 d_key = k
+        lines += [
+            f'    v = d.get({d_key!r}, None)',
+            '    if v is not None:',
+            f'        dc.{f.name} = v',
+        ]
+    lines.append('    return dc')
 
-        d_value = d.get(d_key, None)
-        if d_value is not None:
-            setattr(dc, f.name, d_value)
-
-    return dc
+    namespace = {}
+    exec('\n'.join(lines), namespace)
+    return namespace['map_dict']
 
 
+@lru_cache(maxsize=1024)
 def canonize_header(h: str) -> str:
     """Convert a header key into its canonical version.
 
+    Header keys come from a small vocabulary, so results are cached; keys which are already canonical
+    are returned from the cache as they are.
+
     :param h: Header key.
     :return: Canonized version.
     """
-    canon = ''
-    upper = True
-    for c in h:
-        if upper:
-            canon += c.upper()
-        else:
-            canon += c.lower()
-
-        upper = c == '-'
-    return canon
+    return '-'.join([part[:1].upper() + part[1:].lower() for part in h.split('-')])
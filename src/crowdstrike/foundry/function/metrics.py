@@ -0,0 +1,369 @@
+"""Request metrics for CrowdStrike Foundry Function FDK."""
+import os
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+from typing import Any, Dict, List, Sequence, Tuple, Union
+from crowdstrike.foundry.function.log import dropped_records
+from crowdstrike.foundry.function.model import Request
+
+PHASE_READ = 'read'
+PHASE_HANDLER = 'handler'
+PHASE_WRITE = 'write'
+PHASES = (PHASE_READ, PHASE_HANDLER, PHASE_WRITE)
+
+# Upper bounds, in seconds, of the latency histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Counts observations falling into each of a fixed set of buckets."""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Initialize the histogram.
+
+        :param buckets: Ascending upper bounds of the buckets. A final bucket without an upper bound is implied.
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Record an observation.
+
+        :param value: Observed value.
+        """
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """Number of observations at or below the upper bound of each bucket, ending with infinity.
+
+        :return: Pairs of upper bound and count.
+        """
+        result = []
+        total = 0
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+
+class _RouteMetrics:
+    __slots__ = ('requests', 'errors', 'phases')
+
+    def __init__(self, buckets: Sequence[float]):
+        self.requests = 0
+        self.errors: Dict[int, int] = {}
+        self.phases = {phase: Histogram(buckets) for phase in PHASES}
+
+
+class Metrics:
+    """Records the requests served by each route, and the time spent in each phase of serving them.
+
+    Routes are identified by method and by the path with which their handler was registered, such that all requests
+    matched by a path template count towards the template. Requests which matched no route are recorded with an empty
+    method and path. Requests are served in three phases:
+
+    * `read`: reading and decoding the request.
+    * `handler`: routing the request and running the handler.
+    * `write`: encoding and writing the response.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        """Initialize the metrics.
+
+        :param buckets: Upper bounds of the latency histogram buckets, in seconds.
+        """
+        self._buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], _RouteMetrics] = {}
+        self._caches: Dict[Tuple[str, str], Any] = {}
+        self._flights: Dict[Tuple[str, str], Any] = {}
+        self._admission: Any = None
+
+    def observe(
+            self,
+            method: str,
+            path: str,
+            code: int,
+            read: Union[float, None] = None,
+            handler: Union[float, None] = None,
+            write: Union[float, None] = None,
+    ):
+        """Record a request which has been served.
+
+        :param method: Method of the route which served the request, or empty if none matched.
+        :param path: Path of the route which served the request, or empty if none matched.
+        :param code: Status code of the response.
+        :param read: Seconds spent reading the request, if it got that far.
+        :param handler: Seconds spent routing the request and running the handler, if it got that far.
+        :param write: Seconds spent writing the response, if it got that far.
+        """
+        key = (method, path)
+        with self._lock:
+            m = self._routes.get(key, None)
+            if m is None:
+                m = _RouteMetrics(self._buckets)
+                self._routes[key] = m
+            m.requests += 1
+            if code >= 400:
+                m.errors[code] = m.errors.get(code, 0) + 1
+            if read is not None:
+                m.phases[PHASE_READ].observe(read)
+            if handler is not None:
+                m.phases[PHASE_HANDLER].observe(handler)
+            if write is not None:
+                m.phases[PHASE_WRITE].observe(write)
+
+    def observe_request(
+            self,
+            req: Union[Request, None],
+            code: int,
+            read: Union[float, None] = None,
+            handler: Union[float, None] = None,
+            write: Union[float, None] = None,
+    ):
+        """Record a request which has been served, against the route it was matched to.
+
+        :param req: :class:`Request` served, or None if it could not be read.
+        :param code: Status code of the response.
+        :param read: Seconds spent reading the request, if it got that far.
+        :param handler: Seconds spent routing the request and running the handler, if it got that far.
+        :param write: Seconds spent writing the response, if it got that far.
+        """
+        if req is None or req.route == '':
+            self.observe('', '', code, read, handler, write)
+        else:
+            self.observe(req.method.strip().upper(), req.route, code, read, handler, write)
+
+    def track_cache(self, method: str, path: str, cache: Any):
+        """Include the counters of a route's response cache in the metrics.
+
+        :param method: Method of the route.
+        :param path: Path of the route.
+        :param cache: :class:`ResponseCache` of the route.
+        """
+        with self._lock:
+            self._caches[(method, path)] = cache
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters of each route's response cache.
+
+        :return: For each route with a cache, keyed by method and path separated by a space, the counters given by
+        :meth:`ResponseCache.stats`.
+        """
+        with self._lock:
+            caches = dict(self._caches)
+        return {f'{method} {path}': cache.stats() for (method, path), cache in caches.items()}
+
+    def track_coalescing(self, method: str, path: str, flights: Any):
+        """Include the counters of a route's request coalescing in the metrics.
+
+        :param method: Method of the route.
+        :param path: Path of the route.
+        :param flights: :class:`SingleFlight` of the route.
+        """
+        with self._lock:
+            self._flights[(method, path)] = flights
+
+    def coalescing_stats(self) -> Dict[str, Dict[str, int]]:
+        """Counters of each route's request coalescing.
+
+        :return: For each route coalescing requests, keyed by method and path separated by a space, the counters given
+        by :meth:`SingleFlight.stats`.
+        """
+        with self._lock:
+            flights = dict(self._flights)
+        return {f'{method} {path}': f.stats() for (method, path), f in flights.items()}
+
+    def track_admission(self, admission: Any):
+        """Include the counters of the server's admission control in the metrics.
+
+        :param admission: :class:`AdmissionController` of the server.
+        """
+        with self._lock:
+            self._admission = admission
+
+    def admission_stats(self) -> Dict[str, int]:
+        """Counters of the server's admission control.
+
+        :return: Counters given by :meth:`AdmissionController.stats`, or none if requests are not subject to
+        admission control.
+        """
+        with self._lock:
+            admission = self._admission
+        return admission.stats() if admission is not None else {}
+
+    def reset(self):
+        """Discard everything recorded so far."""
+        with self._lock:
+            self._routes = {}
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Copy of everything recorded so far.
+
+        :return: For each route, keyed by method and path separated by a space, the number of `requests`, the number
+        of `errors` by status code, and for each phase in `phases` the `count` and total seconds (`sum`) of the requests
+        which reached it, along with the cumulative count of requests within each bucket (`buckets`).
+        """
+        with self._lock:
+            result = {}
+            for (method, path), m in self._routes.items():
+                result[f'{method} {path}'] = {
+                    'requests': m.requests,
+                    'errors': dict(m.errors),
+                    'phases': {
+                        phase: {'count': h.count, 'sum': h.sum, 'buckets': h.cumulative()}
+                        for phase, h in m.phases.items()
+                    },
+                }
+            return result
+
+    def render(self) -> str:
+        """Render everything recorded so far in the Prometheus text exposition format.
+
+        :return: Text exposition of the metrics.
+        """
+        requests = [
+            '# HELP cs_fn_requests_total Requests served, by route.',
+            '# TYPE cs_fn_requests_total counter',
+        ]
+        errors = [
+            '# HELP cs_fn_request_errors_total Requests answered with an error status, by route and status code.',
+            '# TYPE cs_fn_request_errors_total counter',
+        ]
+        phases = [
+            '# HELP cs_fn_request_phase_seconds Time spent in each phase of serving a request, by route.',
+            '# TYPE cs_fn_request_phase_seconds histogram',
+        ]
+        with self._lock:
+            for (method, path), m in sorted(self._routes.items()):
+                labels = f'method="{_escape(method)}",route="{_escape(path)}"'
+                requests.append(f'cs_fn_requests_total{{{labels}}} {m.requests}')
+                for code, n in sorted(m.errors.items()):
+                    errors.append(f'cs_fn_request_errors_total{{{labels},code="{code}"}} {n}')
+                for phase, h in m.phases.items():
+                    phase_labels = f'{labels},phase="{phase}"'
+                    for bound, n in h.cumulative():
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        phases.append(f'cs_fn_request_phase_seconds_bucket{{{phase_labels},le="{le}"}} {n}')
+                    phases.append(f'cs_fn_request_phase_seconds_sum{{{phase_labels}}} {h.sum!r}')
+                    phases.append(f'cs_fn_request_phase_seconds_count{{{phase_labels}}} {h.count}')
+        caches = [
+            '# HELP cs_fn_cache_requests_total Requests looked up in a response cache, by route and result.',
+            '# TYPE cs_fn_cache_requests_total counter',
+        ]
+        evictions = [
+            '# HELP cs_fn_cache_evictions_total Responses evicted from a full response cache, by route.',
+            '# TYPE cs_fn_cache_evictions_total counter',
+        ]
+        coalesced = [
+            '# HELP cs_fn_coalesced_requests_total Requests which shared the response of a concurrent identical request.',
+            '# TYPE cs_fn_coalesced_requests_total counter',
+        ]
+        with self._lock:
+            tracked = sorted(self._caches.items())
+            tracked_flights = sorted(self._flights.items())
+        for (method, path), cache in tracked:
+            labels = f'method="{_escape(method)}",route="{_escape(path)}"'
+            stats = cache.stats()
+            caches.append(f'cs_fn_cache_requests_total{{{labels},result="hit"}} {stats["hits"]}')
+            caches.append(f'cs_fn_cache_requests_total{{{labels},result="miss"}} {stats["misses"]}')
+            evictions.append(f'cs_fn_cache_evictions_total{{{labels}}} {stats["evictions"]}')
+        for (method, path), flights in tracked_flights:
+            labels = f'method="{_escape(method)}",route="{_escape(path)}"'
+            coalesced.append(f'cs_fn_coalesced_requests_total{{{labels}}} {flights.stats()["shared"]}')
+        admission = []
+        stats = self.admission_stats()
+        if stats:
+            admission = [
+                '# HELP cs_fn_admission_requests_total Requests subject to admission control, by result.',
+                '# TYPE cs_fn_admission_requests_total counter',
+            ] + [
+                f'cs_fn_admission_requests_total{{result="{result}"}} {stats[result]}'
+                for result in ('admitted', 'rejected', 'shed')
+            ] + [
+                '# HELP cs_fn_requests_active Requests being handled.',
+                '# TYPE cs_fn_requests_active gauge',
+                f'cs_fn_requests_active {stats["active"]}',
+                '# HELP cs_fn_requests_queued Requests waiting their turn to be handled.',
+                '# TYPE cs_fn_requests_queued gauge',
+                f'cs_fn_requests_queued {stats["queued"]}',
+            ]
+        logs = [
+            '# HELP cs_fn_log_records_dropped_total Log records dropped because too many were waiting to be written.',
+            '# TYPE cs_fn_log_records_dropped_total counter',
+            f'cs_fn_log_records_dropped_total {dropped_records()}',
+        ]
+        return '\n'.join(requests + errors + phases + caches + evictions + coalesced + admission + logs) + '\n'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def percentile(ordered: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of an ordered list of samples.
+
+    :param ordered: Samples in ascending order.
+    :param p: Percentile, from 0 to 100.
+    :return: Sample at the percentile, or 0 if there are none.
+    """
+    if len(ordered) == 0:
+        return 0.0
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[min(int(rank), len(ordered)) - 1]
+
+
+def metrics_port_from_env() -> Union[int, None]:
+    """Port on which to serve metrics, from `CS_FN_METRICS_PORT`.
+
+    :return: Port, or None if metrics are not to be served.
+    """
+    port = os.environ.get('CS_FN_METRICS_PORT', '').strip()
+    if port == '' or port == '0':
+        return None
+    return int(port)
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    metrics: Union[Metrics, None] = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        payload = self.metrics.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        # Scrapes are frequent and of no interest in the function's logs.
+        pass
+
+
+def start_metrics_server(metrics: Metrics, port: int, logger: Union[Logger, None] = None) -> ThreadingHTTPServer:
+    """Serve the given metrics in the Prometheus text format at `/metrics`, from a background thread.
+
+    :param metrics: :class:`Metrics` to serve.
+    :param port: Port on which to listen. 0 picks a free port.
+    :param logger: :class:`Logger` with which to report the port.
+    :return: The server, which may be stopped with `shutdown()`.
+    """
+    handler = type('MetricsRequestHandler', (_MetricsRequestHandler,), {'metrics': metrics})
+    server = ThreadingHTTPServer(('', port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name='cs-fn-metrics', daemon=True)
+    thread.start()
+    if logger is not None:
+        logger.info(f'serving metrics at port {server.server_address[1]}')
+    return server
@@ -0,0 +1,62 @@
+"""Middleware for CrowdStrike Foundry Function FDK."""
+from inspect import iscoroutinefunction
+from typing import Any, Awaitable, Callable, Iterable, Tuple, Union
+from crowdstrike.foundry.function.model import Request, Response
+
+# The hooks of one middleware: its `before` and `after` methods, or None where it does not override them.
+Hooks = Tuple[Union[Callable[[Request], Any], None], Union[Callable[[Request, Any], Any], None]]
+
+
+class Middleware:
+    """Base class of middleware, whose hooks run around the handlers of the routes to which it applies.
+
+    Subclasses override either hook or both, as plain or coroutine (`async def`) methods. Hooks which are not
+    overridden cost nothing.
+
+    For each request, the `before` hooks run in the order in which the middleware was given, global middleware first,
+    followed by the handler and then the `after` hooks in reverse order. A `before` hook returning a :class:`Response`
+    answers the request without running the handler or any later middleware, though the `after` hooks of the
+    middleware which already ran, including its own, still run. If the handler raises an exception, no `after` hooks
+    run.
+
+    `before` runs ahead of the route's response cache and request coalescing, so it may turn requests away before they
+    are answered from the cache.
+    """
+
+    def before(self, req: Request) -> Union[Response, None, Awaitable[Union[Response, None]]]:
+        """Called before the handler.
+
+        :param req: :class:`Request` being handled, which may be changed.
+        :return: :class:`Response` with which to answer the request in place of the handler, or None to carry on.
+        """
+        return None
+
+    def after(self, req: Request, resp: Any) -> Union[Response, None, Awaitable[Union[Response, None]]]:
+        """Called after the handler.
+
+        :param req: :class:`Request` being handled.
+        :param resp: :class:`Response` returned by the handler or by a `before` hook.
+        :return: :class:`Response` with which to answer the request, or None to keep `resp`, which may be changed.
+        """
+        return None
+
+
+def compose(middleware: Iterable[Middleware]) -> Tuple[Tuple[Hooks, ...], bool]:
+    """Resolve the hooks of a chain of middleware, once, ahead of serving any requests.
+
+    :param middleware: :class:`Middleware` instances, outermost first.
+    :return: Hooks of each middleware overriding at least one, and whether any hook is a coroutine function.
+    :raise TypeError: An object which is not a :class:`Middleware`.
+    """
+    hooks = []
+    is_async = False
+    for m in middleware:
+        if not isinstance(m, Middleware):
+            raise TypeError(f'middleware must be an instance of {Middleware.__name__}, got {type(m)}')
+        before = m.before if type(m).before is not Middleware.before else None
+        after = m.after if type(m).after is not Middleware.after else None
+        if before is None and after is None:
+            continue
+        hooks.append((before, after))
+        is_async = is_async or iscoroutinefunction(before) or iscoroutinefunction(after)
+    return tuple(hooks), is_async
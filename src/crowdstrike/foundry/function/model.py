@@ -1,6 +1,7 @@
 """Data models for CrowdStrike Foundry Function FDK."""
+import time
 from dataclasses import dataclass, field
-from typing import Any, Dict, List
+from typing import IO, Any, Dict, List, Union
 
 
 @dataclass
@@ -21,19 +22,39 @@ class APIError:
 
 @dataclass
 class Request:
-    """Defines the data model for request provided to the function handler."""
+    """Defines the data model for request provided to the function handler.
+
+    Fields whose metadata marks them as not mapped are filled in by the FDK, and never taken from the request payload.
+    """
 
     access_token: str = field(default='')
     body: Dict[str, Any] = field(default_factory=lambda: {})
     context: Dict[str, Any] = field(default_factory=lambda: {})
-    files: Dict[str, bytes] = field(default_factory=lambda: {})
+    # Time, on the `time.monotonic()` clock, by which the handler is to respond; 0 if there is none.
+    deadline: float = field(default=0.0, metadata={'mapped': False})
+    # Uploaded files by name; file objects rather than bytes when files are streamed.
+    files: Dict[str, Union[bytes, IO[bytes]]] = field(default_factory=lambda: {})
     fn_id: str = field(default='')
     fn_version: int = field(default=0)
     method: str = field(default='')
     params: RequestParams = field(default_factory=lambda: RequestParams())
+    path_params: Dict[str, Any] = field(default_factory=lambda: {}, metadata={'mapped': False})
+    # The request payload exactly as received, where available; a read-only view to avoid copying large payloads.
+    raw_body: Union[bytes, memoryview] = field(default=b'', repr=False, metadata={'mapped': False})
+    # Path with which the handler serving this request was registered, set once the request is routed.
+    route: str = field(default='', metadata={'mapped': False})
     trace_id: str = field(default='')
     url: str = field(default='')
 
+    def time_remaining(self) -> Union[float, None]:
+        """Seconds left until the request's deadline, for budgeting calls made while handling it.
+
+        :return: Seconds remaining, which may be negative once the deadline has passed, or None if there is no deadline.
+        """
+        if self.deadline == 0:
+            return None
+        return self.deadline - time.monotonic()
+
 
 @dataclass
 class Response:
@@ -0,0 +1,257 @@
+"""Multipart request parsing for CrowdStrike Foundry Function FDK."""
+import os
+from dataclasses import dataclass, field
+from http.client import BAD_REQUEST, REQUEST_ENTITY_TOO_LARGE
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import Any, Dict, Union
+from python_multipart.multipart import MultipartParser, parse_options_header
+from crowdstrike.foundry.function.codec import JSONCodec
+from crowdstrike.foundry.function.model import FDKException, Request
+
+_CHUNK_SIZE = 64 * 1024
+
+
+@dataclass
+class MultipartOptions:
+    """Defines how uploaded files are received."""
+
+    # Whether files are provided to handlers as seekable file objects rather than bytes.
+    stream_files: bool = field(default=False)
+    # Size above which a streamed file is written to a temporary file rather than held in memory.
+    memory_limit: int = field(default=1024 * 1024)
+    # Maximum size of a single file, or 0 for no limit.
+    max_file_size: int = field(default=0)
+    # Maximum combined size of all parts of the request, or 0 for no limit.
+    max_total_size: int = field(default=0)
+
+    @staticmethod
+    def from_env() -> 'MultipartOptions':
+        """Read the options from the environment.
+
+        :return: Options given by `CS_FN_MULTIPART_STREAM_FILES`, `CS_FN_MULTIPART_MEMORY_LIMIT`,
+        `CS_FN_MULTIPART_MAX_FILE_SIZE` and `CS_FN_MULTIPART_MAX_TOTAL_SIZE`, with defaults for any not provided.
+        """
+        defaults = MultipartOptions()
+        stream_files = os.environ.get('CS_FN_MULTIPART_STREAM_FILES', '').strip().lower() in {'1', 'true', 'yes'}
+        return MultipartOptions(
+            stream_files=stream_files,
+            memory_limit=int(os.environ.get('CS_FN_MULTIPART_MEMORY_LIMIT', defaults.memory_limit)),
+            max_file_size=int(os.environ.get('CS_FN_MULTIPART_MAX_FILE_SIZE', defaults.max_file_size)),
+            max_total_size=int(os.environ.get('CS_FN_MULTIPART_MAX_TOTAL_SIZE', defaults.max_total_size)),
+        )
+
+
+def read_multipart_payload(
+        headers,
+        stream,
+        codec: JSONCodec,
+        options: Union[MultipartOptions, None] = None,
+) -> Dict[str, Any]:
+    """Parse a `multipart/form-data` request body into a request payload.
+
+    The body is parsed as it is read, with each uploaded file written out as it arrives, so that size limits are
+    enforced before an oversized file has been read in full.
+
+    :param headers: Mapping of request headers. Must contain `Content-Type` and should contain `Content-Length`.
+    :param stream: Readable binary stream holding the request body.
+    :param codec: :class:`JSONCodec` with which to decode the `meta` and `body` fields.
+    :param options: :class:`MultipartOptions` governing how files are received. Uses defaults if None.
+    :return: Request payload, with the `meta` field forming the payload itself alongside `body` and `files`.
+    :raise FDKException: Malformed body, or a size limit was exceeded.
+    """
+    reader = MultipartReader(headers, codec, options)
+    try:
+        while True:
+            size = reader.next_chunk_size()
+            if size == 0:
+                break
+            chunk = stream.read(size)
+            if not chunk:
+                break
+            reader.write(chunk)
+        return reader.finish()
+    except BaseException:
+        reader.close()
+        raise
+
+
+class MultipartReader:
+    """Parses a `multipart/form-data` request body fed to it a chunk at a time.
+
+    For callers which read the body themselves, such as from an asyncio stream. See :func:`read_multipart_payload`.
+    """
+
+    def __init__(self, headers, codec: JSONCodec, options: Union[MultipartOptions, None] = None):
+        """Initialize the reader.
+
+        :param headers: Mapping of request headers. Must contain `Content-Type` and should contain `Content-Length`.
+        :param codec: :class:`JSONCodec` with which to decode the `meta` and `body` fields.
+        :param options: :class:`MultipartOptions` governing how files are received. Uses defaults if None.
+        :raise FDKException: Missing boundary, or the body is declared larger than the options allow.
+        """
+        if options is None:
+            options = MultipartOptions()
+
+        _, params = parse_options_header(headers.get('Content-Type', ''))
+        boundary = params.get(b'boundary', None)
+        if boundary is None:
+            raise FDKException(code=BAD_REQUEST, message='Bad Request: missing multipart boundary')
+        self.content_len = int(headers.get('Content-Length', -1))
+        if 0 < options.max_total_size < self.content_len:
+            # Rejected before any of the body is read.
+            raise FDKException(code=REQUEST_ENTITY_TOO_LARGE,
+                               message=f'Payload Too Large: request exceeds {options.max_total_size} bytes')
+
+        self._collector = _PartCollector(codec, options)
+        self._parser = MultipartParser(boundary, callbacks=self._collector.callbacks())
+        self._read = 0
+
+    def next_chunk_size(self) -> int:
+        """Number of bytes to read next, which is 0 once the length given by `Content-Length` has been read."""
+        if self.content_len < 0:
+            return _CHUNK_SIZE
+        return min(_CHUNK_SIZE, self.content_len - self._read)
+
+    def write(self, chunk: bytes):
+        """Parse the next chunk of the body.
+
+        :param chunk: Bytes following those written so far.
+        :raise FDKException: Malformed body, or a size limit was exceeded.
+        """
+        self._read += len(chunk)
+        self._parser.write(chunk)
+
+    def finish(self) -> Dict[str, Any]:
+        """Complete parsing, once the whole body has been written.
+
+        :return: Request payload, with the `meta` field forming the payload itself alongside `body` and `files`.
+        :raise FDKException: Malformed body.
+        """
+        self._parser.finalize()
+        collector = self._collector
+        payload = collector.meta
+        payload['body'] = collector.body
+        payload['files'] = collector.files
+        return payload
+
+    def close(self):
+        """Release any files received so far, after the body failed to parse."""
+        self._collector.close()
+
+
+def close_files(req: Request):
+    """Release any file objects provided to the handler in :attr:`Request.files`.
+
+    :param req: :class:`Request` whose files to close.
+    """
+    if not req.files:
+        return
+    for f in req.files.values():
+        close = getattr(f, 'close', None)
+        if close is not None:
+            close()
+
+
+class _PartCollector:
+    """Receives the parts of a multipart body from a :class:`MultipartParser`."""
+
+    def __init__(self, codec: JSONCodec, options: MultipartOptions):
+        self.meta = {}
+        self.body = {}
+        self.files = {}
+        self._codec = codec
+        self._options = options
+        self._total_size = 0
+        self._header_name = []
+        self._header_value = []
+        self._part_headers = {}
+        self._field_name = ''
+        self._file_name = None
+        self._file_size = 0
+        self._target = None
+
+    def callbacks(self) -> dict:
+        return {
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished,
+        }
+
+    def close(self):
+        """Release any files received so far, after the body failed to parse."""
+        if self._target is not None:
+            self._target.close()
+            self._target = None
+        for f in self.files.values():
+            if not isinstance(f, bytes):
+                f.close()
+
+    def _on_part_begin(self):
+        self._part_headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name.append(data[start:end])
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value.append(data[start:end])
+
+    def _on_header_end(self):
+        self._part_headers[b''.join(self._header_name).lower()] = b''.join(self._header_value)
+        self._header_name.clear()
+        self._header_value.clear()
+
+    def _on_headers_finished(self):
+        _, params = parse_options_header(self._part_headers.get(b'content-disposition', None))
+        name = params.get(b'name', None)
+        if name is None:
+            raise FDKException(code=BAD_REQUEST, message='Bad Request: multipart part without a name')
+        self._field_name = name.decode('utf-8').strip()
+
+        file_name = params.get(b'filename', None)
+        self._file_name = file_name.decode('utf-8') if file_name is not None else None
+        self._file_size = 0
+        if self._file_name is None:
+            self._target = BytesIO()
+        else:
+            self._target = SpooledTemporaryFile(max_size=self._options.memory_limit)
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        size = end - start
+        self._total_size += size
+        max_total_size = self._options.max_total_size
+        if 0 < max_total_size < self._total_size:
+            raise FDKException(code=REQUEST_ENTITY_TOO_LARGE,
+                               message=f'Payload Too Large: request exceeds {max_total_size} bytes')
+        if self._file_name is not None:
+            self._file_size += size
+            max_file_size = self._options.max_file_size
+            if 0 < max_file_size < self._file_size:
+                raise FDKException(code=REQUEST_ENTITY_TOO_LARGE,
+                                   message=f'Payload Too Large: file {self._file_name} exceeds {max_file_size} bytes')
+        self._target.write(data[start:end])
+
+    def _on_part_end(self):
+        target = self._target
+        self._target = None
+
+        if self._file_name is None:
+            if self._field_name == 'meta':
+                self.meta = self._codec.loads(target.getbuffer())
+            elif self._field_name == 'body':
+                self.body = self._codec.loads(target.getbuffer())
+            return
+
+        target.seek(0)
+        previous = self.files.get(self._file_name, None)
+        if previous is not None and not isinstance(previous, bytes):
+            previous.close()
+        if self._options.stream_files:
+            self.files[self._file_name] = target
+        else:
+            self.files[self._file_name] = target.read()
+            target.close()
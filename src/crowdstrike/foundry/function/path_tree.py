@@ -0,0 +1,165 @@
+"""Path template matching for CrowdStrike Foundry Function FDK."""
+import re
+from http.client import SERVICE_UNAVAILABLE
+from typing import Any, Callable, Dict, List, Tuple, Union
+from crowdstrike.foundry.function.model import FDKException
+
+# Returned by a converter when a segment does not match its type.
+_NO_MATCH = object()
+
+_INT_PATTERN = re.compile(r'-?[0-9]+')
+_FLOAT_PATTERN = re.compile(r'-?[0-9]+(\.[0-9]+)?')
+_PARAM_PATTERN = re.compile(r'\{([A-Za-z_][A-Za-z0-9_]*)(?::([a-z]+))?\}')
+
+
+def _to_int(segment: str):
+    return int(segment) if _INT_PATTERN.fullmatch(segment) else _NO_MATCH
+
+
+def _to_float(segment: str):
+    return float(segment) if _FLOAT_PATTERN.fullmatch(segment) else _NO_MATCH
+
+
+def _to_str(segment: str):
+    return segment if segment != '' else _NO_MATCH
+
+
+# Segment types, in the order they are tried when several could match the same segment.
+_CONVERTERS: Dict[str, Callable[[str], Any]] = {
+    'int': _to_int,
+    'float': _to_float,
+    'str': _to_str,
+}
+# Matches all remaining segments, including none, and may only end a template.
+_TAIL = 'path'
+
+
+def is_template(path: str) -> bool:
+    """Whether the given path contains parameters, such as `/hosts/{id}`.
+
+    :param path: Path to check.
+    :return: True if `path` is a template.
+    """
+    return '{' in path
+
+
+class _Node:
+    __slots__ = ('static', 'params', 'tail', 'methods')
+
+    def __init__(self):
+        self.static: Dict[str, _Node] = {}
+        self.params: Dict[str, _Node] = {}
+        self.tail: Union[_Node, None] = None
+        # Maps each method to its value and the names of the parameters captured on the way to this node.
+        self.methods: Dict[str, Tuple[Any, Tuple[str, ...]]] = {}
+
+
+class PathTree:
+    """Matches paths against registered templates such as `/hosts/{id:int}/files/{rest:path}`.
+
+    A parameter matches a single path segment, converted according to its type: `str` (the default, any non-empty
+    segment), `int` or `float`. A `path` parameter may end a template, matching all remaining segments. Where several
+    templates match, literal segments win over parameters, parameters are tried in the order `int`, `float`, `str`,
+    and `path` is tried last.
+
+    Templates are held in a tree of path segments, so that the cost of a match depends on the depth of the path
+    rather than the number of templates registered.
+    """
+
+    def __init__(self):
+        """Initialize the tree."""
+        self._root = _Node()
+
+    def insert(self, template: str, method: str, value: Any):
+        """Register a value for the given template and method.
+
+        :param template: Path template.
+        :param method: HTTP method.
+        :param value: Value to return on a match.
+        :raise FDKException: Malformed or duplicate template.
+        """
+        node = self._root
+        names = []
+        segments = template.split('/')
+        for i, segment in enumerate(segments):
+            if '{' not in segment:
+                node = node.static.setdefault(segment, _Node())
+                continue
+
+            m = _PARAM_PATTERN.fullmatch(segment)
+            if m is None:
+                raise FDKException(code=SERVICE_UNAVAILABLE, message=f'Malformed path parameter: {template}')
+            name, kind = m.group(1), m.group(2) or 'str'
+            if name in names:
+                raise FDKException(code=SERVICE_UNAVAILABLE, message=f'Duplicate path parameter {name}: {template}')
+            names.append(name)
+
+            if kind == _TAIL:
+                if i != len(segments) - 1:
+                    raise FDKException(code=SERVICE_UNAVAILABLE,
+                                       message=f'Path parameter {name} must end the path: {template}')
+                if node.tail is None:
+                    node.tail = _Node()
+                node = node.tail
+            elif kind in _CONVERTERS:
+                if kind not in node.params:
+                    node.params[kind] = _Node()
+                    node.params = {k: node.params[k] for k in _CONVERTERS if k in node.params}
+                node = node.params[kind]
+            else:
+                raise FDKException(code=SERVICE_UNAVAILABLE,
+                                   message=f'Unsupported path parameter type {kind}: {template}')
+
+        if method in node.methods:
+            raise FDKException(code=SERVICE_UNAVAILABLE,
+                               message='Duplicate method path combination: {} {}'.format(method, template))
+        node.methods[method] = (value, tuple(names))
+
+    def match(self, path: str, method: str) -> Tuple[Any, Dict[str, Any], bool]:
+        """Find the value registered for the template matching the given path and method.
+
+        :param path: Path to match.
+        :param method: HTTP method.
+        :return: The matched value, or None, along with the captured parameters and whether any template
+        matched the path regardless of method.
+        """
+        matched_path = [False]
+        values = []
+        found = self._match(self._root, path.split('/'), 0, method, values, matched_path)
+        if found is None:
+            return None, {}, matched_path[0]
+
+        value, names = found
+        return value, dict(zip(names, values)), True
+
+    def _match(self, node: _Node, segments: List[str], i: int, method: str, values: list, matched_path: list):
+        if i == len(segments):
+            if len(node.methods) > 0:
+                matched_path[0] = True
+                found = node.methods.get(method, None)
+                if found is not None:
+                    return found
+        else:
+            segment = segments[i]
+            child = node.static.get(segment, None)
+            if child is not None:
+                found = self._match(child, segments, i + 1, method, values, matched_path)
+                if found is not None:
+                    return found
+            for kind, child in node.params.items():
+                v = _CONVERTERS[kind](segment)
+                if v is _NO_MATCH:
+                    continue
+                values.append(v)
+                found = self._match(child, segments, i + 1, method, values, matched_path)
+                if found is not None:
+                    return found
+                values.pop()
+
+        if node.tail is not None and len(node.tail.methods) > 0:
+            matched_path[0] = True
+            found = node.tail.methods.get(method, None)
+            if found is not None:
+                values.append('/'.join(segments[i:]))
+                return found
+        return None
@@ -0,0 +1,204 @@
+"""Request profiling for CrowdStrike Foundry Function FDK."""
+import cProfile
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import uuid
+from dataclasses import dataclass, field
+from logging import Logger
+from typing import Any, Awaitable, Callable, Dict, Union
+from crowdstrike.foundry.function.mapping import canonize_header
+from crowdstrike.foundry.function.model import Request
+
+PROFILER_OFF = 'off'
+PROFILER_CPROFILE = 'cprofile'
+PROFILER_SAMPLING = 'sampling'
+
+_UNSAFE_FILE_CHARS = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+@dataclass
+class ProfileOptions:
+    """Defines which requests are profiled, and how."""
+
+    # `off`, `cprofile` for a deterministic profile of every call, or `sampling` for periodic stack samples.
+    profiler: str = field(default=PROFILER_OFF)
+    # Fraction of requests to profile, from 0 to 1.
+    sample_rate: float = field(default=0.0)
+    # Request header which, set to `true`, asks for the request to be profiled. Empty to ignore headers.
+    header: str = field(default='X-Cs-Fn-Profile')
+    # Directory to which profiles are written.
+    directory: str = field(default_factory=lambda: os.path.join(tempfile.gettempdir(), 'cs-fn-profiles'))
+    # Seconds between stack samples taken by the `sampling` profiler.
+    interval: float = field(default=0.005)
+
+    @staticmethod
+    def from_env() -> 'ProfileOptions':
+        """Read the options from the environment.
+
+        :return: Options given by `CS_FN_PROFILE`, `CS_FN_PROFILE_SAMPLE_RATE`, `CS_FN_PROFILE_HEADER`,
+        `CS_FN_PROFILE_DIR` and `CS_FN_PROFILE_INTERVAL`, with defaults for any not provided.
+        """
+        defaults = ProfileOptions()
+        return ProfileOptions(
+            profiler=os.environ.get('CS_FN_PROFILE', defaults.profiler).strip().lower() or PROFILER_OFF,
+            sample_rate=float(os.environ.get('CS_FN_PROFILE_SAMPLE_RATE', defaults.sample_rate)),
+            header=os.environ.get('CS_FN_PROFILE_HEADER', defaults.header).strip(),
+            directory=os.environ.get('CS_FN_PROFILE_DIR', defaults.directory),
+            interval=float(os.environ.get('CS_FN_PROFILE_INTERVAL', defaults.interval)),
+        )
+
+
+class Profiler:
+    """Runs selected handler invocations under a profiler, writing each profile to a file named after the trace ID.
+
+    A request is profiled if it carries the configured header set to `true`, or otherwise at random according to the
+    sample rate. Only one request is profiled at a time; requests arriving while another is being profiled run as
+    usual. Profiles of coroutine handlers served from an event loop also include any other tasks the loop ran while
+    the handler was waiting.
+
+    The `cprofile` profiler writes :mod:`pstats` files (`.prof`), and the `sampling` profiler writes collapsed stacks
+    (`.folded`), one stack and its sample count per line, as taken by flame graph tools.
+    """
+
+    def __init__(self, options: Union[ProfileOptions, None] = None):
+        """Initialize the profiler.
+
+        :param options: :class:`ProfileOptions` governing which requests are profiled. Defaults to
+        :meth:`ProfileOptions.from_env`.
+        :raise ValueError: Unsupported profiler.
+        """
+        self.options = options if options is not None else ProfileOptions.from_env()
+        if self.options.profiler not in {PROFILER_OFF, PROFILER_CPROFILE, PROFILER_SAMPLING}:
+            raise ValueError(f'unsupported profiler: {self.options.profiler}')
+        self.enabled = self.options.profiler != PROFILER_OFF
+        self._header = canonize_header(self.options.header) if self.options.header != '' else ''
+        self._busy = threading.Lock()
+
+    def wants(self, req: Request) -> bool:
+        """Whether the given request should be profiled.
+
+        :param req: :class:`Request` about to be handled.
+        :return: True if the request should be profiled.
+        """
+        if not self.enabled:
+            return False
+        if self._header != '':
+            values = req.params.header.get(self._header, None) if req.params is not None else None
+            if values and str(values[0]).strip().lower() in {'1', 'true', 'yes'}:
+                return True
+        return self.options.sample_rate > 0 and random.random() < self.options.sample_rate
+
+    def run(self, f: Callable[[], Any], req: Request, logger: Union[Logger, None] = None) -> Any:
+        """Call a function under the profiler.
+
+        :param f: Function running the handler.
+        :param req: :class:`Request` being handled, whose trace ID names the profile.
+        :param logger: :class:`Logger` with which to report where the profile was written.
+        :return: Result of `f`.
+        """
+        if not self._busy.acquire(blocking=False):
+            return f()
+        try:
+            session = self._start()
+            try:
+                return f()
+            finally:
+                self._finish(session, req, logger)
+        finally:
+            self._busy.release()
+
+    async def run_async(self, f: Callable[[], Awaitable[Any]], req: Request, logger: Union[Logger, None] = None) -> Any:
+        """Await a coroutine function under the profiler.
+
+        :param f: Coroutine function running the handler.
+        :param req: :class:`Request` being handled, whose trace ID names the profile.
+        :param logger: :class:`Logger` with which to report where the profile was written.
+        :return: Result of `f`.
+        """
+        if not self._busy.acquire(blocking=False):
+            return await f()
+        try:
+            session = self._start()
+            try:
+                return await f()
+            finally:
+                self._finish(session, req, logger)
+        finally:
+            self._busy.release()
+
+    def _start(self):
+        if self.options.profiler == PROFILER_CPROFILE:
+            session = cProfile.Profile()
+            session.enable()
+            return session
+        session = _StackSampler(threading.get_ident(), self.options.interval)
+        session.start()
+        return session
+
+    def _finish(self, session, req: Request, logger: Union[Logger, None]):
+        if isinstance(session, cProfile.Profile):
+            session.disable()
+        else:
+            session.stop()
+        try:
+            os.makedirs(self.options.directory, exist_ok=True)
+            if isinstance(session, cProfile.Profile):
+                path = self._new_path(req, '.prof')
+                session.dump_stats(path)
+            else:
+                path = self._new_path(req, '.folded')
+                session.dump(path)
+        except OSError as e:
+            if logger is not None:
+                logger.warning(f'failed to write profile: {e}')
+            return
+        if logger is not None:
+            logger.info(f'wrote profile of {req.method} {req.url} to {path}')
+
+    def _new_path(self, req: Request, suffix: str) -> str:
+        name = _UNSAFE_FILE_CHARS.sub('_', req.trace_id) if req.trace_id else f'untraced-{uuid.uuid4().hex}'
+        path = os.path.join(self.options.directory, name + suffix)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(self.options.directory, f'{name}.{n}{suffix}')
+            n += 1
+        return path
+
+
+class _StackSampler:
+    """Samples the stack of one thread from a background thread at a fixed interval."""
+
+    def __init__(self, thread_id: int, interval: float):
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='cs-fn-profiler', daemon=True)
+        self.stacks: Dict[str, int] = {}
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path: str):
+        with open(path, 'w') as fd:
+            for stack, n in sorted(self.stacks.items()):
+                fd.write(f'{stack} {n}\n')
+
+    def _sample(self):
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id, None)
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if names:
+                stack = ';'.join(reversed(names))
+                self.stacks[stack] = self.stacks.get(stack, 0) + 1
@@ -1,10 +1,26 @@
 """Router for CrowdStrike Foundry Function FDK."""
-from dataclasses import dataclass
-from http.client import BAD_REQUEST, METHOD_NOT_ALLOWED, NOT_FOUND, SERVICE_UNAVAILABLE
-from inspect import signature
-from logging import Logger
-from typing import Callable, Union
-from crowdstrike.foundry.function.model import FDKException, Request, Response
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from functools import partial
+from http.client import BAD_REQUEST, GATEWAY_TIMEOUT, METHOD_NOT_ALLOWED, NOT_FOUND, SERVICE_UNAVAILABLE
+from inspect import getsourcefile, iscoroutine, iscoroutinefunction, signature, unwrap
+from logging import Logger, getLogger
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+from crowdstrike.foundry.function.cache import CachePolicy, ResponseCache
+from crowdstrike.foundry.function.coalesce import CoalescePolicy, SingleFlight
+from crowdstrike.foundry.function.deadline import Deadlines, TimeoutOptions
+from crowdstrike.foundry.function.log import LOGGER_NAME
+from crowdstrike.foundry.function.metrics import Metrics
+from crowdstrike.foundry.function.middleware import Hooks, Middleware, compose
+from crowdstrike.foundry.function.model import APIError, FDKException, Request, Response
+from crowdstrike.foundry.function.path_tree import PathTree, is_template
+from crowdstrike.foundry.function.profiling import Profiler
+from crowdstrike.foundry.function.schema import RouteSchemas, ValidationOptions, Validator, load_schema
 
 
 @dataclass
@@ -14,28 +30,305 @@ class Route:
     func: Callable
     method: str
     path: str
+    # Caches the handler's responses, if set.
+    cache: Union[CachePolicy, None] = field(default=None, compare=False)
+    # Lets concurrent requests with the same key share one invocation of the handler, if set.
+    coalesce: Union[CoalescePolicy, None] = field(default=None, compare=False)
+    # Applies to this route alone, inside any global middleware.
+    middleware: Sequence[Middleware] = field(default=(), compare=False)
+    # JSON Schemas of the request and response bodies, or the paths of files holding them, relative to the directory
+    # of the handler's source file.
+    request_schema: Union[str, Dict[str, Any], None] = field(default=None, compare=False)
+    response_schema: Union[str, Dict[str, Any], None] = field(default=None, compare=False)
+    # Seconds the handler may run for, in place of the global timeout. 0 for no limit.
+    timeout: Union[float, None] = field(default=None, compare=False)
+    # Resolved by the Router on registration.
+    invoker: Union[Callable[[Request, Union[Logger, None]], Any], None] = field(default=None, compare=False, repr=False)
+    is_async: bool = field(default=False, compare=False, repr=False)
+    responses: Union[ResponseCache, None] = field(default=None, compare=False, repr=False)
+    flights: Union[SingleFlight, None] = field(default=None, compare=False, repr=False)
+    hooks: Tuple[Hooks, ...] = field(default=(), compare=False, repr=False)
+    async_hooks: bool = field(default=False, compare=False, repr=False)
+    schemas: Union[RouteSchemas, None] = field(default=None, compare=False, repr=False)
 
 
 class Router:
     """Serves to route function requests to the appropriate handler functions."""
 
-    def __init__(self, config):
+    def __init__(
+            self,
+            config,
+            profiler: Union[Profiler, None] = None,
+            validation: Union[ValidationOptions, None] = None,
+            timeouts: Union[TimeoutOptions, None] = None,
+    ):
         """Initialize the router.
 
         :param config: The config loaded from the configuration file, if provided.
+        :param profiler: :class:`Profiler` selecting requests whose handlers are run under a profiler.
+        Defaults to one configured from the environment, which profiles nothing unless `CS_FN_PROFILE` is set.
+        :param validation: :class:`ValidationOptions` for routes with schemas. Defaults to
+        :meth:`ValidationOptions.from_env`.
+        :param timeouts: :class:`TimeoutOptions` governing how long handlers may run. Defaults to
+        :meth:`TimeoutOptions.from_env`, which sets no limit unless `CS_FN_HANDLER_TIMEOUT` is set.
         """
         self._config = config
         self._routes = {}
+        self._templates = PathTree()
+        self._middleware: List[Middleware] = []
+        self._registered: List[Route] = []
+        # Recorded by the runners, which alone see every phase of a request.
+        self.metrics = Metrics()
+        self.profiler = profiler if profiler is not None else Profiler()
+        self._validation = validation if validation is not None else ValidationOptions.from_env()
+        self.deadlines = Deadlines(timeouts)
+        # Handlers running on threads of their own under a deadline, of which some may have been left behind.
+        self._handlers = threading.Condition()
+        self._running = 0
+        self._abandoned = 0
 
     def route(self, req: Request, logger: Union[Logger, None] = None) -> Response:
         """Given the method and path of a :class:`Request`, invokes the corresponding handler if one exists.
 
+        If the request has a deadline, from the route's timeout or from the caller, the handler runs on a thread of
+        its own, and the request is answered with a 504 once the deadline passes, even though the handler cannot be
+        stopped and runs on to completion. Such handlers still count towards :attr:`TimeoutOptions.max_running`, once
+        reached further requests with a deadline are answered with a 503.
+
         :param req: :class:`Request` presented to the function.
         :param logger: :class:`Logger` instance. Note: A CrowdStrike-specific logging instance will be provided
         internally.
         :return: :class:`Response` from the handler.
-        :raise FDKException: Path-method mismatch.
+        :raise FDKException: Path-method mismatch, the handler ran past the request's deadline, or too many handlers
+        are running under a deadline.
+        """
+        r = self._find_route(req)
+        timeout = self.deadlines.start(req, r.timeout)
+        if timeout is None:
+            return self._serve(r, req, logger)
+        return self._serve_within(r, req, logger, timeout)
+
+    def _serve(self, r: Route, req: Request, logger: Union[Logger, None] = None) -> Response:
+        if not r.hooks:
+            return self._call_route(r, req, logger)
+        if r.async_hooks:
+            return asyncio.run(self._dispatch_async(r, req, logger, None))
+        return self._dispatch(r, req, logger)
+
+    def _serve_within(self, r: Route, req: Request, logger: Union[Logger, None], timeout: float) -> Response:
+        if timeout <= 0:
+            raise self._timed_out(r, timeout, logger)
+        # A thread cannot be stopped, so the handler runs on one of its own, which is left behind if it overruns. These
+        # are daemon threads rather than those of an executor, which the interpreter would wait for on exit.
+        with self._handlers:
+            if self._running >= self.deadlines.options.max_running:
+                raise FDKException(code=SERVICE_UNAVAILABLE,
+                                   message='Service Unavailable: too many handlers still running')
+            self._running += 1
+        done = threading.Event()
+        abandoned = []
+        outcome = []
+        ctx = copy_context()
+
+        def serve():
+            try:
+                outcome.append((True, ctx.run(self._serve, r, req, logger)))
+            except BaseException as e:
+                outcome.append((False, e))
+            finally:
+                with self._handlers:
+                    self._running -= 1
+                    if abandoned:
+                        self._abandoned -= 1
+                    done.set()
+                    self._handlers.notify_all()
+
+        try:
+            threading.Thread(target=serve, name='cs-fn-handler', daemon=True).start()
+        except BaseException:
+            with self._handlers:
+                self._running -= 1
+            raise
+        if not done.wait(timeout):
+            with self._handlers:
+                if not done.is_set():
+                    abandoned.append(True)
+                    self._abandoned += 1
+                    raise self._timed_out(r, timeout, logger)
+        ok, result = outcome[0]
+        if not ok:
+            raise result
+        return result
+
+    def abandoned(self) -> int:
+        """Number of handlers which ran past their request's deadline and are still running."""
+        with self._handlers:
+            return self._abandoned
+
+    def wait_abandoned(self, timeout: float) -> int:
+        """Wait for handlers which ran past their request's deadline to finish.
+
+        :param timeout: Seconds to wait at most.
+        :return: Number of such handlers still running.
         """
+        with self._handlers:
+            self._handlers.wait_for(lambda: self._abandoned == 0, max(timeout, 0))
+            return self._abandoned
+
+    @staticmethod
+    def _timed_out(r: Route, timeout: float, logger: Union[Logger, None]) -> FDKException:
+        logger = logger if logger is not None else getLogger(LOGGER_NAME)
+        logger.warning(f'handler of {r.method} {r.path} did not respond within {max(timeout, 0):.3f}s')
+        return FDKException(code=GATEWAY_TIMEOUT, message='Gateway Timeout: handler did not respond in time')
+
+    async def route_async(
+            self,
+            req: Request,
+            logger: Union[Logger, None] = None,
+            executor: Union[Executor, None] = None,
+    ) -> Response:
+        """Asynchronous counterpart of :meth:`route`, for use from within an event loop.
+
+        Coroutine handlers are awaited directly. Synchronous handlers are run on the given executor
+        with a copy of the current context, so they may still read `ctx_request`. Where a route has coroutine
+        middleware hooks or a coroutine handler, any synchronous hooks are called on the event loop. Coroutine handlers
+        running past the request's deadline are cancelled.
+
+        :param req: :class:`Request` presented to the function.
+        :param logger: :class:`Logger` instance.
+        :param executor: :class:`Executor` on which to run synchronous handlers. Uses the loop's default if None.
+        :return: :class:`Response` from the handler.
+        :raise FDKException: Path-method mismatch, or the handler ran past the request's deadline.
+        """
+        r = self._find_route(req)
+        timeout = self.deadlines.start(req, r.timeout)
+        if timeout is None:
+            return await self._serve_async(r, req, logger, executor)
+        if timeout <= 0:
+            raise self._timed_out(r, timeout, logger)
+        try:
+            return await asyncio.wait_for(self._serve_async(r, req, logger, executor), timeout)
+        except asyncio.TimeoutError:
+            if time.monotonic() < req.deadline:
+                # Raised by the handler itself, rather than by the deadline passing.
+                raise
+            raise self._timed_out(r, timeout, logger) from None
+
+    async def _serve_async(
+            self,
+            r: Route,
+            req: Request,
+            logger: Union[Logger, None],
+            executor: Union[Executor, None],
+    ) -> Response:
+        if not r.hooks:
+            return await self._call_route_async(r, req, logger, executor)
+        if not r.async_hooks and not r.is_async:
+            loop = asyncio.get_running_loop()
+            call = partial(copy_context().run, self._dispatch, r, req, logger)
+            return await loop.run_in_executor(executor, call)
+        return await self._dispatch_async(r, req, logger, executor)
+
+    def use(self, m: Middleware):
+        """Apply a :class:`Middleware` to every route, both those registered so far and those registered later.
+
+        Global middleware runs in the order in which it was added, outside of any middleware given to a route.
+
+        :param m: :class:`Middleware` to apply.
+        :raise TypeError: Not a :class:`Middleware`.
+        """
+        compose([m])
+        self._middleware.append(m)
+        for r in self._registered:
+            self._compose(r)
+
+    def _compose(self, r: Route):
+        r.hooks, r.async_hooks = compose(self._middleware + list(r.middleware))
+
+    def _dispatch(self, route: Route, req: Request, logger: Union[Logger, None] = None):
+        hooks = route.hooks
+        entered = 0
+        resp = None
+        for before, _ in hooks:
+            entered += 1
+            if before is not None:
+                resp = before(req)
+                if resp is not None:
+                    break
+        if resp is None:
+            resp = self._call_route(route, req, logger)
+        for i in range(entered - 1, -1, -1):
+            after = hooks[i][1]
+            if after is not None:
+                result = after(req, resp)
+                if result is not None:
+                    resp = result
+        return resp
+
+    async def _dispatch_async(
+            self,
+            route: Route,
+            req: Request,
+            logger: Union[Logger, None],
+            executor: Union[Executor, None],
+    ):
+        hooks = route.hooks
+        entered = 0
+        resp = None
+        for before, _ in hooks:
+            entered += 1
+            if before is not None:
+                resp = before(req)
+                if iscoroutine(resp):
+                    resp = await resp
+                if resp is not None:
+                    break
+        if resp is None:
+            resp = await self._call_route_async(route, req, logger, executor)
+        for i in range(entered - 1, -1, -1):
+            after = hooks[i][1]
+            if after is not None:
+                result = after(req, resp)
+                if iscoroutine(result):
+                    result = await result
+                if result is not None:
+                    resp = result
+        return resp
+
+    async def _call_route_async(
+            self,
+            r: Route,
+            req: Request,
+            logger: Union[Logger, None],
+            executor: Union[Executor, None],
+    ):
+        if r.schemas is not None and r.schemas.request is not None:
+            invalid = self._check_request(r, req)
+            if invalid is not None:
+                return invalid
+        key = None
+        if r.responses is not None:
+            key = r.responses.key(req)
+            resp = r.responses.get(key)
+            if resp is not None:
+                return resp
+
+        if r.is_async:
+            run = partial(self._run_route_async, r, req, logger)
+            if r.flights is not None:
+                resp = await r.flights.do_async(r.flights.key(req), run)
+            else:
+                resp = await run()
+        else:
+            loop = asyncio.get_running_loop()
+            call = partial(copy_context().run, self._run_coalesced, r, req, logger)
+            resp = await loop.run_in_executor(executor, call)
+
+        if r.responses is not None:
+            r.responses.put(key, resp)
+        return resp
+
+    def _find_route(self, req: Request) -> Route:
         if type(req.url) is not str:
             raise FDKException(code=BAD_REQUEST,
                                message="Unsupported URL format, expects string: {}".format(req.url))
@@ -45,35 +338,132 @@ class Router:
 
         methods_for_url = self._routes.get(req.url, None)
         req_method = req.method.strip().upper()
-        if methods_for_url is None:
-            raise FDKException(code=NOT_FOUND, message="Not Found: {} {}".format(req_method, req.url))
+        if methods_for_url is not None:
+            r = methods_for_url.get(req_method, None)
+            if r is not None:
+                req.route = r.path
+                return r
 
-        r = methods_for_url.get(req_method, None)
-        if r is None:
-            raise FDKException(code=METHOD_NOT_ALLOWED, message="Method Not Allowed: {} at endpoint".format(req_method))
+        r, path_params, matched_path = self._templates.match(req.url, req_method)
+        if r is not None:
+            req.path_params = path_params
+            req.route = r.path
+            return r
 
-        return self._call_route(r, req, logger)
+        if methods_for_url is None and not matched_path:
+            raise FDKException(code=NOT_FOUND, message="Not Found: {} {}".format(req_method, req.url))
+        raise FDKException(code=METHOD_NOT_ALLOWED, message="Method Not Allowed: {} at endpoint".format(req_method))
 
     def _call_route(self, route: Route, req: Request, logger: Union[Logger, None] = None):
-        f = route.func
+        if route.schemas is not None and route.schemas.request is not None:
+            invalid = self._check_request(route, req)
+            if invalid is not None:
+                return invalid
+        if route.responses is None:
+            return self._run_coalesced(route, req, logger)
+        key = route.responses.key(req)
+        resp = route.responses.get(key)
+        if resp is None:
+            resp = self._run_coalesced(route, req, logger)
+            route.responses.put(key, resp)
+        return resp
+
+    def _run_coalesced(self, route: Route, req: Request, logger: Union[Logger, None] = None):
+        if route.flights is None:
+            return self._run_route(route, req, logger)
+        return route.flights.do(route.flights.key(req), partial(self._run_route, route, req, logger))
+
+    async def _run_route_async(self, route: Route, req: Request, logger: Union[Logger, None] = None):
+        if self.profiler.enabled and self.profiler.wants(req):
+            resp = await self.profiler.run_async(partial(route.invoker, req, logger), req, logger)
+        else:
+            resp = await route.invoker(req, logger)
+        if route.schemas is not None and route.schemas.response is not None:
+            self._check_response(route, resp, logger)
+        return resp
+
+    def _run_route(self, route: Route, req: Request, logger: Union[Logger, None] = None):
+        if self.profiler.enabled and self.profiler.wants(req):
+            resp = self.profiler.run(partial(self._invoke, route, req, logger), req, logger)
+        else:
+            resp = self._invoke(route, req, logger)
+        if route.schemas is not None and route.schemas.response is not None:
+            self._check_response(route, resp, logger)
+        return resp
+
+    @staticmethod
+    def _check_request(route: Route, req: Request) -> Union[Response, None]:
+        errors = route.schemas.request_errors(req.body)
+        if not errors:
+            return None
+        return Response(code=BAD_REQUEST, errors=[APIError(code=BAD_REQUEST, message=f'Bad Request: {e}') for e in errors])
+
+    @staticmethod
+    def _check_response(route: Route, resp: Any, logger: Union[Logger, None]):
+        # Only reported, as the handler has already done its work by now.
+        if not isinstance(resp, Response) or resp.errors:
+            return
+        errors = route.schemas.response_errors(resp.code, resp.body)
+        if errors:
+            logger = logger if logger is not None else getLogger(LOGGER_NAME)
+            logger.warning(f'response of {route.method} {route.path} does not match its schema: {"; ".join(errors)}')
+
+    def _invoke(self, route: Route, req: Request, logger: Union[Logger, None] = None):
+        result = route.invoker(req, logger)
+        if iscoroutine(result):
+            # Coroutine handlers may also be served by the synchronous runners.
+            result = asyncio.run(result)
+        return result
+
+    def _new_invoker(self, f: Callable) -> Callable[[Request, Union[Logger, None]], Any]:
+        # Resolves the handler's calling convention once, rather than inspecting it on every request.
         len_params = len(signature(f).parameters)
+        config = self._config
 
         # We'll make this more flexible in the future if needed.
         if len_params == 3:
-            return f(req, self._config, logger)
+            return lambda req, logger: f(req, config, logger)
         if len_params == 2:
-            return f(req, self._config)
-        return f(req)
+            return lambda req, logger: f(req, config)
+        return lambda req, logger: f(req)
 
     def register(self, r: Route):
         """Register a :class:`Route` with this instance.
 
+        The path may be a template such as `/hosts/{id}`, in which case the values matched by its parameters are
+        provided to the handler in :attr:`Request.path_params`. See :class:`PathTree` for the supported syntax.
+
+        If the route has a :class:`CachePolicy`, its successful responses are cached and later requests with the same
+        cache key are answered from the cache without invoking the handler. If it has a :class:`CoalescePolicy`,
+        concurrent requests with the same key share a single invocation of the handler. Any :class:`Middleware` given
+        to the route, along with that applied by :meth:`use`, is resolved here rather than on every request, as are
+        its request and response schemas, see :class:`Validator`. Request bodies not matching the request schema are
+        answered with a 400 before the handler runs, while successful responses not matching the response schema are
+        logged.
+
         :param r: :class:`Route` to register.
+        :raise OSError: A schema file could not be read.
+        :raise ValueError: A schema is not valid JSON, or is not supported.
         """
         r.method = r.method.upper().strip()
         if r.method not in {'DELETE', 'GET', 'PATCH', 'POST', 'PUT', }:
             raise FDKException(code=SERVICE_UNAVAILABLE, message='Unsupported method: ' + r.method)
 
+        r.invoker = self._new_invoker(r.func)
+        r.is_async = iscoroutinefunction(r.func)
+        if r.cache is not None:
+            r.responses = ResponseCache(r.cache)
+        if r.coalesce is not None:
+            r.flights = SingleFlight(r.coalesce)
+        if r.request_schema is not None or r.response_schema is not None:
+            r.schemas = self._new_schemas(r)
+        self._compose(r)
+
+        if is_template(r.path):
+            self._templates.insert(r.path, r.method, r)
+            self._registered_route(r)
+            return
+
         methods_for_path = self._routes.get(r.path, {})
         if r.method in methods_for_path:
             raise FDKException(code=SERVICE_UNAVAILABLE,
@@ -81,3 +471,28 @@ class Router:
 
         methods_for_path[r.method] = r
         self._routes[r.path] = methods_for_path
+        self._registered_route(r)
+
+    def _new_schemas(self, r: Route) -> RouteSchemas:
+        base_dir = _source_dir(r.func)
+        return RouteSchemas(
+            request=Validator(load_schema(r.request_schema, base_dir)) if r.request_schema is not None else None,
+            response=Validator(load_schema(r.response_schema, base_dir)) if r.response_schema is not None else None,
+            options=self._validation,
+        )
+
+    def _registered_route(self, r: Route):
+        self._registered.append(r)
+        if r.responses is not None:
+            self.metrics.track_cache(r.method, r.path, r.responses)
+        if r.flights is not None:
+            self.metrics.track_coalescing(r.method, r.path, r.flights)
+
+
+def _source_dir(func) -> str:
+    # The file of the handler itself, rather than that of any decorator wrapping it.
+    try:
+        path = getsourcefile(unwrap(func))
+    except TypeError:
+        path = None
+    return os.path.dirname(os.path.abspath(path)) if path else ''
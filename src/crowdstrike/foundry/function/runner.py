@@ -1,7 +1,16 @@
 """Runner base classes for CrowdStrike Foundry Function FDK."""
+import os
 import signal
 import sys
+import threading
+import time
 from abc import ABC, abstractmethod
+from http.client import INTERNAL_SERVER_ERROR
+from typing import Dict, List, Tuple, Union
+from crowdstrike.foundry.function.codec import JSONCodec
+from crowdstrike.foundry.function.log import shutdown_logging
+from crowdstrike.foundry.function.mapping import canonize_header, response_to_dict
+from crowdstrike.foundry.function.model import APIError, Request, Response
 from crowdstrike.foundry.function.router import Router
 
 
@@ -21,25 +30,149 @@ class RunnerBase(ABC):
         """Start the runtime."""
         pass
 
+    def stop(self, timeout: float) -> bool:
+        """Stop accepting new requests, and return from :meth:`run` once the requests in flight have finished.
+
+        Called from a signal handler, so only asks the runtime to stop, without waiting for it to do so.
+
+        :param timeout: Seconds to wait for the requests in flight to finish, after which :meth:`run` returns anyway.
+        :return: Whether the runtime is stopping, or False if it cannot be stopped gracefully.
+        """
+        return False
+
+    def unfinished(self) -> int:
+        """Number of requests still in flight when the runtime stopped, once the timeout given to :meth:`stop` passed."""
+        return 0
+
 
 class Runner(RunnerBase):
     """Base class for runner implementations."""
 
-    def __init__(self, runner: RunnerBase = None):
-        """Initialize the runner."""
+    # Seconds, beyond the drain timeout, given to the runtime to return from its run before the process is ended
+    # regardless, such as when a handler does not return or the serving loop is stuck on a connection.
+    _exit_grace = 1.0
+
+    def __init__(self, runner: RunnerBase = None, drain_timeout: Union[float, None] = None):
+        """Initialize the runner.
+
+        :param runner: :class:`RunnerBase` to run.
+        :param drain_timeout: Seconds to wait, once asked to shut down, for the requests in flight to finish.
+        Defaults to `CS_FN_DRAIN_TIMEOUT` or 30.
+        """
         RunnerBase.__init__(self)
         self._runner = runner
+        if drain_timeout is None:
+            drain_timeout = float(os.environ.get('CS_FN_DRAIN_TIMEOUT', '30'))
+        self._drain_timeout = drain_timeout
+        self._stopping = False
+        self._stop_deadline = 0.0
+        self._exit_timer = None
 
     def run(self, *args, **kwargs):
-        """Start the runtime."""
-        signal.signal(signal.SIGINT, shutdown)
-        signal.signal(signal.SIGTERM, shutdown)
+        """Start the runtime.
+
+        On SIGTERM or SIGINT, the runtime stops accepting new requests and is given time to finish those in flight,
+        after which any queued log records are written out and the process exits. Further signals are ignored while
+        the requests in flight are given time to finish, and exit straight away once that time has passed. Should the
+        runtime not have returned shortly after that time, the process exits regardless, with status 1.
+        """
+        signal.signal(signal.SIGINT, self._on_signal)
+        signal.signal(signal.SIGTERM, self._on_signal)
 
         self._runner.bind_router(self.router)
-        return self._runner.run(*args, **kwargs)
+        result = self._runner.run(*args, **kwargs)
+        if self._stopping:
+            self._exit()
+        return result
+
+    def _on_signal(self, *args):
+        if not self._stopping:
+            if not self._runner.stop(self._drain_timeout):
+                shutdown(*args)
+            self._stopping = True
+            self._stop_deadline = time.monotonic() + self._drain_timeout
+            # Orchestrators send a single signal before killing the process, so the deadline must hold on its own.
+            self._exit_timer = threading.Timer(self._drain_timeout + self._exit_grace, self._force_exit)
+            self._exit_timer.daemon = True
+            self._exit_timer.start()
+        elif time.monotonic() >= self._stop_deadline:
+            # The runtime is taking longer to stop than it was given, so stop waiting for it.
+            shutdown(*args)
+        # Otherwise the signal repeats one already being handled, such as SIGINT sent to a whole process group
+        # followed by the SIGTERM which a supervisor forwards to its workers.
+
+    def _exit(self):
+        unfinished = self._runner.unfinished()
+        shutdown_logging()
+        if unfinished > 0:
+            # Threads still running handlers would otherwise hold up the interpreter's exit.
+            print(f'shutting down with {unfinished} requests unfinished')
+            sys.stdout.flush()
+            os._exit(1)
+        sys.exit(0)
+
+    def _force_exit(self):
+        shutdown_logging()
+        print(f'shutting down with requests unfinished after {self._drain_timeout}s')
+        sys.stdout.flush()
+        os._exit(1)
 
 
 def shutdown(*args):
     """Graceful shutdown."""
     print('shutting down now')
     sys.exit(0)
+
+
+def prepare_response(
+        req: Request,
+        resp: Union[Response, None],
+        codec: JSONCodec,
+) -> Tuple[int, Dict[str, str], bytes]:
+    """Finalize a handler's :class:`Response` for writing back to the caller.
+
+    :param req: :class:`Request` which produced the response.
+    :param resp: :class:`Response` returned by the handler.
+    :param codec: :class:`JSONCodec` with which to encode the response payload.
+    :return: Status code, response headers and encoded response payload.
+    """
+    if resp is None or not isinstance(resp, Response):
+        msg = f'Object is not of type {Response.__base__.__name__}. Got {type(resp)} instead.'
+        resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message=msg)])
+
+    if resp.code == 0 and resp.errors is not None and len(resp.errors) > 0:
+        for e in resp.errors:
+            e_code = e.code
+            if type(e_code) is not int and e_code is not None:
+                e_code = int(e_code)
+            if type(e_code) is int and 100 <= e.code and resp.code < e.code < 600:
+                resp.code = e_code
+
+    resp.header = _resp_headers(req, resp)
+    payload_dict = response_to_dict(resp)
+    payload = codec.dumps(payload_dict)
+    return resp.code, resp.header, payload
+
+
+def _resp_headers(req: Request, resp: Response) -> Dict[str, str]:
+    headers = {}
+    if resp.header is not None and len(resp.header) > 0:
+        for k, v in resp.header.items():
+            if v is None or len(v) == 0:
+                continue
+            headers[canonize_header(k)] = v
+
+    if req.params is not None and req.params.header is not None and len(req.params.header) > 0:
+        req_header = req.params.header
+        _take_header('X-Cs-Executionid', req_header, headers)
+        _take_header('X-Cs-Origin', req_header, headers)
+        _take_header('X-Cs-Traceid', req_header, headers)
+
+    return {k: v if isinstance(v, str) else ';'.join(v) for k, v in headers.items()}
+
+
+def _take_header(key: str, src_header: Dict[str, List[str]], dst_header: Dict[str, List[str]]):
+    value = src_header.get(key, [])
+    if len(value) == 0:
+        return
+    dst_header[key] = value
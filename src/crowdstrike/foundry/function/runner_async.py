@@ -0,0 +1,268 @@
+"""Asyncio HTTP runner for CrowdStrike Foundry Function FDK."""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.client import (
+    BAD_REQUEST, INTERNAL_SERVER_ERROR, LENGTH_REQUIRED, NOT_IMPLEMENTED, REQUEST_HEADER_FIELDS_TOO_LARGE,
+)
+from typing import Dict, Tuple, Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
+from crowdstrike.foundry.function.context import ctx_request
+from crowdstrike.foundry.function.log import setup_logger
+from crowdstrike.foundry.function.mapping import canonize_header, dict_to_request
+from crowdstrike.foundry.function.metrics import metrics_port_from_env, start_metrics_server
+from crowdstrike.foundry.function.model import APIError, FDKException, Request, Response
+from crowdstrike.foundry.function.multipart import MultipartOptions, MultipartReader, close_files
+from crowdstrike.foundry.function.runner import RunnerBase, prepare_response
+
+# Most header lines read from a request, as in http.client.
+_MAX_HEADERS = 100
+
+
+class AsyncHTTPRunner(RunnerBase):
+    """Runs the user's code as part of an asyncio HTTP server.
+
+    Coroutine (`async def`) handlers are awaited on the event loop, so handlers waiting on the network
+    overlap one another. Synchronous handlers are run on a thread pool so they never block the loop.
+    """
+
+    def __init__(
+            self,
+            max_workers: Union[int, None] = None,
+            backlog: Union[int, None] = None,
+            codec: Union[JSONCodec, None] = None,
+            multipart: Union[MultipartOptions, None] = None,
+            metrics_port: Union[int, None] = None,
+    ):
+        """Initialize the asyncio HTTP runner.
+
+        :param max_workers: Number of threads available to synchronous handlers.
+        Defaults to `CS_FN_ASYNC_MAX_WORKERS` or 16.
+        :param backlog: Maximum number of connections waiting to be accepted.
+        Defaults to `CS_FN_HTTP_BACKLOG` or 64.
+        :param codec: :class:`JSONCodec` with which to decode requests and encode responses.
+        Defaults to the codec named by `CS_FN_JSON_CODEC`, see :func:`get_codec`.
+        :param multipart: :class:`MultipartOptions` governing how uploaded files are received.
+        Defaults to :meth:`MultipartOptions.from_env`.
+        :param metrics_port: Port on which to serve request metrics in the Prometheus text format.
+        0 serves none. Defaults to `CS_FN_METRICS_PORT`, or none.
+        """
+        RunnerBase.__init__(self)
+        self._port = int(os.environ.get('PORT', '8081'))
+        if max_workers is None:
+            max_workers = int(os.environ.get('CS_FN_ASYNC_MAX_WORKERS', '16'))
+        self._max_workers = max_workers
+        if backlog is None:
+            backlog = int(os.environ.get('CS_FN_HTTP_BACKLOG', '64'))
+        self._backlog = backlog
+        self._codec = codec if codec is not None else get_codec()
+        self._multipart = multipart if multipart is not None else MultipartOptions.from_env()
+        self._metrics_port = metrics_port if metrics_port is not None else metrics_port_from_env()
+        self._executor = None
+        self._logger = None
+        self._loop = None
+        self._stopping = None
+        self._connections = set()
+        self._drain_deadline = 0.0
+        self._unfinished = 0
+
+    def run(self, *args, **kwargs):
+        """Start the asyncio HTTP server and listen for requests."""
+        self._logger = kwargs.get('logger', None)
+        if self._logger is None:
+            self._logger = setup_logger()
+
+        self._logger.info(f'running at port {self._port} in async mode')
+        if self._metrics_port:
+            start_metrics_server(self.router.metrics, self._metrics_port, self._logger)
+        asyncio.run(self._serve())
+
+    def stop(self, timeout: float) -> bool:
+        """Stop accepting new requests, and return from :meth:`run` once the requests in flight have finished.
+
+        :param timeout: Seconds to wait for the requests in flight to finish, after which :meth:`run` returns anyway.
+        :return: Whether the server is stopping, or False if it is not running.
+        """
+        if self._loop is None:
+            return False
+        self._drain_deadline = time.monotonic() + timeout
+        self._loop.call_soon_threadsafe(self._stopping.set)
+        return True
+
+    def unfinished(self) -> int:
+        """Number of requests still in flight when the server stopped, once the timeout given to :meth:`stop` passed."""
+        return self._unfinished
+
+    async def _serve(self):
+        self._stopping = asyncio.Event()
+        server = await self._start_server()
+        self._loop = asyncio.get_running_loop()
+        await self._stopping.wait()
+        # Not waiting for the server to close, which would also wait for every connection to be closed.
+        server.close()
+        if self._connections:
+            self._logger.info(f'waiting for {len(self._connections)} requests in flight to finish')
+            _, pending = await asyncio.wait(set(self._connections), timeout=max(self._drain_deadline - time.monotonic(), 0))
+            self._unfinished = len(pending)
+        if self._unfinished > 0:
+            self._logger.warning(f'stopped with {self._unfinished} requests still in flight')
+        else:
+            self._logger.info('stopped')
+
+    async def _start_server(self) -> asyncio.AbstractServer:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix='cs-fn-async')
+        return await asyncio.start_server(
+            self._handle_connection, host='0.0.0.0', port=self._port, backlog=self._backlog,
+        )
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        started = time.perf_counter()
+        read_done = None
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            req = None
+            method = None
+            try:
+                head = await self._read_head(reader)
+                if head is None:
+                    return
+                method, headers = head
+                req = await self._read_request(reader, writer, headers)
+                read_done = time.perf_counter()
+                resp = await self._exec_request(req)
+            except FDKException as fe:
+                resp = Response(errors=[APIError(code=fe.code, message=fe.message)])
+            except Exception:
+                self._logger.exception('failed to handle request')
+                resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message='Internal Server Error')])
+            handler_done = time.perf_counter()
+            code = await self._write_response(writer, req if req is not None else Request(), resp, method)
+            self.router.metrics.observe_request(
+                req, code,
+                read=(read_done if read_done is not None else handler_done) - started,
+                handler=handler_done - read_done if read_done is not None else None,
+                write=time.perf_counter() - handler_done,
+            )
+        finally:
+            if req is not None:
+                close_files(req)
+            writer.close()
+            self._connections.discard(task)
+
+    async def _exec_request(self, req: Request) -> Response:
+        self._logger.info('received request')
+        # Each connection is served by its own task, which holds its own copy of the context.
+        ctx_request.set(req)
+        return await self.router.route_async(req, logger=self._logger, executor=self._executor)
+
+    async def _read_head(self, reader: asyncio.StreamReader) -> Union[Tuple[str, Dict[str, str]], None]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        parts = request_line.split()
+        if len(parts) != 3:
+            raise FDKException(code=BAD_REQUEST, message='Malformed request line')
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= _MAX_HEADERS:
+                raise FDKException(code=REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                   message=f'Request Header Fields Too Large: more than {_MAX_HEADERS} headers')
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[canonize_header(name.strip())] = value.strip()
+        return parts[0].decode('latin-1'), headers
+
+    async def _read_request(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            headers: Dict[str, str],
+    ) -> Request:
+        coding = headers.get('Transfer-Encoding', '').strip().lower()
+        if coding not in ('', 'identity'):
+            # Bodies are read by their declared length alone.
+            if coding.rsplit(',', 1)[-1].strip() == 'chunked':
+                raise FDKException(code=LENGTH_REQUIRED,
+                                   message='Length Required: chunked request bodies are not supported')
+            raise FDKException(code=NOT_IMPLEMENTED, message=f'Not Implemented: transfer coding {coding}')
+        content_len = int(headers.get('Content-Length', 0))
+        if content_len <= 0:
+            return dict_to_request({})
+
+        content_type = headers.get('Content-Type', 'application/json')
+        if content_type.startswith('multipart/form-data'):
+            return dict_to_request(await self._read_multipart(reader, writer, headers))
+
+        await self._send_continue(writer, headers)
+        body = await reader.readexactly(content_len)
+        req = dict_to_request(self._codec.loads(body))
+        req.raw_body = memoryview(body)
+        return req
+
+    @staticmethod
+    async def _send_continue(writer: asyncio.StreamWriter, headers: Dict[str, str]):
+        # Callers asking for it hold back the body until told to go ahead.
+        if headers.get('Expect', '').strip().lower() == '100-continue':
+            writer.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            await writer.drain()
+
+    async def _read_multipart(
+            self,
+            reader: asyncio.StreamReader,
+            writer: asyncio.StreamWriter,
+            headers: Dict[str, str],
+    ) -> dict:
+        # Parsed as it is read, so that size limits are enforced before an oversized body is held in memory.
+        multipart = MultipartReader(headers, self._codec, self._multipart)
+        loop = asyncio.get_running_loop()
+        try:
+            await self._send_continue(writer, headers)
+            size = multipart.next_chunk_size()
+            while size > 0:
+                chunk = await reader.read(size)
+                if not chunk:
+                    raise FDKException(code=BAD_REQUEST, message='Bad Request: request body ended early')
+                # Parsing is CPU-bound, and large files are written to disk, so keep it off the event loop.
+                await loop.run_in_executor(self._executor, multipart.write, chunk)
+                size = multipart.next_chunk_size()
+            return multipart.finish()
+        except BaseException:
+            multipart.close()
+            raise
+
+    async def _write_response(
+            self,
+            writer: asyncio.StreamWriter,
+            req: Request,
+            resp: Union[Response, None],
+            method: Union[str, None] = None,
+    ) -> int:
+        code, headers, payload = prepare_response(req, resp, self._codec)
+        try:
+            reason = HTTPStatus(code).phrase
+        except ValueError:
+            reason = ''
+
+        lines = [
+            f'HTTP/1.1 {code} {reason}',
+            f'Content-Length: {len(payload)}',
+            'Content-Type: application/json',
+            'Connection: close',
+        ]
+        for k, v in headers.items():
+            lines.append(f'{k}: {v}')
+        head = '\r\n'.join(lines) + '\r\n\r\n'
+
+        writer.write(head.encode('latin-1'))
+        # Responses to HEAD carry the length of the body they would have had, but not the body itself.
+        if method != 'HEAD':
+            writer.write(payload)
+        await writer.drain()
+        return code
@@ -1,36 +1,44 @@
 """CLI runner for CrowdStrike Foundry Functions FDK."""
 import argparse
-import json
-from logging import Formatter, Logger, StreamHandler, getLogger
-from sys import stdout
-from typing import Dict, List, Union
+import mmap
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from http.client import BAD_REQUEST, INTERNAL_SERVER_ERROR
+from io import BytesIO
+from typing import IO, Any, Callable, Iterator, List, Tuple, Union
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
 from crowdstrike.foundry.function.context import ctx_request
-from crowdstrike.foundry.function.mapping import canonize_header, dict_to_request, response_to_dict
+from crowdstrike.foundry.function.log import setup_logger
+from crowdstrike.foundry.function.mapping import dict_to_request
+from crowdstrike.foundry.function.metrics import percentile
 from crowdstrike.foundry.function.model import APIError, FDKException, Request, Response
-from crowdstrike.foundry.function.runner import RunnerBase
-
-
-INTERNAL_SERVER_ERROR = 500
-
-
-def _new_cli_logger() -> Logger:
-    f = Formatter('%(asctime)s [%(levelname)s]  %(filename)s %(funcName)s:%(lineno)d  ->  %(message)s')
-
-    h = StreamHandler(stdout)
-    h.setFormatter(f)
-
-    logger = getLogger("cs-logger")
-    logger.setLevel('DEBUG')
-    logger.addHandler(h)
-    return logger
+from crowdstrike.foundry.function.multipart import MultipartOptions, close_files
+from crowdstrike.foundry.function.runner import RunnerBase, prepare_response
 
 
 class CLIRunner(RunnerBase):
     """Runs the user's request without starting an HTTP server."""
 
-    def __init__(self):
-        """Initialize the CLI runner."""
+    def __init__(
+            self,
+            codec: Union[JSONCodec, None] = None,
+            multipart: Union[MultipartOptions, None] = None,
+    ):
+        """Initialize the CLI runner.
+
+        :param codec: :class:`JSONCodec` with which to decode requests and encode responses.
+        Defaults to the codec named by `CS_FN_JSON_CODEC`, see :func:`get_codec`.
+        :param multipart: :class:`MultipartOptions` governing how `--file` inputs are provided to the handler.
+        With `stream_files` set, each file is memory-mapped rather than read. Defaults to
+        :meth:`MultipartOptions.from_env`.
+        """
         RunnerBase.__init__(self)
+        self._codec = codec if codec is not None else get_codec()
+        self._multipart = multipart if multipart is not None else MultipartOptions.from_env()
         self.logger = None
         self.headers = None
         self.data = None
@@ -47,10 +55,17 @@ class CLIRunner(RunnerBase):
             )
         )
 
-        self.parser.add_argument(
+        source = self.parser.add_mutually_exclusive_group()
+        source.add_argument(
             '-d', '--data', type=str,
             help='Path to a JSON file containing the "method", "url", and optionally the "body" and "params" fields.'
         )
+        source.add_argument(
+            '-b', '--batch', type=str,
+            help='Path to a JSON Lines file holding one request per line in the same format as --data, '
+                 'or to a directory of such files and of --data files. '
+                 'Each request is executed in turn and its response is written as a line of JSON.'
+        )
         self.parser.add_argument(
             '-H', '--header', type=str, action='append', nargs='*',
             help="Optional HTTP request headers to provide to the function handler"
@@ -61,6 +76,14 @@ class CLIRunner(RunnerBase):
             help='Optional file input to the function handler.'
             'The "Content-Type: multipart/form-data" header must also be specified for file input.'
         )
+        self.parser.add_argument(
+            '-p', '--parallel', type=int, default=1,
+            help='Number of --batch requests to execute at once. Defaults to 1.'
+        )
+        self.parser.add_argument(
+            '-o', '--output', type=str,
+            help='Path of the file to which --batch responses are written. Defaults to standard output.'
+        )
 
     def _process_headers(self, headers: list):
         for header in headers:
@@ -92,95 +115,192 @@ class CLIRunner(RunnerBase):
                 self.parser.print_help()
                 self.parser.error('Also provide -H "Content-Type: multipart/form-data" to use the --file argument')
 
+        if self.args.batch is None:
+            if self.args.data is None:
+                self.parser.error('One of the --data or --batch arguments is required')
+            return
+        if self.args.file:
+            self.parser.error('The --file argument cannot be combined with --batch')
+        if self.args.parallel < 1:
+            self.parser.error('The --parallel argument must be at least 1')
+        if not os.path.exists(self.args.batch):
+            self.parser.error(f'No such file or directory: {self.args.batch}')
+
     def run(self, *args, **kwargs):
         """Execute the requested function handler with the input provided on the command line."""
-        self.logger = kwargs.get('logger', None)
-        if self.logger is None:
-            self.logger = _new_cli_logger()
-
         self.args = self.parser.parse_args()
         self._verify_arguments()
 
+        self.logger = kwargs.get('logger', None)
+        if self.logger is None:
+            # Batch responses written to standard output must not be interleaved with log messages.
+            to_stderr = self.args.batch is not None and self.args.output is None
+            # Written synchronously, so that log messages appear in order with the response printed afterwards.
+            self.logger = setup_logger(queue_size=0, stream=sys.stderr if to_stderr else None)
+
         self.logger.info('Running without HTTP server')
-        self._exec_request()
+        if self.args.batch is not None:
+            self._exec_batch()
+        else:
+            self._exec_request()
 
     def _exec_request(self):
         req = self._read_request()
         ctx_request.set(req)
         try:
+            try:
+                resp = self.router.route(req, logger=self.logger)
+            except FDKException as fe:
+                resp = Response(errors=[APIError(code=fe.code, message=fe.message)])
+            self._write_response(req, resp)
+        finally:
+            close_files(req)
+
+    def _exec_batch(self):
+        if self.args.output is None:
+            self._write_batch(lambda line: print(line.decode('utf-8'), end=''))
+            return
+        with open(self.args.output, 'wb') as out:
+            self._write_batch(out.write)
+
+    def _write_batch(self, write: Callable[[bytes], Any]):
+        latencies = []
+        failures = 0
+        started = time.perf_counter()
+        for code, elapsed, line in self._run_batch():
+            latencies.append(elapsed)
+            if code >= 400:
+                failures += 1
+            write(line)
+        print(_batch_summary(latencies, failures, time.perf_counter() - started), file=sys.stderr)
+
+    def _run_batch(self) -> Iterator[Tuple[int, float, bytes]]:
+        # Requests are submitted no faster than their responses are written, so that memory use stays bounded
+        # however many requests the batch holds, and responses are written in the order the requests were read.
+        window = 4 * self.args.parallel
+        pending: deque = deque()
+        with ThreadPoolExecutor(max_workers=self.args.parallel, thread_name_prefix='cs-fn-batch') as executor:
+            for source, line in _read_batch(self.args.batch):
+                # Each request is executed in a copy of this context, so that its Request never leaks into another.
+                pending.append(executor.submit(copy_context().run, self._exec_batch_request, source, line))
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _exec_batch_request(self, source: str, line: bytes) -> Tuple[int, float, bytes]:
+        started = time.perf_counter()
+        req = Request()
+        try:
+            try:
+                payload = self._codec.loads(line)
+            except ValueError:
+                raise FDKException(code=BAD_REQUEST, message='Bad Request: malformed JSON')
+            if not isinstance(payload, dict):
+                raise FDKException(code=BAD_REQUEST, message='Bad Request: request must be a JSON object')
+            self._add_headers(payload)
+            req = dict_to_request(payload)
+            req.raw_body = memoryview(line)
+            ctx_request.set(req)
             resp = self.router.route(req, logger=self.logger)
         except FDKException as fe:
             resp = Response(errors=[APIError(code=fe.code, message=fe.message)])
-        self._write_response(req, resp)
+        except Exception:
+            self.logger.exception(f'failed to execute request {source}')
+            resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message='Internal Server Error')])
+        code, headers, payload = prepare_response(req, resp, self._codec)
+        elapsed = time.perf_counter() - started
+
+        line = self._codec.dumps({
+            'source': source,
+            'code': code,
+            'headers': headers,
+            'duration_ms': round(elapsed * 1000, 3),
+            'response': self._codec.loads(payload),
+        })
+        return code, elapsed, line + b'\n'
 
     def _read_request(self) -> Request:
-        payload = self._read_json_request()
+        with open(self.args.data, 'rb') as fd:
+            body = fd.read()
+        payload = self._codec.loads(body)
         self._add_headers(payload)
         content_type = self.headers.get('content-type', 'application/json')
         if content_type.startswith('multipart/form-data'):
             payload['files'] = self._read_multipart_request()
-        return dict_to_request(payload)
-
-    def _read_json_request(self) -> dict:
-        payload = {}
-        with open(self.args.data, 'r') as fd:
-            payload = json.load(fd)
-        return payload
+        req = dict_to_request(payload)
+        req.raw_body = memoryview(body)
+        return req
 
     def _read_multipart_request(self) -> dict:
         files = {}
         for file in self.args.file:
-            with open(file[0], 'r') as fd:
-                files[file[0]] = fd.read().encode('utf-8')
+            name = file[0]
+            files[name] = self._open_file(name) if self._multipart.stream_files else self._load_file(name)
         return files
 
+    @staticmethod
+    def _load_file(name: str) -> bytes:
+        with open(name, 'rb') as fd:
+            return fd.read()
+
+    @staticmethod
+    def _open_file(name: str) -> Union[mmap.mmap, IO[bytes]]:
+        # A read-only mapping pages the file in as the handler reads it, rather than copying it up front.
+        # The mapping remains valid once the descriptor is closed.
+        with open(name, 'rb') as fd:
+            try:
+                return mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped.
+                return BytesIO(b'')
+
     def _write_response(self, req: Request, resp: Union[Response, None]):
-        if resp is None or not isinstance(resp, Response):
-            msg = f'Object is not of type {Response.__base__.__name__}. Got {type(resp)} instead.'
-            resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message=msg)])
-
-        if resp.code == 0 and resp.errors is not None and len(resp.errors) > 0:
-            for e in resp.errors:
-                e_code = e.code
-                if type(e_code) is not int and e_code is not None:
-                    e_code = int(e_code)
-                if type(e_code) is int and 100 <= e.code and resp.code < e.code < 600:
-                    resp.code = e_code
-
-        resp.header = self._resp_headers(req, resp)
-        payload_dict = response_to_dict(resp)
-        payload = json.dumps(payload_dict)
+        code, headers, payload = prepare_response(req, resp, self._codec)
 
         print('')
-        print(f'Status code: {resp.code}')
+        print(f'Status code: {code}')
         print(f'Response Header: Content-Length: {str(len(payload))}')
         print('Response Header: Content-Type: application/json')
-        for k, v in resp.header.items():
+        for k, v in headers.items():
             print(f'Response Header: {k}: {v}')
         print('Response Payload:')
-        print(payload)
-
-    def _resp_headers(self, req: Request, resp: Response):
-        headers = {}
-        if resp.header is not None and len(resp.header) > 0:
-            for k, v in resp.header.items():
-                if v is None or len(v) == 0:
-                    continue
-                headers[canonize_header(k)] = v
-
-        if req.params is None or req.params.header is None or len(req.params.header) == 0:
-            return headers
-
-        req_header = req.params.header
-        self._take_header('X-Cs-Executionid', req_header, headers)
-        self._take_header('X-Cs-Origin', req_header, headers)
-        self._take_header('X-Cs-Traceid', req_header, headers)
-
-        headers = {k: ';'.join(v) for k, v in headers}
-        return headers
-
-    def _take_header(self, key: str, src_header: Dict[str, List[str]], dst_header: Dict[str, List[str]]):
-        value = src_header.get(key, [])
-        if len(value) == 0:
-            return
-        dst_header[key] = value
+        print(payload.decode('utf-8'))
+
+
+def _read_batch(path: str) -> Iterator[Tuple[str, bytes]]:
+    """Read the requests of a batch, along with the location each was read from.
+
+    :param path: JSON Lines file, or directory of JSON Lines (`.jsonl`) and single request (`.json`) files.
+    :return: Iterator of locations, in the form `file:line`, and encoded requests.
+    """
+    if not os.path.isdir(path):
+        yield from _read_batch_lines(path)
+        return
+
+    for name in sorted(os.listdir(path)):
+        file = os.path.join(path, name)
+        if name.endswith('.jsonl'):
+            yield from _read_batch_lines(file)
+        elif name.endswith('.json'):
+            with open(file, 'rb') as fd:
+                yield file, fd.read()
+
+
+def _read_batch_lines(file: str) -> Iterator[Tuple[str, bytes]]:
+    with open(file, 'rb') as fd:
+        for i, line in enumerate(fd, start=1):
+            line = line.strip()
+            if line:
+                yield f'{file}:{i}', line
+
+
+def _batch_summary(latencies: List[float], failures: int, elapsed: float) -> str:
+    ordered = sorted(latencies)
+    count = len(ordered)
+    rate = count / elapsed if elapsed > 0 else 0.0
+    ms = [1000 * percentile(ordered, p) for p in (50, 95, 99, 100)]
+    return (
+        f'{count} requests ({failures} failed) in {elapsed:.3f}s, {rate:.1f} requests/s; '
+        f'latency p50 {ms[0]:.3f}ms, p95 {ms[1]:.3f}ms, p99 {ms[2]:.3f}ms, max {ms[3]:.3f}ms'
+    )
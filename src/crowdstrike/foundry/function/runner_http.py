@@ -1,67 +1,539 @@
 """HTTP runner for CrowdStrike Foundry Function FDK."""
-import json
 import os
-from sys import stdout
-from http.client import INTERNAL_SERVER_ERROR
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import BAD_REQUEST, INTERNAL_SERVER_ERROR, SERVICE_UNAVAILABLE
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from logging import Formatter, Logger, StreamHandler, getLogger
-import python_multipart
-from typing import Dict, List, Union
+from logging import Logger
+from socket import SHUT_RDWR
+from socketserver import ThreadingMixIn
+from threading import BoundedSemaphore, Condition, Lock, Thread
+from typing import Callable, Union
+from crowdstrike.foundry.function.admission import ADMITTED, SHED, AdmissionController, AdmissionOptions
+from crowdstrike.foundry.function.codec import JSONCodec, get_codec
 from crowdstrike.foundry.function.context import ctx_request
-from crowdstrike.foundry.function.mapping import canonize_header, dict_to_request, response_to_dict
+from crowdstrike.foundry.function.log import setup_logger, shutdown_logging
+from crowdstrike.foundry.function.mapping import dict_to_request
+from crowdstrike.foundry.function.metrics import metrics_port_from_env, start_metrics_server
 from crowdstrike.foundry.function.model import APIError, FDKException, Request, Response
+from crowdstrike.foundry.function.multipart import MultipartOptions, close_files, read_multipart_payload
 from crowdstrike.foundry.function.router import Router
-from crowdstrike.foundry.function.runner import RunnerBase
+from crowdstrike.foundry.function.runner import RunnerBase, prepare_response
+
+
+CONCURRENCY_SERIAL = 'serial'
+CONCURRENCY_THREADED = 'threaded'
+CONCURRENCY_POOL = 'pool'
+
+
+class _HTTPServer(HTTPServer):
+    """HTTP server which serves requests one at a time, with a configurable accept backlog."""
+
+    def __init__(self, server_address, handler_class, backlog: int):
+        # Must be set before the socket starts listening, which happens within the constructor.
+        self.request_queue_size = backlog
+        self._accepted = {}
+        self._idle = set()
+        self._idle_lock = Lock()
+        self._closing_idle = False
+        HTTPServer.__init__(self, server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        """Note when the connection was accepted, then serve it."""
+        self.note_accepted(request)
+        HTTPServer.process_request(self, request, client_address)
+
+    def note_accepted(self, request):
+        """Note that a connection was accepted just now, before any wait for its turn to be served."""
+        self._accepted[request] = time.monotonic()
+
+    def accepted_at(self, request) -> Union[float, None]:
+        """Time, from :func:`time.monotonic`, at which a connection was accepted, or None if it was not noted."""
+        return self._accepted.pop(request, None)
+
+    def note_idle(self, request):
+        """Note that a connection is waiting for its next request, hanging it up instead if the server is stopping."""
+        with self._idle_lock:
+            if not self._closing_idle:
+                self._idle.add(request)
+                return
+        _hang_up(request)
+
+    def note_busy(self, request):
+        """Note that a request has arrived on a connection which was waiting for one."""
+        with self._idle_lock:
+            self._idle.discard(request)
+
+    def close_idle(self):
+        """Hang up every connection waiting for a request, and any which starts waiting from now on.
+
+        Otherwise a caller who connects and sends nothing would keep the server from stopping.
+        """
+        with self._idle_lock:
+            self._closing_idle = True
+            idle = list(self._idle)
+            self._idle.clear()
+        for request in idle:
+            _hang_up(request)
+
+    def shutdown_request(self, request):
+        """Forget when the connection was accepted, then close it."""
+        self._accepted.pop(request, None)
+        self.note_busy(request)
+        HTTPServer.shutdown_request(self, request)
+
+
+def _hang_up(request):
+    # Wakes any thread blocked reading from the connection, which then sees it as closed by the caller.
+    try:
+        request.shutdown(SHUT_RDWR)
+    except OSError:
+        pass
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, _HTTPServer):
+    """HTTP server which serves each request on its own thread."""
+
+    daemon_threads = True
+
+    def process_request(self, request, client_address):
+        """Note when the connection was accepted, then serve it on a thread of its own."""
+        self.note_accepted(request)
+        ThreadingMixIn.process_request(self, request, client_address)
+
+
+class _PooledHTTPServer(_HTTPServer):
+    """HTTP server which serves requests from a bounded pool of worker threads.
+
+    Once `max_in_flight` requests are being handled, the server stops accepting connections,
+    leaving any further callers waiting in the accept backlog until a worker frees up.
+    """
+
+    def __init__(self, server_address, handler_class, backlog: int, max_in_flight: int):
+        _HTTPServer.__init__(self, server_address, handler_class, backlog)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='cs-fn-http')
+        self._slots = BoundedSemaphore(max_in_flight)
+
+    def process_request(self, request, client_address):
+        """Hand the request off to a worker, blocking while all workers are busy."""
+        # Noted before waiting for a worker, so that the wait counts towards the request's queue age.
+        self.note_accepted(request)
+        self._slots.acquire()
+        try:
+            self._executor.submit(self._process_request_worker, request, client_address)
+        except Exception:
+            self._slots.release()
+            raise
 
+    def _process_request_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
 
-def _new_http_logger() -> Logger:
-    f = Formatter('%(asctime)s [%(levelname)s]  %(filename)s %(funcName)s:%(lineno)d  ->  %(message)s')
+    def server_close(self):
+        """Close the listening socket and wait for any in-flight requests to finish."""
+        _HTTPServer.server_close(self)
+        self._executor.shutdown(wait=True)
 
-    h = StreamHandler(stdout)
-    h.setFormatter(f)
 
-    logger = getLogger("cs-logger")
-    logger.setLevel('DEBUG')
-    logger.addHandler(h)
-    return logger
+class _InFlight:
+    """Counts the requests being handled, so that a server which is stopping can wait for them to finish."""
+
+    def __init__(self):
+        self._cond = Condition()
+        self._count = 0
+
+    def __enter__(self):
+        with self._cond:
+            self._count += 1
+
+    def __exit__(self, *args):
+        with self._cond:
+            self._count -= 1
+            if self._count == 0:
+                self._cond.notify_all()
+
+    def count(self) -> int:
+        """Number of requests being handled."""
+        with self._cond:
+            return self._count
+
+    def wait(self, timeout: float) -> int:
+        """Wait for every request being handled to finish.
+
+        :param timeout: Seconds to wait at most.
+        :return: Number of requests still being handled.
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._count == 0, max(timeout, 0))
+            return self._count
+
+
+class _PreforkSupervisor:
+    """Serves an already-bound HTTP server from several forked worker processes.
+
+    Workers are forked after the user's modules and configuration have been loaded, so they share them
+    copy-on-write. Any worker which exits is replaced.
+    """
+
+    # Workers which die sooner than this after starting are respawned only after waiting this long,
+    # so that a worker failing on startup does not turn into a tight fork loop.
+    _min_worker_lifetime = 1.0
+
+    def __init__(self, serve: Callable[[], None], processes: int, logger: Logger):
+        self._serve = serve
+        self._processes = processes
+        self._logger = logger
+        self._workers = {}
+        self._stopping = False
+
+    def run(self):
+        """Fork the workers and supervise them until interrupted, or until they have all exited after :meth:`stop`."""
+        try:
+            for _ in range(self._processes):
+                self._spawn()
+            while self._workers:
+                pid, status = os.wait()
+                started = self._workers.pop(pid, None)
+                if started is None or self._stopping:
+                    continue
+                self._logger.warning(f'worker {pid} exited with status {status}, restarting')
+                if time.monotonic() - started < self._min_worker_lifetime:
+                    time.sleep(self._min_worker_lifetime)
+                if not self._stopping:
+                    self._spawn()
+        finally:
+            self._stop_workers()
+
+    def stop(self):
+        """Ask every worker to finish the requests it is handling and exit, without replacing them."""
+        self._stopping = True
+        self._signal_workers()
+
+    def _spawn(self):
+        # Hold back signals while forking, as the new worker would lose any which arrived before it was set up.
+        mask = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGINT, signal.SIGTERM})
+        try:
+            pid = os.fork()
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, mask)
+        if pid == 0:
+            code = 0
+            try:
+                self._serve()
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                self._logger.exception('worker failed')
+                code = 1
+            finally:
+                # Exiting without running the parent's exit handlers, so write out any queued log records first.
+                shutdown_logging()
+                os._exit(code)
+        self._workers[pid] = time.monotonic()
+        if self._stopping:
+            # Asked to stop while forking, so the new worker was missed.
+            self._signal_workers()
+
+    def _signal_workers(self):
+        for pid in list(self._workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _stop_workers(self):
+        self._signal_workers()
+        for pid in self._workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._workers.clear()
 
 
 class HTTPRunner(RunnerBase):
     """Runs the user's code as part of an HTTP server."""
 
-    def __init__(self):
-        """Initialize the HTTP runner."""
+    def __init__(
+            self,
+            concurrency: Union[str, None] = None,
+            max_in_flight: Union[int, None] = None,
+            backlog: Union[int, None] = None,
+            processes: Union[int, None] = None,
+            keep_alive: Union[bool, None] = None,
+            idle_timeout: Union[float, None] = None,
+            max_requests_per_connection: Union[int, None] = None,
+            codec: Union[JSONCodec, None] = None,
+            multipart: Union[MultipartOptions, None] = None,
+            metrics_port: Union[int, None] = None,
+            admission: Union[AdmissionOptions, None] = None,
+    ):
+        """Initialize the HTTP runner.
+
+        Any argument left as `None` is read from the environment, falling back to a default.
+
+        :param concurrency: How requests are served: `serial` (one at a time), `threaded` (one thread per request)
+        or `pool` (bounded pool of worker threads). Defaults to `CS_FN_HTTP_CONCURRENCY` or `serial`.
+        :param max_in_flight: Maximum number of requests handled at once in `pool` mode.
+        Defaults to `CS_FN_HTTP_MAX_IN_FLIGHT` or 16.
+        :param backlog: Maximum number of connections waiting to be accepted.
+        Defaults to `CS_FN_HTTP_BACKLOG` or 64.
+        :param processes: Number of worker processes to fork, each serving requests from the same socket.
+        0 forks one worker per CPU. Defaults to `CS_FN_HTTP_PROCESSES` or 1, which serves from this process.
+        :param keep_alive: Whether to speak HTTP/1.1 and keep connections open between requests.
+        Defaults to `CS_FN_HTTP_KEEP_ALIVE` or false.
+        :param idle_timeout: Seconds a kept-alive connection may sit idle before it is closed.
+        Defaults to `CS_FN_HTTP_IDLE_TIMEOUT` or 5.
+        :param max_requests_per_connection: Number of requests after which a kept-alive connection is closed.
+        0 means no limit. Defaults to `CS_FN_HTTP_MAX_REQUESTS_PER_CONNECTION` or 1000.
+        :param codec: :class:`JSONCodec` with which to decode requests and encode responses.
+        Defaults to the codec named by `CS_FN_JSON_CODEC`, see :func:`get_codec`.
+        :param multipart: :class:`MultipartOptions` governing how uploaded files are received.
+        Defaults to :meth:`MultipartOptions.from_env`.
+        :param metrics_port: Port on which to serve request metrics in the Prometheus text format.
+        0 serves none. Defaults to `CS_FN_METRICS_PORT`, or none.
+        :param admission: :class:`AdmissionOptions` governing how many requests are taken on at once.
+        Defaults to :meth:`AdmissionOptions.from_env`.
+        """
         RunnerBase.__init__(self)
         self._port = int(os.environ.get('PORT', '8081'))
+        if concurrency is None:
+            concurrency = os.environ.get('CS_FN_HTTP_CONCURRENCY', CONCURRENCY_SERIAL)
+        self._concurrency = concurrency.strip().lower()
+        if self._concurrency not in {CONCURRENCY_SERIAL, CONCURRENCY_THREADED, CONCURRENCY_POOL}:
+            raise ValueError(f'unsupported concurrency mode: {concurrency}')
+        if max_in_flight is None:
+            max_in_flight = int(os.environ.get('CS_FN_HTTP_MAX_IN_FLIGHT', '16'))
+        if max_in_flight < 1:
+            raise ValueError(f'max_in_flight must be at least 1, got {max_in_flight}')
+        self._max_in_flight = max_in_flight
+        if backlog is None:
+            backlog = int(os.environ.get('CS_FN_HTTP_BACKLOG', '64'))
+        self._backlog = backlog
+        if processes is None:
+            processes = int(os.environ.get('CS_FN_HTTP_PROCESSES', '1'))
+        if processes == 0:
+            processes = os.cpu_count() or 1
+        if processes < 0:
+            raise ValueError(f'processes must not be negative, got {processes}')
+        if processes > 1 and not hasattr(os, 'fork'):
+            raise ValueError('multiple processes are not supported on this platform')
+        self._processes = processes
+        if keep_alive is None:
+            keep_alive = os.environ.get('CS_FN_HTTP_KEEP_ALIVE', '').strip().lower() in {'1', 'true', 'yes'}
+        self._keep_alive = keep_alive
+        if idle_timeout is None:
+            idle_timeout = float(os.environ.get('CS_FN_HTTP_IDLE_TIMEOUT', '5'))
+        self._idle_timeout = idle_timeout
+        if max_requests_per_connection is None:
+            max_requests_per_connection = int(os.environ.get('CS_FN_HTTP_MAX_REQUESTS_PER_CONNECTION', '1000'))
+        self._max_requests_per_connection = max_requests_per_connection
+        self._codec = codec if codec is not None else get_codec()
+        self._multipart = multipart if multipart is not None else MultipartOptions.from_env()
+        self._metrics_port = metrics_port if metrics_port is not None else metrics_port_from_env()
+        self._in_flight = _InFlight()
+        self._logger = None
+        self._server = None
+        self._supervisor = None
+        self._supervisor_pid = 0
+        self._drain_deadline = 0.0
+        self._unfinished = 0
+        admission = admission if admission is not None else AdmissionOptions.from_env()
+        self._admission = AdmissionController(admission) if admission.max_concurrent > 0 else None
 
     def run(self, *args, **kwargs):
         """Start the HTTP server and listen for requests."""
         logger = kwargs.get('logger', None)
         if logger is None:
-            logger = _new_http_logger()
+            logger = setup_logger()
+        self._logger = logger
+        self._bind_handler(logger)
+        logger.info(f'running at port {self._port} in {self._concurrency} mode')
+        if self._keep_alive and self._concurrency == CONCURRENCY_SERIAL:
+            logger.warning('keep-alive in serial mode lets one idle connection hold up every other caller')
+        self._check_admission(logger)
+        server = self._new_server()
+        self._server = server
+        if self._metrics_port:
+            if self._processes > 1:
+                # Each worker records only the requests it serves itself.
+                logger.warning('metrics are not served when running multiple worker processes')
+            else:
+                start_metrics_server(self.router.metrics, self._metrics_port, logger)
+        if self._processes > 1:
+            logger.info(f'forking {self._processes} worker processes')
+            self._supervisor = _PreforkSupervisor(self._serve, self._processes, logger)
+            self._supervisor_pid = os.getpid()
+            self._supervisor.run()
+        else:
+            self._serve()
+
+    def stop(self, timeout: float) -> bool:
+        """Stop accepting new requests, and return from :meth:`run` once the requests in flight have finished.
+
+        Connections waiting for a request are hung up straight away, and kept-alive connections are closed once
+        their current request has been answered. With multiple worker processes, each worker is asked to stop in
+        turn, and :meth:`run` returns once they have all exited.
+
+        :param timeout: Seconds to wait for the requests in flight to finish, after which :meth:`run` returns anyway.
+        :return: Whether the server is stopping, or False if it is not running.
+        """
+        if self._server is None:
+            return False
+        self._drain_deadline = time.monotonic() + timeout
+        if self._supervisor is not None and os.getpid() == self._supervisor_pid:
+            self._supervisor.stop()
+            return True
+        HTTPRequestHandler.bind_draining(True)
+        self._server.close_idle()
+        # Waits for the serving loop to exit, so it cannot be called from the thread running it.
+        Thread(target=self._server.shutdown, name='cs-fn-shutdown', daemon=True).start()
+        return True
+
+    def unfinished(self) -> int:
+        """Number of requests still in flight when the server stopped, once the timeout given to :meth:`stop` passed."""
+        return self._unfinished
+
+    def _serve(self):
+        # Also runs within each forked worker, which drains only the requests it is handling itself.
+        self._server.serve_forever()
+        self._drain()
+
+    def _drain(self):
+        # Refuse new connections straight away, rather than leaving them in the backlog until the process exits.
+        self._server.socket.close()
+        pending = self._in_flight.count() + self.router.abandoned()
+        if pending > 0:
+            self._logger.info(f'waiting for {pending} requests in flight to finish')
+        # Handlers which overran their deadline were answered already, but may still be doing work worth finishing.
+        self._unfinished = self._in_flight.wait(self._drain_deadline - time.monotonic())
+        self._unfinished += self.router.wait_abandoned(self._drain_deadline - time.monotonic())
+        if self._unfinished > 0:
+            self._logger.warning(f'stopped with {self._unfinished} requests still in flight')
+        else:
+            self._logger.info('stopped')
+
+    def _check_admission(self, logger: Logger):
+        if self._admission is None:
+            return
+        options = self._admission.options
+        if self._concurrency == CONCURRENCY_SERIAL:
+            logger.warning('admission control has no effect in serial mode, as requests are handled one at a time')
+        elif self._concurrency == CONCURRENCY_POOL and options.max_concurrent + options.max_queued >= self._max_in_flight:
+            # Every worker would be taken up by admitted and queued requests, leaving none to turn further requests away.
+            logger.warning(
+                f'admission control sheds no load unless CS_FN_MAX_CONCURRENCY plus CS_FN_MAX_QUEUED '
+                f'({options.max_concurrent + options.max_queued}) is less than max_in_flight ({self._max_in_flight})'
+            )
+
+    def _bind_handler(self, logger: Logger):
         HTTPRequestHandler.bind_logger(logger)
-
         HTTPRequestHandler.bind_router(self.router)
-        logger.info(f'running at port {self._port}')
-        HTTPServer(('', self._port), HTTPRequestHandler).serve_forever()
+        HTTPRequestHandler.bind_codec(self._codec)
+        HTTPRequestHandler.bind_multipart_options(self._multipart)
+        HTTPRequestHandler.bind_connection_settings(
+            keep_alive=self._keep_alive,
+            idle_timeout=self._idle_timeout,
+            max_requests=self._max_requests_per_connection,
+        )
+        HTTPRequestHandler.bind_admission(self._admission)
+        HTTPRequestHandler.bind_in_flight(self._in_flight)
+        HTTPRequestHandler.bind_draining(False)
+        if self._admission is not None:
+            self.router.metrics.track_admission(self._admission)
+
+    def _new_server(self) -> HTTPServer:
+        address = ('', self._port)
+        if self._concurrency == CONCURRENCY_THREADED:
+            return _ThreadingHTTPServer(address, HTTPRequestHandler, self._backlog)
+        if self._concurrency == CONCURRENCY_POOL:
+            return _PooledHTTPServer(address, HTTPRequestHandler, self._backlog, self._max_in_flight)
+        return _HTTPServer(address, HTTPRequestHandler, self._backlog)
 
 
 class HTTPRequestHandler(BaseHTTPRequestHandler):
     """Implements the HTTP request handlers."""
 
+    _codec = None
     _logger = None
     _router = None
+    _max_requests = 0
+    _multipart = MultipartOptions()
+    _admission = None
+    _in_flight = _InFlight()
+    _draining = False
+
+    @staticmethod
+    def bind_admission(admission: Union[AdmissionController, None]):
+        """Set the admission control to which requests are subject, or None to admit every request."""
+        HTTPRequestHandler._admission = admission
+
+    @staticmethod
+    def bind_draining(draining: bool):
+        """Set whether the server is stopping, in which case connections are closed once their request is answered."""
+        HTTPRequestHandler._draining = draining
+
+    @staticmethod
+    def bind_in_flight(in_flight: _InFlight):
+        """Set the counter of requests being handled."""
+        HTTPRequestHandler._in_flight = in_flight
+
+    @staticmethod
+    def bind_codec(codec: JSONCodec):
+        """Set the JSON codec to use."""
+        HTTPRequestHandler._codec = codec
 
     @staticmethod
     def bind_logger(logger: Logger):
         """Set the logger to use."""
         HTTPRequestHandler._logger = logger
 
+    @staticmethod
+    def bind_multipart_options(options: MultipartOptions):
+        """Set how uploaded files are received."""
+        HTTPRequestHandler._multipart = options
+
     @staticmethod
     def bind_router(router: Router):
         """Set the router to use."""
         HTTPRequestHandler._router = router
 
+    @staticmethod
+    def bind_connection_settings(keep_alive: bool, idle_timeout: Union[float, None], max_requests: int):
+        """Set how connections are managed.
+
+        :param keep_alive: Whether to speak HTTP/1.1 and keep connections open between requests.
+        :param idle_timeout: Seconds a kept-alive connection may sit idle, or wait on a slow caller, before it is
+        closed. Ignored without keep-alive, in which case connections are given as long as they need.
+        :param max_requests: Number of requests after which a kept-alive connection is closed. 0 means no limit.
+        """
+        HTTPRequestHandler.protocol_version = 'HTTP/1.1' if keep_alive else 'HTTP/1.0'
+        HTTPRequestHandler.timeout = idle_timeout if keep_alive else None
+        HTTPRequestHandler._max_requests = max_requests
+
+    def setup(self):
+        """Prepare to serve a new connection."""
+        BaseHTTPRequestHandler.setup(self)
+        self._requests_served = 0
+        accepted_at = getattr(self.server, 'accepted_at', None)
+        self._accepted = accepted_at(self.request) if accepted_at is not None else None
+
+    def handle_one_request(self):
+        """Wait for the next request on the connection, then serve it."""
+        self.server.note_idle(self.request)
+        BaseHTTPRequestHandler.handle_one_request(self)
+
+    def parse_request(self) -> bool:
+        """Parse the request line and headers, once the request has started to arrive."""
+        self.server.note_busy(self.request)
+        return BaseHTTPRequestHandler.parse_request(self)
+
     def do_DELETE(self):
         """Execute on HTTP DELETE."""
         self._exec_request()
@@ -91,105 +563,122 @@ class HTTPRequestHandler(BaseHTTPRequestHandler):
         self._exec_request()
 
     def _exec_request(self):
+        with HTTPRequestHandler._in_flight:
+            self._admit_request()
+
+    def _admit_request(self):
         HTTPRequestHandler._logger.info('received request')
-        req = self._read_request()
-        ctx_request.set(req)
+        admission = HTTPRequestHandler._admission
+        if admission is None:
+            self._serve_request()
+            return
+        # The first request on a connection has been waiting since the connection was accepted.
+        arrived = self._accepted if self._requests_served == 0 else None
+        result = admission.acquire(arrived)
+        if result != ADMITTED:
+            self._turn_away(result, admission.options.retry_after)
+            return
+        try:
+            self._serve_request()
+        finally:
+            admission.release()
+
+    def _turn_away(self, result: str, retry_after: int):
+        # Answered without reading the body, so the connection cannot be reused.
+        self.close_connection = True
+        started = time.perf_counter()
+        reason = 'waited too long to be handled' if result == SHED else 'too many requests waiting'
+        resp = Response(
+            errors=[APIError(code=SERVICE_UNAVAILABLE, message=f'Service Unavailable: {reason}')],
+            header={'Retry-After': [str(retry_after)]},
+        )
+        code = self._write_response(Request(), resp)
+        HTTPRequestHandler._router.metrics.observe_request(None, code, write=time.perf_counter() - started)
+
+    def _serve_request(self):
+        metrics = HTTPRequestHandler._router.metrics
+        started = time.perf_counter()
+        try:
+            req = self._read_request()
+        except Exception as e:
+            # Part of the body may still be unread, so the connection cannot be reused.
+            self.close_connection = True
+            HTTPRequestHandler._logger.warning(f'failed to read request: {e}')
+            if isinstance(e, FDKException):
+                error = APIError(code=e.code, message=e.message)
+            else:
+                error = APIError(code=BAD_REQUEST, message='Bad Request')
+            read_done = time.perf_counter()
+            code = self._write_response(Request(), Response(errors=[error]))
+            metrics.observe_request(None, code, read=read_done - started, write=time.perf_counter() - read_done)
+            return
+
+        # Reset once done, so a pooled worker thread never carries one request's context into the next.
+        token = ctx_request.set(req)
         try:
-            resp = HTTPRequestHandler._router.route(req, logger=HTTPRequestHandler._logger)
-        except FDKException as fe:
-            resp = Response(errors=[APIError(code=fe.code, message=fe.message)])
-        self._write_response(req, resp)
+            read_done = time.perf_counter()
+            try:
+                resp = HTTPRequestHandler._router.route(req, logger=HTTPRequestHandler._logger)
+            except FDKException as fe:
+                resp = Response(errors=[APIError(code=fe.code, message=fe.message)])
+            except Exception:
+                HTTPRequestHandler._logger.exception('handler failed')
+                resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message='Internal Server Error')])
+            handler_done = time.perf_counter()
+            code = self._write_response(req, resp)
+            metrics.observe_request(
+                req, code,
+                read=read_done - started,
+                handler=handler_done - read_done,
+                write=time.perf_counter() - handler_done,
+            )
+        finally:
+            ctx_request.reset(token)
+            close_files(req)
 
     def _read_request(self) -> Request:
         content_type = self.headers.get('Content-Type', 'application/json')
         if not self.rfile.closed:
             if content_type.startswith('multipart/form-data'):
-                payload = self._read_multipart_request()
-            else:
-                payload = self._read_json_request()
-            return dict_to_request(payload)
+                return dict_to_request(self._read_multipart_request())
+            body = self._read_body()
+            req = dict_to_request(HTTPRequestHandler._codec.loads(body))
+            req.raw_body = memoryview(body).toreadonly()
+            return req
         return dict_to_request('')
 
-    def _read_json_request(self) -> dict:
+    def _read_body(self) -> bytearray:
+        # Read straight into a buffer of the final size, so the body is held in memory only once.
         content_len = int(self.headers.get('Content-Length', 0))
-        payload = self.rfile.read(content_len).decode('utf-8').strip()
-        payload = json.loads(payload)
-        return payload
+        body = bytearray(content_len)
+        view = memoryview(body)
+        read = 0
+        while read < content_len:
+            n = self.rfile.readinto(view[read:])
+            if not n:
+                raise ValueError(f'request body ended after {read} of {content_len} bytes')
+            read += n
+        view.release()
+        return body
 
     def _read_multipart_request(self) -> dict:
-        body = {}
-        files = {}
-        req = {}
-
-        def on_field(field):
-            nonlocal body, req
-            fname = field.field_name.decode('utf-8').strip()
-            if fname == 'meta':
-                value = field.value
-                req = json.loads(value.decode('utf-8').strip())
-            elif fname == 'body':
-                value = field.value
-                body = json.loads(value.decode('utf-8').strip())
-
-        def on_file(file):
-            nonlocal files  # noqa: F824
-            # Offset will currently be at the end of the buffer.
-            # Need to reset it to the beginning so we can read it.
-            file.file_object.seek(0)
-            files[file.file_name.decode('utf-8')] = file.file_object.read(-1)
-
-        python_multipart.parse_form(self.headers, self.rfile, on_field=on_field, on_file=on_file)
-
-        req['body'] = body
-        req['files'] = files
-        return req
-
-    def _write_response(self, req: Request, resp: Union[Response, None]):
-        if resp is None or not isinstance(resp, Response):
-            msg = f'Object is not of type {Response.__base__.__name__}. Got {type(resp)} instead.'
-            resp = Response(errors=[APIError(code=INTERNAL_SERVER_ERROR, message=msg)])
-
-        if resp.code == 0 and resp.errors is not None and len(resp.errors) > 0:
-            for e in resp.errors:
-                e_code = e.code
-                if type(e_code) is not int and e_code is not None:
-                    e_code = int(e_code)
-                if type(e_code) is int and 100 <= e.code and resp.code < e.code < 600:
-                    resp.code = e_code
-
-        resp.header = self._resp_headers(req, resp)
-        payload_dict = response_to_dict(resp)
-        payload = json.dumps(payload_dict)
-
-        self.send_response(resp.code)
+        return read_multipart_payload(
+            self.headers, self.rfile, HTTPRequestHandler._codec, HTTPRequestHandler._multipart,
+        )
+
+    def _write_response(self, req: Request, resp: Union[Response, None]) -> int:
+        code, headers, payload = prepare_response(req, resp, HTTPRequestHandler._codec)
+
+        self.send_response(code)
         self.send_header('Content-Length', str(len(payload)))
         self.send_header('Content-Type', 'application/json')
-        for k, v in resp.header.items():
+        for k, v in headers.items():
             self.send_header(k, v)
+        self._requests_served += 1
+        if HTTPRequestHandler._draining or 0 < HTTPRequestHandler._max_requests <= self._requests_served:
+            # Also marks the connection to be closed once this response is written.
+            self.send_header('Connection', 'close')
         self.end_headers()
-        self.wfile.write(payload.encode('utf-8'))
-
-    def _resp_headers(self, req: Request, resp: Response):
-        headers = {}
-        if resp.header is not None and len(resp.header) > 0:
-            for k, v in resp.header.items():
-                if v is None or len(v) == 0:
-                    continue
-                headers[canonize_header(k)] = v
-
-        if req.params is None or req.params.header is None or len(req.params.header) == 0:
-            return headers
-
-        req_header = req.params.header
-        self._take_header('X-Cs-Executionid', req_header, headers)
-        self._take_header('X-Cs-Origin', req_header, headers)
-        self._take_header('X-Cs-Traceid', req_header, headers)
-
-        headers = {k: ';'.join(v) for k, v in headers}
-        return headers
-
-    def _take_header(self, key: str, src_header: Dict[str, List[str]], dst_header: Dict[str, List[str]]):
-        value = src_header.get(key, [])
-        if len(value) == 0:
-            return
-        dst_header[key] = value
+        if self.command != 'HEAD':
+            self.wfile.write(payload)
+        return code
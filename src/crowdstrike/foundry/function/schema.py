@@ -0,0 +1,444 @@
+"""JSON Schema validation for CrowdStrike Foundry Function FDK."""
+import os
+import random
+import re
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Union
+from crowdstrike.foundry.function.codec import get_codec
+
+# Checks a value, appending a message for each violation to the list, given the location of the value.
+_Check = Callable[[Any, str, List[str]], None]
+
+# At most this many violations are reported for a value.
+MAX_ERRORS = 10
+
+_TYPES: Dict[str, Callable[[Any], bool]] = {
+    'array': lambda v: isinstance(v, list),
+    'boolean': lambda v: isinstance(v, bool),
+    'integer': lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    'null': lambda v: v is None,
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'object': lambda v: isinstance(v, dict),
+    'string': lambda v: isinstance(v, str),
+}
+
+# Keywords which only describe a value, and so need no checking.
+_ANNOTATIONS = {
+    '$comment', '$id', '$schema', 'contentEncoding', 'contentMediaType', 'default', 'deprecated', 'description',
+    'examples', 'format', 'readOnly', 'title', 'writeOnly',
+}
+
+
+@dataclass
+class ValidationOptions:
+    """Defines how often handlers' responses are validated against their response schemas."""
+
+    # Fraction of responses to validate, from 0 to 1.
+    response_sample_rate: float = field(default=1.0)
+
+    @staticmethod
+    def from_env() -> 'ValidationOptions':
+        """Read the options from the environment.
+
+        :return: Options given by `CS_FN_VALIDATE_RESPONSE_RATE`, with defaults for any not provided.
+        """
+        defaults = ValidationOptions()
+        return ValidationOptions(
+            response_sample_rate=float(os.environ.get('CS_FN_VALIDATE_RESPONSE_RATE', defaults.response_sample_rate)),
+        )
+
+
+class Validator:
+    """Validates values against a JSON Schema, compiled once into a tree of checks.
+
+    The following keywords are supported, and any other keyword which is not an annotation raises a
+    :class:`ValueError` rather than being ignored:
+
+    * `type`, `enum` and `const`.
+    * `properties`, `required`, `additionalProperties`, `minProperties` and `maxProperties` for objects.
+    * `items`, `prefixItems`, `minItems`, `maxItems` and `uniqueItems` for arrays.
+    * `minLength`, `maxLength` and `pattern` for strings.
+    * `minimum`, `maximum`, `exclusiveMinimum`, `exclusiveMaximum` and `multipleOf` for numbers.
+    * `allOf`, `anyOf`, `oneOf` and `not`.
+    * `$ref` to definitions within the same schema, such as `#/$defs/host`.
+
+    Annotations such as `title`, `description` and `format` are accepted but not checked.
+    """
+
+    def __init__(self, schema: Union[Dict[str, Any], bool]):
+        """Compile a schema.
+
+        :param schema: JSON Schema, as decoded from JSON.
+        :raise ValueError: Unsupported or malformed schema.
+        """
+        self.schema = schema
+        self._refs: Dict[str, _Check] = {}
+        self._check = self._compile(schema, schema)
+
+    def errors(self, value: Any) -> List[str]:
+        """Check a value against the schema.
+
+        :param value: Value to check.
+        :return: Description of each violation found, up to :data:`MAX_ERRORS`, prefixed by its location within the
+        value. Empty if the value is valid.
+        """
+        errors = []
+        self._check(value, '$', errors)
+        return errors[:MAX_ERRORS]
+
+    def _compile(self, schema: Union[Dict[str, Any], bool], root: Dict[str, Any]) -> _Check:
+        if schema is True or schema == {}:
+            return _accept
+        if schema is False:
+            return _reject
+        if not isinstance(schema, dict):
+            raise ValueError(f'schema must be an object or boolean, got {type(schema).__name__}')
+
+        checks: List[_Check] = []
+        for keyword, arg in schema.items():
+            if keyword in _ANNOTATIONS or keyword in {'$defs', 'definitions'}:
+                continue
+            compile_keyword = _KEYWORDS.get(keyword, None)
+            if compile_keyword is None:
+                raise ValueError(f'unsupported schema keyword: {keyword}')
+            checks.append(compile_keyword(self, arg, schema, root))
+
+        if not checks:
+            return _accept
+        if len(checks) == 1:
+            return checks[0]
+
+        def check_all(value, at, errors):
+            for check in checks:
+                check(value, at, errors)
+        return check_all
+
+    def _compile_ref(self, ref: str, root: Dict[str, Any]) -> _Check:
+        if ref in self._refs:
+            return self._refs[ref]
+        if ref != '#' and not ref.startswith('#/'):
+            raise ValueError(f'unsupported schema reference: {ref}')
+        target = root
+        for part in ref[2:].split('/') if ref != '#' else []:
+            part = part.replace('~1', '/').replace('~0', '~')
+            if not isinstance(target, dict) or part not in target:
+                raise ValueError(f'unresolved schema reference: {ref}')
+            target = target[part]
+
+        # Registered before compiling, so recursive schemas refer back to the check being compiled.
+        compiled: List[_Check] = []
+        self._refs[ref] = lambda value, at, errors: compiled[0](value, at, errors)
+        compiled.append(self._compile(target, root))
+        return self._refs[ref]
+
+
+def _accept(value, at, errors):
+    pass
+
+
+def _reject(value, at, errors):
+    errors.append(f'{at}: not allowed')
+
+
+def _compile_type(v: Validator, arg, schema, root) -> _Check:
+    names = arg if isinstance(arg, list) else [arg]
+    for name in names:
+        if name not in _TYPES:
+            raise ValueError(f'unsupported schema type: {name}')
+    tests = [_TYPES[name] for name in names]
+    expected = ' or '.join(names)
+
+    if len(tests) == 1:
+        test = tests[0]
+
+        def check_type(value, at, errors):
+            if not test(value):
+                errors.append(f'{at}: expected {expected}')
+        return check_type
+
+    def check_types(value, at, errors):
+        for test in tests:
+            if test(value):
+                return
+        errors.append(f'{at}: expected {expected}')
+    return check_types
+
+
+def _compile_enum(v: Validator, arg, schema, root) -> _Check:
+    allowed = list(arg)
+
+    def check_enum(value, at, errors):
+        for a in allowed:
+            if _equal(value, a):
+                return
+        errors.append(f'{at}: must be one of {get_codec().dumps(allowed).decode("utf-8")}')
+    return check_enum
+
+
+def _compile_const(v: Validator, arg, schema, root) -> _Check:
+    def check_const(value, at, errors):
+        if not _equal(value, arg):
+            errors.append(f'{at}: must be {get_codec().dumps(arg).decode("utf-8")}')
+    return check_const
+
+
+def _compile_properties(v: Validator, arg, schema, root) -> _Check:
+    properties = {name: v._compile(s, root) for name, s in arg.items()}
+    additional = schema.get('additionalProperties', True)
+    extra = v._compile(additional, root) if additional is not True else None
+
+    def check_properties(value, at, errors):
+        if not isinstance(value, dict):
+            return
+        for name, item in value.items():
+            check = properties.get(name, None)
+            if check is not None:
+                check(item, f'{at}.{name}', errors)
+            elif extra is not None:
+                extra(item, f'{at}.{name}', errors)
+    return check_properties
+
+
+def _compile_additional(v: Validator, arg, schema, root) -> _Check:
+    if 'properties' in schema:
+        # Compiled along with `properties`, as it applies to the properties not named there.
+        return _accept
+    extra = v._compile(arg, root)
+
+    def check_additional(value, at, errors):
+        if isinstance(value, dict):
+            for name, item in value.items():
+                extra(item, f'{at}.{name}', errors)
+    return check_additional
+
+
+def _compile_required(v: Validator, arg, schema, root) -> _Check:
+    required = list(arg)
+
+    def check_required(value, at, errors):
+        if isinstance(value, dict):
+            for name in required:
+                if name not in value:
+                    errors.append(f'{at}: missing required property {name}')
+    return check_required
+
+
+def _compile_items(v: Validator, arg, schema, root) -> _Check:
+    prefix = [v._compile(s, root) for s in schema.get('prefixItems', [])]
+    items = v._compile(arg, root) if arg is not None else None
+
+    def check_items(value, at, errors):
+        if not isinstance(value, list):
+            return
+        for i, item in enumerate(value):
+            if i < len(prefix):
+                prefix[i](item, f'{at}[{i}]', errors)
+            elif items is not None:
+                items(item, f'{at}[{i}]', errors)
+    return check_items
+
+
+def _compile_prefix_items(v: Validator, arg, schema, root) -> _Check:
+    if 'items' in schema:
+        # Compiled along with `items`, which applies to the items beyond these.
+        return _accept
+    return _compile_items(v, None, schema, root)
+
+
+def _compile_unique_items(v: Validator, arg, schema, root) -> _Check:
+    if not arg:
+        return _accept
+
+    def check_unique(value, at, errors):
+        if not isinstance(value, list):
+            return
+        for i in range(len(value)):
+            for j in range(i):
+                if _equal(value[i], value[j]):
+                    errors.append(f'{at}: items must be unique')
+                    return
+    return check_unique
+
+
+def _compile_bound(kind: Callable[[Any], bool], measure: Callable[[Any], Any], compare: Callable[[Any, Any], bool],
+                   message: str):
+    def compile_bound(v: Validator, arg, schema, root) -> _Check:
+        def check_bound(value, at, errors):
+            if kind(value) and not compare(measure(value), arg):
+                errors.append(f'{at}: {message} {arg}')
+        return check_bound
+    return compile_bound
+
+
+def _compile_pattern(v: Validator, arg, schema, root) -> _Check:
+    pattern = re.compile(arg)
+
+    def check_pattern(value, at, errors):
+        if isinstance(value, str) and pattern.search(value) is None:
+            errors.append(f'{at}: must match {arg}')
+    return check_pattern
+
+
+def _compile_multiple_of(v: Validator, arg, schema, root) -> _Check:
+    def check_multiple(value, at, errors):
+        if _TYPES['number'](value):
+            quotient = value / arg
+            if abs(quotient - round(quotient)) > 1e-9:
+                errors.append(f'{at}: must be a multiple of {arg}')
+    return check_multiple
+
+
+def _compile_all_of(v: Validator, arg, schema, root) -> _Check:
+    checks = [v._compile(s, root) for s in arg]
+
+    def check_all_of(value, at, errors):
+        for check in checks:
+            check(value, at, errors)
+    return check_all_of
+
+
+def _compile_any_of(v: Validator, arg, schema, root) -> _Check:
+    checks = [v._compile(s, root) for s in arg]
+
+    def check_any_of(value, at, errors):
+        for check in checks:
+            if _passes(check, value, at):
+                return
+        errors.append(f'{at}: must match at least one schema of anyOf')
+    return check_any_of
+
+
+def _compile_one_of(v: Validator, arg, schema, root) -> _Check:
+    checks = [v._compile(s, root) for s in arg]
+
+    def check_one_of(value, at, errors):
+        matched = sum(1 for check in checks if _passes(check, value, at))
+        if matched != 1:
+            errors.append(f'{at}: must match exactly one schema of oneOf, matched {matched}')
+    return check_one_of
+
+
+def _compile_not(v: Validator, arg, schema, root) -> _Check:
+    check = v._compile(arg, root)
+
+    def check_not(value, at, errors):
+        if _passes(check, value, at):
+            errors.append(f'{at}: must not match schema of not')
+    return check_not
+
+
+def _compile_ref(v: Validator, arg, schema, root) -> _Check:
+    return v._compile_ref(arg, root)
+
+
+def _passes(check: _Check, value, at: str) -> bool:
+    errors = []
+    check(value, at, errors)
+    return not errors
+
+
+def _equal(a, b) -> bool:
+    # JSON equality, under which booleans are not numbers.
+    if isinstance(a, bool) or isinstance(b, bool):
+        return type(a) is type(b) and a == b
+    return a == b
+
+
+def _is_number(value) -> bool:
+    return _TYPES['number'](value)
+
+
+def _identity(value):
+    return value
+
+
+_KEYWORDS: Dict[str, Callable[[Validator, Any, Dict[str, Any], Dict[str, Any]], _Check]] = {
+    '$ref': _compile_ref,
+    'additionalProperties': _compile_additional,
+    'allOf': _compile_all_of,
+    'anyOf': _compile_any_of,
+    'const': _compile_const,
+    'enum': _compile_enum,
+    'exclusiveMaximum': _compile_bound(_is_number, _identity, lambda n, bound: n < bound, 'must be less than'),
+    'exclusiveMinimum': _compile_bound(_is_number, _identity, lambda n, bound: n > bound, 'must be greater than'),
+    'items': _compile_items,
+    'maxItems': _compile_bound(_TYPES['array'], len, lambda n, bound: n <= bound, 'must have at most items:'),
+    'maxLength': _compile_bound(_TYPES['string'], len, lambda n, bound: n <= bound, 'must have at most characters:'),
+    'maxProperties': _compile_bound(_TYPES['object'], len, lambda n, bound: n <= bound,
+                                    'must have at most properties:'),
+    'maximum': _compile_bound(_is_number, _identity, lambda n, bound: n <= bound, 'must be at most'),
+    'minItems': _compile_bound(_TYPES['array'], len, lambda n, bound: n >= bound, 'must have at least items:'),
+    'minLength': _compile_bound(_TYPES['string'], len, lambda n, bound: n >= bound, 'must have at least characters:'),
+    'minProperties': _compile_bound(_TYPES['object'], len, lambda n, bound: n >= bound,
+                                    'must have at least properties:'),
+    'minimum': _compile_bound(_is_number, _identity, lambda n, bound: n >= bound, 'must be at least'),
+    'multipleOf': _compile_multiple_of,
+    'not': _compile_not,
+    'oneOf': _compile_one_of,
+    'pattern': _compile_pattern,
+    'prefixItems': _compile_prefix_items,
+    'properties': _compile_properties,
+    'required': _compile_required,
+    'type': _compile_type,
+    'uniqueItems': _compile_unique_items,
+}
+
+
+def load_schema(schema: Union[str, Dict[str, Any]], base_dir: str = '') -> Dict[str, Any]:
+    """Load a schema, unless already given one.
+
+    :param schema: JSON Schema, or the path of a file holding one.
+    :param base_dir: Directory against which a relative path is resolved.
+    :return: The schema.
+    :raise OSError: The file could not be read.
+    :raise ValueError: The file does not hold JSON.
+    """
+    if not isinstance(schema, str):
+        return schema
+    path = schema if os.path.isabs(schema) or base_dir == '' else os.path.join(base_dir, schema)
+    with open(path, 'rb') as fd:
+        return get_codec().loads(fd.read())
+
+
+class RouteSchemas:
+    """Validates the request bodies of a route, and a sample of its successful response bodies."""
+
+    def __init__(
+            self,
+            request: Union[Validator, None] = None,
+            response: Union[Validator, None] = None,
+            options: Union[ValidationOptions, None] = None,
+    ):
+        """Initialize the route's schemas.
+
+        :param request: :class:`Validator` for request bodies, if any.
+        :param response: :class:`Validator` for response bodies, if any.
+        :param options: :class:`ValidationOptions` governing how many responses are validated.
+        Defaults to :meth:`ValidationOptions.from_env`.
+        """
+        self.request = request
+        self.response = response
+        self.options = options if options is not None else ValidationOptions.from_env()
+
+    def request_errors(self, body: Any) -> List[str]:
+        """Check a request body.
+
+        :param body: Request body.
+        :return: Violations of the request schema, or an empty list if valid or there is no request schema.
+        """
+        return self.request.errors(body) if self.request is not None else []
+
+    def response_errors(self, code: int, body: Any) -> List[str]:
+        """Check a successful response body, if it is among those sampled.
+
+        :param code: Status code of the response. Only 2xx responses are checked.
+        :param body: Response body.
+        :return: Violations of the response schema, or an empty list if valid, not sampled or there is no response
+        schema.
+        """
+        if self.response is None or not 200 <= code < 300:
+            return []
+        rate = self.options.response_sample_rate
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return []
+        return self.response.errors(body)
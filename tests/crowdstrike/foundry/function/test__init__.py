@@ -40,6 +40,16 @@ def do_request3(req, config, logger):
     )
 
 
+async def do_request_async(req, config):
+    return Response(
+        body={
+            'config': config,
+            'req': req.body,
+        },
+        code=200,
+    )
+
+
 class TestRequestLifecycle(TestCase):
     def setUp(self):
         config = {'a': 'b'}
@@ -59,6 +69,11 @@ class TestRequestLifecycle(TestCase):
             path='/request3',
             func=do_request3,
         ))
+        router.register(Route(
+            method='POST',
+            path='/request-async',
+            func=do_request_async,
+        ))
         self.runner = CapturingRunner()
         self.runner.bind_router(router)
         self.function = Function(
@@ -122,6 +137,22 @@ class TestRequestLifecycle(TestCase):
             'actual body differs from expected body'
         )
 
+    def test_request_async(self):
+        req = Request(
+            body={'hello': 'world'},
+            method='POST',
+            url='/request-async',
+        )
+        self.function.run(req)
+        resp = self.runner.response
+        self.assertIsNotNone(resp, 'response is none')
+        self.assertEqual(200, resp.code, f'expected response of 200 but got {resp.code}')
+        self.assertDictEqual(
+            {'config': {'a': 'b'}, 'req': {'hello': 'world'}},
+            resp.body,
+            'actual body differs from expected body'
+        )
+
     def test_unknown_endpoint(self):
         with self.assertRaisesRegex(FDKException, "Not Found: GET /xyz"):
             req = Request(
@@ -140,6 +171,13 @@ class TestRequestLifecycle(TestCase):
             )
             self.function.run(req)
 
+    def test_metrics(self):
+        self.assertEqual({}, self.function.metrics())
+        self.runner.router.metrics.observe_request(Request(method='POST', route='/request1'), 200, handler=0.001)
+        metrics = self.function.metrics()
+        self.assertEqual(1, metrics['POST /request1']['requests'])
+        self.assertEqual(1, metrics['POST /request1']['phases']['handler']['count'])
+
 
 class TestCloud(TestCase):
 
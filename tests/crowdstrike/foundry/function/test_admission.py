@@ -0,0 +1,71 @@
+import os
+import time
+from threading import Thread
+from unittest import main, TestCase
+from unittest.mock import patch
+from crowdstrike.foundry.function.admission import ADMITTED, REJECTED, SHED, AdmissionController, AdmissionOptions
+from crowdstrike.foundry.function.metrics import Metrics
+
+if __name__ == '__main__':
+    main()
+
+
+class TestAdmissionOptions(TestCase):
+
+    def test_from_env(self):
+        env = {'CS_FN_MAX_CONCURRENCY': '8', 'CS_FN_MAX_QUEUED': '16', 'CS_FN_MAX_QUEUE_AGE_MS': '250',
+               'CS_FN_RETRY_AFTER': '3'}
+        with patch.dict(os.environ, env):
+            options = AdmissionOptions.from_env()
+        self.assertEqual(AdmissionOptions(max_concurrent=8, max_queued=16, max_queue_age=0.25, retry_after=3), options)
+
+    def test_invalid(self):
+        with self.assertRaisesRegex(ValueError, 'max_queued must not be negative'):
+            AdmissionController(AdmissionOptions(max_concurrent=1, max_queued=-1))
+
+
+class TestAdmissionController(TestCase):
+
+    def test_rejects_beyond_queue(self):
+        admission = AdmissionController(AdmissionOptions(max_concurrent=1, max_queued=1))
+        self.assertEqual(ADMITTED, admission.acquire())
+
+        results = []
+        waiter = Thread(target=lambda: results.append(admission.acquire()))
+        waiter.start()
+        while admission.stats()['queued'] == 0:
+            time.sleep(0.001)
+        self.assertEqual(REJECTED, admission.acquire())
+
+        admission.release()
+        waiter.join(5)
+        self.assertEqual([ADMITTED], results)
+        admission.release()
+        self.assertEqual({'admitted': 2, 'rejected': 1, 'shed': 0, 'active': 0, 'queued': 0}, admission.stats())
+
+    def test_sheds_old_requests(self):
+        admission = AdmissionController(AdmissionOptions(max_concurrent=1, max_queued=4, max_queue_age=0.05))
+        self.assertEqual(ADMITTED, admission.acquire())
+        start = time.monotonic()
+        self.assertEqual(SHED, admission.acquire())
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        # Requests which arrived too long ago are shed even when there is room for them.
+        admission.release()
+        self.assertEqual(SHED, admission.acquire(arrived=time.monotonic() - 1))
+        self.assertEqual({'admitted': 1, 'rejected': 0, 'shed': 2, 'active': 0, 'queued': 0}, admission.stats())
+
+    def test_metrics(self):
+        metrics = Metrics()
+        self.assertEqual({}, metrics.admission_stats())
+        self.assertNotIn('cs_fn_admission_requests_total', metrics.render())
+
+        admission = AdmissionController(AdmissionOptions(max_concurrent=1))
+        metrics.track_admission(admission)
+        admission.acquire()
+        admission.acquire()
+        text = metrics.render()
+        self.assertIn('cs_fn_admission_requests_total{result="admitted"} 1\n', text)
+        self.assertIn('cs_fn_admission_requests_total{result="rejected"} 1\n', text)
+        self.assertIn('cs_fn_admission_requests_total{result="shed"} 0\n', text)
+        self.assertIn('cs_fn_requests_active 1\n', text)
+        self.assertIn('cs_fn_requests_queued 0\n', text)
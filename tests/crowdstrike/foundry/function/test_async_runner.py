@@ -0,0 +1,254 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from socket import create_connection, socket
+from threading import Thread
+from unittest import main, TestCase
+from unittest.mock import patch
+from crowdstrike.foundry.function import Response
+from crowdstrike.foundry.function.context import ctx_request
+from crowdstrike.foundry.function.multipart import MultipartOptions
+from crowdstrike.foundry.function.router import Route, Router
+from crowdstrike.foundry.function.runner_async import AsyncHTTPRunner
+from tests.crowdstrike.foundry.function.utils import NullLogger, multipart_body, wait_for_metrics
+
+if __name__ == '__main__':
+    main()
+
+
+async def do_async(req):
+    await asyncio.sleep(0.5)
+    return Response(
+        body={
+            'req': req.body,
+            'ctx_trace_id': ctx_request.get().trace_id,
+        },
+        code=200,
+    )
+
+
+def do_upload(req):
+    return Response(body={'files': {name: len(content) for name, content in req.files.items()}}, code=200)
+
+
+def do_sync(req, config):
+    return Response(
+        body={
+            'config': config,
+            'ctx_trace_id': ctx_request.get().trace_id,
+        },
+        code=200,
+    )
+
+
+class TestAsyncHTTPRunner(TestCase):
+
+    def setUp(self):
+        router = Router({'a': 'b'})
+        router.register(Route(
+            method='POST',
+            path='/async',
+            func=do_async,
+        ))
+        router.register(Route(
+            method='POST',
+            path='/sync',
+            func=do_sync,
+        ))
+        router.register(Route(
+            method='POST',
+            path='/upload',
+            func=do_upload,
+        ))
+        with patch.dict(os.environ, {'PORT': '0'}):
+            self.runner = AsyncHTTPRunner(max_workers=2, multipart=MultipartOptions(max_total_size=512 * 1024))
+        self.runner.bind_router(router)
+        self.runner._logger = NullLogger()
+
+        self.loop = asyncio.new_event_loop()
+        self.server = self.loop.run_until_complete(self.runner._start_server())
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.thread = Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.loop.call_soon_threadsafe(self.server.close)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.runner._executor.shutdown()
+
+    def post(self, payload: dict):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('POST', '/', body=json.dumps(payload), headers={'Content-Type': 'application/json'})
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def test_async_handlers_overlap(self):
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                lambda i: self.post({'method': 'POST', 'url': '/async', 'body': {'i': i}, 'trace_id': str(i)}),
+                range(4),
+            ))
+        elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 1.5, f'async handlers appear to have run serially, took {elapsed:.2f}s')
+        for i, (status, body) in enumerate(results):
+            self.assertEqual(200, status)
+            self.assertDictEqual({'req': {'i': i}, 'ctx_trace_id': str(i)}, body['body'])
+
+    def test_sync_handler_runs_in_executor(self):
+        status, body = self.post({'method': 'POST', 'url': '/sync', 'trace_id': 'xyz'})
+        self.assertEqual(200, status)
+        self.assertDictEqual({'config': {'a': 'b'}, 'ctx_trace_id': 'xyz'}, body['body'])
+
+    def test_unknown_endpoint(self):
+        status, body = self.post({'method': 'GET', 'url': '/xyz'})
+        self.assertEqual(404, status)
+        self.assertEqual([{'code': 404, 'message': 'Not Found: GET /xyz'}], body['errors'])
+
+    @staticmethod
+    def read_all(sock) -> bytes:
+        data = b''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return data
+            data += chunk
+
+    def send_raw(self, data: bytes) -> bytes:
+        with create_connection(('127.0.0.1', self.port), timeout=10) as sock:
+            sock.sendall(data)
+            return self.read_all(sock)
+
+    def test_head_has_no_body(self):
+        payload = json.dumps({'method': 'POST', 'url': '/sync', 'trace_id': 'xyz'}).encode('utf-8')
+        # Read off the socket, as http.client would not read a body after HEAD even if one were sent.
+        data = self.send_raw(b'HEAD / HTTP/1.1\r\nContent-Length: %d\r\n\r\n%s' % (len(payload), payload))
+        head, _, body = data.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 '), head)
+        self.assertEqual(b'', body)
+        length = [line for line in head.split(b'\r\n') if line.startswith(b'Content-Length: ')]
+        self.assertEqual(1, len(length))
+        self.assertGreater(int(length[0].split(b': ')[1]), 0)
+
+    def test_transfer_encoding_rejected(self):
+        for coding, expected in [('chunked', 411), ('gzip, chunked', 411), ('gzip', 501)]:
+            with self.subTest(coding=coding):
+                data = self.send_raw(
+                    b'POST / HTTP/1.1\r\nTransfer-Encoding: %s\r\n\r\n5\r\nhello\r\n0\r\n\r\n' % coding.encode())
+                self.assertTrue(data.startswith(b'HTTP/1.1 %d ' % expected), data)
+
+    def test_expect_continue(self):
+        payload = json.dumps({'method': 'POST', 'url': '/sync', 'trace_id': 'xyz'}).encode('utf-8')
+        with create_connection(('127.0.0.1', self.port), timeout=10) as sock:
+            sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: %d\r\nExpect: 100-continue\r\n\r\n' % len(payload))
+            interim = b''
+            while not interim.endswith(b'\r\n\r\n'):
+                chunk = sock.recv(1)
+                self.assertNotEqual(b'', chunk, interim)
+                interim += chunk
+            self.assertEqual(b'HTTP/1.1 100 Continue\r\n\r\n', interim)
+            sock.sendall(payload)
+            data = self.read_all(sock)
+        head, _, body = data.partition(b'\r\n\r\n')
+        self.assertTrue(head.startswith(b'HTTP/1.1 200 '), head)
+        self.assertEqual('xyz', json.loads(body)['body']['ctx_trace_id'])
+
+    def test_too_many_headers(self):
+        headers = b''.join(b'X-Header-%d: %d\r\n' % (i, i) for i in range(101))
+        data = self.send_raw(b'POST / HTTP/1.1\r\n%s\r\n' % headers)
+        self.assertTrue(data.startswith(b'HTTP/1.1 431 '), data)
+
+    def upload(self, files: dict, content_length: int = None):
+        content_type, body = multipart_body(meta={'method': 'POST', 'url': '/upload'}, body={}, files=files)
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.putrequest('POST', '/')
+            conn.putheader('Content-Type', content_type)
+            conn.putheader('Content-Length', str(content_length if content_length is not None else len(body)))
+            conn.endheaders(body if content_length is None else None)
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def test_multipart_upload(self):
+        status, body = self.upload({'a.bin': b'x' * 200000, 'b.txt': b'hello'})
+        self.assertEqual(200, status)
+        self.assertEqual({'a.bin': 200000, 'b.txt': 5}, body['body']['files'])
+
+    def test_multipart_too_large(self):
+        # Rejected from the declared length alone, without the body ever being sent.
+        status, body = self.upload({}, content_length=1024 * 1024)
+        self.assertEqual(413, status)
+        self.assertEqual([{'code': 413, 'message': 'Payload Too Large: request exceeds 524288 bytes'}], body['errors'])
+
+    def test_metrics(self):
+        self.post({'method': 'POST', 'url': '/sync'})
+        self.post({'method': 'GET', 'url': '/xyz'})
+
+        metrics = wait_for_metrics(self.runner.router, 2)
+        self.assertEqual(1, metrics['POST /sync']['requests'])
+        for phase in ['read', 'handler', 'write']:
+            self.assertEqual(1, metrics['POST /sync']['phases'][phase]['count'])
+        self.assertEqual({404: 1}, metrics[' ']['errors'])
+
+
+class TestAsyncHTTPRunnerStop(TestCase):
+
+    def setUp(self):
+        router = Router({})
+        router.register(Route(method='POST', path='/async', func=do_async))
+        with socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        with patch.dict(os.environ, {'PORT': str(self.port)}):
+            self.runner = AsyncHTTPRunner(max_workers=1)
+        self.runner.bind_router(router)
+        self.runner._logger = NullLogger()
+        self.thread = Thread(target=asyncio.run, args=(self.runner._serve(),), daemon=True)
+        self.thread.start()
+        while self.runner._loop is None:
+            time.sleep(0.01)
+        self.addCleanup(self.runner._executor.shutdown)
+
+    def post(self):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('POST', '/', body=json.dumps({'method': 'POST', 'url': '/async', 'body': {'n': 1}}))
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def test_requests_in_flight_finish(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(self.post)
+            while not self.runner._connections:
+                time.sleep(0.01)
+            self.assertTrue(self.runner.stop(5))
+            self.assertEqual(200, slow.result()[0])
+        self.thread.join(5)
+        self.assertFalse(self.thread.is_alive())
+        self.assertEqual(0, self.runner.unfinished())
+        with self.assertRaises(OSError):
+            self.post()
+
+    def test_drain_timeout(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(self.post)
+            while not self.runner._connections:
+                time.sleep(0.01)
+            self.runner.stop(0.05)
+            self.thread.join(5)
+            self.assertEqual(1, self.runner.unfinished())
+            with self.assertRaises(OSError):
+                slow.result()
@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+from contextlib import redirect_stdout
+from io import BytesIO, StringIO
+from socket import socket
+from threading import Thread
+from unittest import main, TestCase
+from crowdstrike.foundry.function import bench
+from crowdstrike.foundry.function.codec import get_codec
+from crowdstrike.foundry.function.multipart import read_multipart_payload
+
+if __name__ == '__main__':
+    main()
+
+BENCH_FUNCTION = '''
+from crowdstrike.foundry.function import Function, Response
+
+func = Function.instance()
+
+
+@func.handler(method='POST', path='/echo')
+def on_echo(request):
+    return Response(body={'items': len(request.body.get('items', [])), 'files': len(request.files)}, code=200)
+
+
+if __name__ == '__main__':
+    func.run()
+'''
+
+
+class TestBuildPayload(TestCase):
+
+    def test_json(self):
+        headers, body = bench.build_payload('json', path='/echo', body_size=640)
+        self.assertEqual('application/json', headers['Content-Type'])
+        payload = json.loads(body)
+        self.assertEqual('/echo', payload['url'])
+        self.assertEqual(10, len(payload['body']['items']))
+
+    def test_headers(self):
+        headers, body = bench.build_payload('headers', header_count=30)
+        self.assertEqual(31, len(headers))
+        self.assertEqual(30, len(json.loads(body)['params']['header']))
+
+    def test_multipart(self):
+        headers, body = bench.build_payload('multipart', path='/echo', file_size=1000)
+        headers['Content-Length'] = str(len(body))
+        payload = read_multipart_payload(headers, BytesIO(body), get_codec('json'))
+        self.assertEqual('/echo', payload['url'])
+        self.assertEqual(1000, len(payload['files']['sample.bin']))
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            bench.build_payload('xml')
+
+
+class TestMicro(TestCase):
+
+    def test_run_micro(self):
+        results = bench.run_micro(number=10, repeat=1)
+        self.assertEqual(['Router.route', 'dict_to_request', 'response_to_dict', 'canonize_header x50'],
+                         list(results))
+        for usec in results.values():
+            self.assertGreater(usec, 0)
+
+
+class TestLoad(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.main = os.path.join(self.tmp.name, 'main.py')
+        with open(self.main, 'w') as fd:
+            fd.write(BENCH_FUNCTION)
+        self.pythonpath = 'PYTHONPATH=' + os.pathsep.join([os.path.abspath('.'), os.path.abspath('src')])
+
+    def run_bench(self, *args) -> dict:
+        out = StringIO()
+        with redirect_stdout(out):
+            status = bench.main(['--json', 'load', self.main, '--env', self.pythonpath, '--path', '/echo', *args])
+        summary = json.loads(out.getvalue())
+        self.assertEqual(0, status, summary)
+        return summary
+
+    def test_load(self):
+        for runner, profile in [('http', 'json'), ('http', 'multipart'), ('async', 'headers')]:
+            with self.subTest(runner=runner, profile=profile):
+                summary = self.run_bench(
+                    '--runner', runner, '--profile', profile, '--file-size', '4096',
+                    '--requests', '40', '--concurrency', '4', '--warmup', '4',
+                )
+                self.assertEqual(40, summary['requests'])
+                self.assertEqual({'200': 40}, summary['statuses'])
+                self.assertGreater(summary['rps'], 0)
+                self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+    def test_malformed_responses_are_failures(self):
+        # Answers every request with something other than HTTP, then hangs up.
+        with socket() as server:
+            server.bind(('127.0.0.1', 0))
+            server.listen(8)
+
+            def serve():
+                for _ in range(3):
+                    conn, _ = server.accept()
+                    with conn:
+                        conn.recv(65536)
+                        conn.sendall(b'garbage\r\n')
+
+            thread = Thread(target=serve, daemon=True)
+            thread.start()
+            result = bench.run_load(server.getsockname()[1], {}, b'{}', requests=3)
+            thread.join(10)
+        self.assertEqual(3, result.failures)
+        self.assertEqual(3, result.errors)
+        self.assertEqual([], result.latencies)
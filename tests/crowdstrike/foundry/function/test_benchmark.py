@@ -0,0 +1,184 @@
+import os
+import re
+from dataclasses import fields
+from inspect import signature
+from unittest import main, skipUnless, TestCase
+from crowdstrike.foundry.function import Request, RequestParams, Response
+from crowdstrike.foundry.function.bench import header_names, per_call_usec, realistic_request, realistic_response
+from crowdstrike.foundry.function.mapping import canonize_header, dict_to_request, response_to_dict
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+# Benchmarks are slow and their results depend on the machine, so they only run on request.
+BENCHMARK = os.environ.get('CS_FN_BENCHMARK', '') != ''
+
+
+def report(name: str, before: float, after: float):
+    print(f'\n{name}: before={before:.2f}us after={after:.2f}us speedup={before / after:.2f}x')
+
+
+def do_request(req, config, logger):
+    return Response(code=200)
+
+
+@skipUnless(BENCHMARK, 'set CS_FN_BENCHMARK=1 to run benchmarks')
+class TestRouterBenchmark(TestCase):
+
+    def setUp(self):
+        self.router = Router({'a': 'b'})
+        self.router.register(Route(
+            method='POST',
+            path='/request',
+            func=do_request,
+        ))
+        self.req = Request(method='POST', url='/request')
+
+    def test_route(self):
+        router = self.router
+        req = self.req
+
+        def route_with_signature():
+            # Dispatch as Router did before calling conventions were resolved on registration.
+            r = router._find_route(req)
+            f = r.func
+            len_params = len(signature(f).parameters)
+            if len_params == 3:
+                return f(req, router._config, None)
+            if len_params == 2:
+                return f(req, router._config)
+            return f(req)
+
+        before = per_call_usec(route_with_signature)
+        after = per_call_usec(lambda: router.route(req))
+        report('Router.route', before, after)
+        self.assertLess(after, before)
+
+    def test_route_templates(self):
+        templates = [f'/resource{i}/{{id}}/items/{{item_id:int}}' for i in range(50)]
+        for path in templates:
+            self.router.register(Route(method='GET', path=path, func=do_request))
+        patterns = [re.compile(rf'^/resource{i}/(?P<id>[^/]+)/items/(?P<item_id>[0-9]+)$') for i in range(50)]
+        req = Request(method='GET', url='/resource49/abc/items/7')
+
+        def route_with_linear_scan():
+            # Match templates one at a time, as handlers had to before the router supported them.
+            for p in patterns:
+                m = p.match(req.url)
+                if m is not None:
+                    req.path_params = m.groupdict()
+                    return do_request(req, None, None)
+
+        before = per_call_usec(route_with_linear_scan)
+        after = per_call_usec(lambda: self.router.route(req))
+        report('Router.route with 50 templates', before, after)
+        self.assertLess(after, before)
+
+
+def legacy_dict_to_dataclass(d, dc):
+    # dict_to_dataclass as it was before mappers were compiled.
+    if d is None:
+        return dc
+    for f in fields(dc):
+        d_key = f.name
+        if len(f.metadata) > 0:
+            k = f.metadata.get('key', '')
+            if k != '':
+                d_key = k
+        d_value = d.get(d_key, None)
+        if d_value is not None:
+            setattr(dc, f.name, d_value)
+    return dc
+
+
+def legacy_canonize_header(h):
+    # canonize_header as it was before results were cached.
+    canon = ''
+    upper = True
+    for c in h:
+        if upper:
+            canon += c.upper()
+        else:
+            canon += c.lower()
+        upper = c == '-'
+    return canon
+
+
+def legacy_dict_to_request(d):
+    req = legacy_dict_to_dataclass(d, Request())
+    req.params = legacy_dict_to_dataclass(d.get('params', None), RequestParams())
+    if req.params.header is not None and len(req.params.header) > 0:
+        h = {}
+        for k, v in req.params.header.items():
+            h[legacy_canonize_header(k)] = v
+        req.params.header = h
+    return req
+
+
+def legacy_response_to_dict(r):
+    body = r.body
+    errors = []
+    header = {}
+    if r.errors is not None:
+        for e in r.errors:
+            errors.append({'code': e.code, 'message': e.message})
+    if r.header is not None:
+        header = r.header
+    d = {'code': r.code}
+    if body is not None:
+        d['body'] = body
+    if len(errors) > 0:
+        d['errors'] = errors
+    if len(header) > 0:
+        d['header'] = header
+    return d
+
+
+@skipUnless(BENCHMARK, 'set CS_FN_BENCHMARK=1 to run benchmarks')
+class TestMappingBenchmark(TestCase):
+
+    def test_dict_to_request(self):
+        payload = realistic_request()
+        self.assertEqual(legacy_dict_to_request(payload), dict_to_request(payload))
+
+        before = per_call_usec(lambda: legacy_dict_to_request(payload))
+        after = per_call_usec(lambda: dict_to_request(payload))
+        report('dict_to_request', before, after)
+        self.assertLess(after, before)
+
+    def test_response_to_dict(self):
+        resp = realistic_response()
+        self.assertEqual(legacy_response_to_dict(resp), response_to_dict(resp))
+
+        before = per_call_usec(lambda: legacy_response_to_dict(resp))
+        after = per_call_usec(lambda: response_to_dict(resp))
+        # Too close to call reliably, so only reported.
+        report('response_to_dict', before, after)
+
+
+@skipUnless(BENCHMARK, 'set CS_FN_BENCHMARK=1 to run benchmarks')
+class TestHeaderBenchmark(TestCase):
+
+    def setUp(self):
+        self.names = header_names(50)
+
+    def test_canonize_header(self):
+        names = self.names
+        for name in names:
+            self.assertEqual(legacy_canonize_header(name), canonize_header(name))
+
+        before = per_call_usec(lambda: [legacy_canonize_header(name) for name in names], number=2000)
+        after = per_call_usec(lambda: [canonize_header(name) for name in names], number=2000)
+        report('canonize_header x50', before, after)
+        self.assertLess(after, before)
+
+    def test_dict_to_request_with_50_headers(self):
+        payload = realistic_request()
+        payload['params']['header'] = {name: ['value'] for name in self.names}
+        self.assertEqual(legacy_dict_to_request(payload), dict_to_request(payload))
+
+        before = per_call_usec(lambda: legacy_dict_to_request(payload), number=2000)
+        after = per_call_usec(lambda: dict_to_request(payload), number=2000)
+        report('dict_to_request with 50 headers', before, after)
+        self.assertLess(after, before)
@@ -0,0 +1,160 @@
+import asyncio
+from unittest import main, TestCase
+from crowdstrike.foundry.function import APIError, Request, RequestParams, Response
+from crowdstrike.foundry.function.cache import CachePolicy, ResponseCache
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestResponseCache(TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+
+    def new_cache(self, **kwargs) -> ResponseCache:
+        return ResponseCache(CachePolicy(**kwargs), clock=self.clock)
+
+    def test_hit_returns_copy(self):
+        cache = self.new_cache()
+        key = cache.key(Request(url='/hosts'))
+        self.assertIsNone(cache.get(key))
+        self.assertTrue(cache.put(key, Response(body={'hosts': ['a']}, code=200, header={'X-A': ['1']})))
+
+        hit = cache.get(key)
+        self.assertEqual(Response(body={'hosts': ['a']}, code=200, header={'X-A': ['1']}), hit)
+        hit.body['hosts'].append('b')
+        self.assertEqual({'hosts': ['a']}, cache.get(key).body)
+        self.assertEqual({'hits': 2, 'misses': 1, 'evictions': 0, 'entries': 1}, cache.stats())
+
+    def test_ttl(self):
+        cache = self.new_cache(ttl=10)
+        key = cache.key(Request(url='/hosts'))
+        cache.put(key, Response(code=200))
+        self.clock.now += 9.9
+        self.assertIsNotNone(cache.get(key))
+        self.clock.now += 0.1
+        self.assertIsNone(cache.get(key))
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_lru_eviction(self):
+        cache = self.new_cache(max_entries=2)
+        keys = [cache.key(Request(url=f'/hosts/{i}')) for i in range(3)]
+        cache.put(keys[0], Response(code=200))
+        cache.put(keys[1], Response(code=200))
+        cache.get(keys[0])
+        cache.put(keys[2], Response(code=200))
+        self.assertIsNotNone(cache.get(keys[0]))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertIsNotNone(cache.get(keys[2]))
+        self.assertEqual(1, cache.stats()['evictions'])
+
+    def test_only_successes_are_cached(self):
+        cache = self.new_cache()
+        key = cache.key(Request(url='/hosts'))
+        self.assertFalse(cache.put(key, Response(code=404)))
+        self.assertFalse(cache.put(key, Response(code=200, errors=[APIError(code=500, message='oops')])))
+        self.assertFalse(cache.put(key, None))
+        self.assertFalse(cache.put(None, Response(code=200)))
+        self.assertEqual(0, cache.stats()['entries'])
+
+    def test_default_key(self):
+        cache = self.new_cache()
+        a = Request(url='/hosts', params=RequestParams(query={'a': ['1'], 'b': ['2']}))
+        b = Request(url='/hosts', params=RequestParams(query={'b': ['2'], 'a': ['1']}))
+        c = Request(url='/hosts', params=RequestParams(query={'a': ['2']}))
+        self.assertEqual(cache.key(a), cache.key(b))
+        self.assertNotEqual(cache.key(a), cache.key(c))
+        for other in [Request(method='POST', url='/hosts'), Request(url='/hosts', body={'id': 2})]:
+            self.assertNotEqual(cache.key(Request(url='/hosts', body={'id': 1})), cache.key(other))
+        self.assertIsNone(cache.key(Request(url='/hosts', files={'f': b'x'})))
+
+    def test_key_fields(self):
+        cache = self.new_cache(key=['path.id', 'query.limit', 'header.x-tenant', 'body.filter.name'])
+
+        def key(id='1', limit='10', tenant='t1', name='n'):
+            return cache.key(Request(
+                url=f'/hosts/{id}',
+                path_params={'id': id},
+                params=RequestParams(header={'X-Tenant': [tenant]}, query={'limit': [limit], 'other': [id]}),
+                body={'filter': {'name': name}, 'other': id},
+            ))
+
+        self.assertEqual(key(), key())
+        for other in [key(id='2'), key(limit='20'), key(tenant='t2'), key(name='m')]:
+            self.assertNotEqual(key(), other)
+
+    def test_invalid_policy(self):
+        for kwargs, msg in [
+            ({'ttl': 0}, 'cache ttl must be positive'),
+            ({'max_entries': 0}, 'cache max_entries must be positive'),
+            ({'key': ['cookie.a']}, 'unsupported key field: cookie.a'),
+            ({'key': ['query']}, 'unsupported key field: query'),
+        ]:
+            with self.subTest(kwargs=kwargs):
+                with self.assertRaisesRegex(ValueError, msg):
+                    self.new_cache(**kwargs)
+
+
+class TestRouterCache(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.router = Router({})
+
+        def lookup(req):
+            self.calls += 1
+            return Response(body={'id': req.path_params['id'], 'calls': self.calls}, code=200)
+
+        async def lookup_async(req):
+            return lookup(req)
+
+        self.router.register(Route(method='GET', path='/hosts/{id}', func=lookup, cache=CachePolicy(ttl=60)))
+        self.router.register(Route(method='GET', path='/async/{id}', func=lookup_async, cache=CachePolicy(ttl=60)))
+        self.router.register(Route(method='GET', path='/uncached/{id}', func=lookup))
+
+    def test_route(self):
+        self.assertEqual({'id': 'a', 'calls': 1}, self.router.route(Request(method='GET', url='/hosts/a')).body)
+        self.assertEqual({'id': 'a', 'calls': 1}, self.router.route(Request(method='GET', url='/hosts/a')).body)
+        self.assertEqual({'id': 'b', 'calls': 2}, self.router.route(Request(method='GET', url='/hosts/b')).body)
+        self.assertEqual({'id': 'a', 'calls': 3}, self.router.route(Request(method='GET', url='/uncached/a')).body)
+        self.assertEqual({'id': 'a', 'calls': 4}, self.router.route(Request(method='GET', url='/uncached/a')).body)
+        self.assertEqual(
+            {'hits': 1, 'misses': 2, 'evictions': 0, 'entries': 2},
+            self.router.metrics.cache_stats()['GET /hosts/{id}'],
+        )
+        self.assertNotIn('GET /uncached/{id}', self.router.metrics.cache_stats())
+        self.assertIn(
+            'cs_fn_cache_requests_total{method="GET",route="/hosts/{id}",result="hit"} 1\n',
+            self.router.metrics.render(),
+        )
+
+    def test_post_bodies_are_cached_apart(self):
+        def create(req):
+            self.calls += 1
+            return Response(body={'id': req.body['id'], 'calls': self.calls}, code=200)
+
+        self.router.register(Route(method='POST', path='/hosts', func=create, cache=CachePolicy(ttl=60)))
+        for body, expected in [({'id': 1}, 1), ({'id': 2}, 2), ({'id': 1}, 1)]:
+            resp = self.router.route(Request(method='POST', url='/hosts', body=body))
+            self.assertEqual({'id': body['id'], 'calls': expected}, resp.body)
+
+    def test_route_async(self):
+        async def route_twice():
+            for path in ['/async/a', '/hosts/a']:
+                for _ in range(2):
+                    resp = await self.router.route_async(Request(method='GET', url=path))
+                    self.assertEqual({'id': 'a', 'calls': 1 if path == '/async/a' else 2}, resp.body)
+
+        asyncio.run(route_twice())
+        self.assertEqual(2, self.calls)
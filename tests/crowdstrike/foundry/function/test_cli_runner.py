@@ -1,12 +1,26 @@
+import json
+import mmap
+import os
+import tempfile
 from io import StringIO
+from typing import List, Tuple
 from logging import getLogger
 from unittest import main, TestCase
 from unittest.mock import patch
 from crowdstrike.foundry.function import Function, Response
+from crowdstrike.foundry.function.codec import get_codec
+from crowdstrike.foundry.function.log import shutdown_logging
+from crowdstrike.foundry.function.multipart import MultipartOptions
 from crowdstrike.foundry.function.router import Route, Router
 from crowdstrike.foundry.function.runner_cli import CLIRunner
 from tests.crowdstrike.foundry.function.utils import StaticConfigLoader
 
+try:
+    import orjson  # noqa: F401
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 if __name__ == '__main__':
     main()
 
@@ -75,7 +89,8 @@ class TestCLIRequestLifecycle(TestCase):
             path='/request4',
             func=do_request4,
         ))
-        self.runner = CLIRunner()
+        # The expected output is formatted as the standard library formats JSON.
+        self.runner = CLIRunner(codec=get_codec('json'))
         self.runner.bind_router(router)
         self.function = Function(
             config_loader=StaticConfigLoader(config),
@@ -139,3 +154,146 @@ class TestCLIRequestLifecycle(TestCase):
             self.assertEqual(resp, expected_resp, 'Unexpected response received')
 
 
+class TestCLIFileInput(TestCase):
+    def setUp(self):
+        self.received = {}
+
+        def do_files(req):
+            self.received.update(req.files)
+            body = {}
+            for name, f in req.files.items():
+                data = f if isinstance(f, bytes) else f.read()
+                body[os.path.basename(name)] = data.hex()
+            return Response(body=body, code=200)
+
+        self.router = Router({})
+        self.router.register(Route(method='POST', path='/files', func=do_files))
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data = os.path.join(self.tmp.name, 'request.json')
+        with open(self.data, 'w') as fd:
+            json.dump({'method': 'POST', 'url': '/files'}, fd)
+        self.binary = os.path.join(self.tmp.name, 'sample.bin')
+        with open(self.binary, 'wb') as fd:
+            fd.write(b'\x00\xff\xfe\r\n\x80')
+        self.empty = os.path.join(self.tmp.name, 'empty.bin')
+        open(self.empty, 'wb').close()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, multipart: MultipartOptions) -> dict:
+        runner = CLIRunner(codec=get_codec('json'), multipart=multipart)
+        runner.bind_router(self.router)
+        argv = [
+            'main.py', '--data', self.data, '-H', 'Content-Type: multipart/form-data',
+            '--file', self.binary, '--file', self.empty,
+        ]
+        with patch('sys.argv', argv), patch('sys.stdout', new_callable=StringIO) as mock_stdout:
+            runner.run(logger=getLogger('__name__'))
+        return json.loads(mock_stdout.getvalue().split('Response Payload:\n')[1])
+
+    def test_files_as_bytes(self):
+        resp = self.run_cli(MultipartOptions())
+        self.assertEqual({'sample.bin': '00fffe0d0a80', 'empty.bin': ''}, resp['body'])
+        self.assertEqual(b'\x00\xff\xfe\r\n\x80', self.received[self.binary])
+
+    def test_files_memory_mapped(self):
+        resp = self.run_cli(MultipartOptions(stream_files=True))
+        self.assertEqual({'sample.bin': '00fffe0d0a80', 'empty.bin': ''}, resp['body'])
+        self.assertIsInstance(self.received[self.binary], mmap.mmap)
+        for f in self.received.values():
+            self.assertTrue(f.closed, 'file was not closed after the response')
+
+
+class TestCLIBatch(TestCase):
+    def setUp(self):
+        router = Router({'a': 'b'})
+        router.register(Route(method='POST', path='/request1', func=do_request1))
+        router.register(Route(method='POST', path='/request4', func=do_request4))
+        self.router = router
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.batch = os.path.join(self.tmp.name, 'requests.jsonl')
+        with open(self.batch, 'w') as fd:
+            for i in range(20):
+                fd.write(json.dumps({'method': 'POST', 'url': '/request1', 'body': {'i': i}}) + '\n')
+            fd.write('\n')
+            fd.write('{"method": "POST", \n')
+            fd.write(json.dumps({'method': 'GET', 'url': '/xyz'}) + '\n')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_cli(self, *args, own_logger: bool = False, codec: str = 'json') -> Tuple[List[dict], str]:
+        runner = CLIRunner(codec=get_codec(codec))
+        runner.bind_router(self.router)
+        argv = ['main.py', *args]
+        with patch('sys.argv', argv), \
+                patch('sys.stdout', new_callable=StringIO) as mock_stdout, \
+                patch('sys.stderr', new_callable=StringIO) as mock_stderr:
+            if own_logger:
+                runner.run()
+            else:
+                runner.run(logger=getLogger('__name__'))
+        self.stdout = mock_stdout.getvalue()
+        return [json.loads(line) for line in self.stdout.splitlines()], mock_stderr.getvalue()
+
+    def test_batch(self):
+        for parallel in ['1', '4']:
+            with self.subTest(parallel=parallel):
+                lines, summary = self.run_cli('--batch', self.batch, '--parallel', parallel)
+                self.assertEqual(22, len(lines))
+                for i, line in enumerate(lines[:20]):
+                    self.assertEqual(f'{self.batch}:{i + 1}', line['source'])
+                    self.assertEqual(200, line['code'])
+                    self.assertEqual({'code': 200, 'body': {'req': {'i': i}}}, line['response'])
+                    self.assertGreaterEqual(line['duration_ms'], 0)
+                self.assertEqual(f'{self.batch}:22', lines[20]['source'])
+                self.assertEqual(400, lines[20]['code'])
+                self.assertEqual(404, lines[21]['code'])
+                self.assertEqual('Not Found: GET /xyz', lines[21]['response']['errors'][0]['message'])
+                self.assertIn('22 requests (2 failed)', summary)
+                self.assertIn('p99', summary)
+
+    def test_batch_logs_to_stderr(self):
+        shutdown_logging()
+        self.addCleanup(shutdown_logging)
+        lines, stderr = self.run_cli('--batch', self.batch, own_logger=True)
+        self.assertEqual(22, len(lines))
+        self.assertIn('Running without HTTP server', stderr)
+        self.assertIn('22 requests (2 failed)', stderr)
+
+    def test_batch_lines_use_codec(self):
+        for codec in ['json', 'orjson']:
+            with self.subTest(codec=codec):
+                if codec == 'orjson' and not HAS_ORJSON:
+                    continue
+                self.run_cli('--batch', self.batch, codec=codec)
+                for line in self.stdout.splitlines():
+                    self.assertEqual(get_codec(codec).dumps(json.loads(line)).decode('utf-8'), line)
+
+    def test_batch_headers(self):
+        batch = os.path.join(self.tmp.name, 'headers.jsonl')
+        with open(batch, 'w') as fd:
+            fd.write(json.dumps({'method': 'POST', 'url': '/request4', 'body': {}}) + '\n')
+        lines, _ = self.run_cli('--batch', batch, '-H', 'X-Test: yes')
+        self.assertEqual({'X-Test': ['yes']}, lines[0]['response']['body']['req_headers'])
+
+    def test_batch_directory_to_output(self):
+        requests = os.path.join(self.tmp.name, 'requests')
+        os.mkdir(requests)
+        with open(os.path.join(requests, 'a.json'), 'w') as fd:
+            json.dump({'method': 'POST', 'url': '/request1', 'body': {'file': 'a'}}, fd, indent=4)
+        with open(os.path.join(requests, 'b.jsonl'), 'w') as fd:
+            fd.write(json.dumps({'method': 'POST', 'url': '/request1', 'body': {'file': 'b'}}) + '\n')
+        with open(os.path.join(requests, 'ignored.txt'), 'w') as fd:
+            fd.write('ignored')
+        output = os.path.join(self.tmp.name, 'responses.jsonl')
+
+        lines, summary = self.run_cli('--batch', requests, '--output', output)
+        self.assertEqual([], lines)
+        self.assertIn('2 requests (0 failed)', summary)
+        with open(output, 'rb') as fd:
+            lines = [json.loads(line) for line in fd]
+        self.assertEqual([{'file': 'a'}, {'file': 'b'}], [line['response']['body']['req'] for line in lines])
@@ -0,0 +1,196 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import main, TestCase
+from crowdstrike.foundry.function import FDKException, Request, Response
+from crowdstrike.foundry.function.coalesce import CoalescePolicy, SingleFlight
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+class TestSingleFlight(TestCase):
+
+    def test_concurrent_calls_share_result(self):
+        flights = SingleFlight(CoalescePolicy())
+        key = flights.key(Request(url='/hosts'))
+        release = threading.Event()
+        calls = []
+
+        def lookup():
+            calls.append(1)
+            release.wait(5)
+            return Response(body={'hosts': ['a']}, code=200)
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            leader = pool.submit(flights.do, key, lookup)
+            while flights.stats()['executions'] == 0:
+                time.sleep(0.001)
+            waiters = [pool.submit(flights.do, key, lookup) for _ in range(3)]
+            while flights.stats()['shared'] < 3:
+                time.sleep(0.001)
+            release.set()
+            results = [leader.result()] + [w.result() for w in waiters]
+
+        self.assertEqual(1, len(calls))
+        self.assertEqual({'executions': 1, 'shared': 3}, flights.stats())
+        for resp in results:
+            self.assertEqual({'hosts': ['a']}, resp.body)
+        self.assertEqual(4, len({id(resp) for resp in results}))
+
+        # Calls made once the first has completed run anew.
+        flights.do(key, lookup)
+        self.assertEqual(2, len(calls))
+
+    def test_error_is_shared(self):
+        flights = SingleFlight(CoalescePolicy())
+        key = flights.key(Request(url='/hosts'))
+        release = threading.Event()
+
+        def fail():
+            release.wait(5)
+            raise FDKException(code=502, message='Bad Gateway')
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            leader = pool.submit(flights.do, key, fail)
+            while flights.stats()['executions'] == 0:
+                time.sleep(0.001)
+            waiter = pool.submit(flights.do, key, fail)
+            while flights.stats()['shared'] == 0:
+                time.sleep(0.001)
+            release.set()
+            for f in [leader, waiter]:
+                with self.assertRaisesRegex(FDKException, 'Bad Gateway'):
+                    f.result()
+
+    def test_waiter_outlives_cancelled_leader(self):
+        flights = SingleFlight(CoalescePolicy())
+        key = flights.key(Request(url='/hosts'))
+        calls = []
+
+        async def lookup():
+            calls.append(1)
+            await asyncio.sleep(0.2 if len(calls) == 1 else 0)
+            return Response(body={'calls': len(calls)}, code=200)
+
+        async def run():
+            leader = asyncio.ensure_future(flights.do_async(key, lookup))
+            await asyncio.sleep(0.01)
+            waiter = asyncio.ensure_future(flights.do_async(key, lookup))
+            await asyncio.sleep(0.01)
+            # Such as by the leader's own request timing out.
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await waiter
+
+        resp = asyncio.run(run())
+        self.assertEqual({'calls': 2}, resp.body)
+        self.assertEqual({'executions': 2, 'shared': 0}, flights.stats())
+
+    def test_late_joiner_gets_result(self):
+        flights = SingleFlight(CoalescePolicy())
+        key = flights.key(Request(url='/hosts'))
+        leader_thread = threading.current_thread()
+        handler_done = threading.Event()
+        late = []
+
+        class JoiningLock:
+            """Lets another request join each time the leader releases the lock, once its handler has returned."""
+
+            def __init__(self):
+                self._lock = threading.Lock()
+                self._joining = False
+
+            def __enter__(self):
+                self._lock.acquire()
+
+            def __exit__(self, *args):
+                self._lock.release()
+                if threading.current_thread() is leader_thread and handler_done.is_set() and not self._joining:
+                    self._joining = True
+                    seen = sum(flights.stats().values())
+                    late.append(pool.submit(flights.do, key, lookup))
+                    while sum(flights.stats().values()) == seen:
+                        time.sleep(0.001)
+                    self._joining = False
+
+        def lookup():
+            if threading.current_thread() is leader_thread:
+                handler_done.set()
+            return Response(body={'resp': 1}, code=200)
+
+        flights._lock = JoiningLock()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            resp = flights.do(key, lookup)
+            results = [f.result(5) for f in late]
+
+        self.assertEqual({'resp': 1}, resp.body)
+        self.assertGreater(len(results), 0)
+        for r in results:
+            self.assertIsNotNone(r)
+            self.assertEqual({'resp': 1}, r.body)
+
+    def test_files_are_not_coalesced(self):
+        flights = SingleFlight(CoalescePolicy())
+        self.assertIsNone(flights.key(Request(url='/hosts', files={'f': b'x'})))
+        self.assertEqual('ok', flights.do(None, lambda: 'ok'))
+        self.assertEqual({'executions': 0, 'shared': 0}, flights.stats())
+
+
+class TestRouterCoalescing(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.router = Router({})
+
+        async def lookup(req):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return Response(body={'id': req.path_params['id']}, code=200)
+
+        self.router.register(Route(
+            method='GET', path='/hosts/{id}', func=lookup, coalesce=CoalescePolicy(key=['path.id'])))
+
+    def test_route_async(self):
+        async def route_all():
+            return await asyncio.gather(*[
+                self.router.route_async(Request(method='GET', url=f'/hosts/{i % 2}')) for i in range(6)
+            ])
+
+        results = asyncio.run(route_all())
+        self.assertEqual([{'id': str(i % 2)} for i in range(6)], [r.body for r in results])
+        self.assertEqual(2, self.calls)
+        self.assertEqual({'GET /hosts/{id}': {'executions': 2, 'shared': 4}}, self.router.metrics.coalescing_stats())
+        self.assertIn(
+            'cs_fn_coalesced_requests_total{method="GET",route="/hosts/{id}"} 4\n',
+            self.router.metrics.render(),
+        )
+
+    def test_default_key_covers_body(self):
+        router = Router({})
+
+        async def create(req):
+            await asyncio.sleep(0.05)
+            return Response(body=req.body, code=200)
+
+        router.register(Route(method='POST', path='/hosts', func=create, coalesce=CoalescePolicy()))
+
+        async def route_all():
+            return await asyncio.gather(*[
+                router.route_async(Request(method='POST', url='/hosts', body={'id': i % 2})) for i in range(4)
+            ])
+
+        results = asyncio.run(route_all())
+        self.assertEqual([{'id': i % 2} for i in range(4)], [r.body for r in results])
+        self.assertEqual({'POST /hosts': {'executions': 2, 'shared': 2}}, router.metrics.coalescing_stats())
+
+    def test_route(self):
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(self.router.route, [Request(method='GET', url='/hosts/a')] * 4))
+        self.assertEqual([{'id': 'a'}] * 4, [r.body for r in results])
+        stats = self.router.metrics.coalescing_stats()['GET /hosts/{id}']
+        self.assertEqual(4, stats['executions'] + stats['shared'])
+        self.assertEqual(stats['executions'], self.calls)
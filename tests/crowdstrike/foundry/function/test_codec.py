@@ -0,0 +1,91 @@
+import os
+from unittest import main, skipUnless, TestCase
+from unittest.mock import patch
+from crowdstrike.foundry.function.codec import get_codec, OrjsonCodec, StdlibJSONCodec
+from crowdstrike.foundry.function.config_loader_fs import FileSystemConfigLoader
+
+if __name__ == '__main__':
+    main()
+
+try:
+    import orjson  # noqa: F401
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+
+class CodecTests:
+    codec = None
+
+    def test_loads(self):
+        expected = {'hello': 'wörld', 'n': [1, 2.5, None, True]}
+        data = '{"hello": "wörld", "n": [1, 2.5, null, true]}'
+        for d in [data, data.encode('utf-8'), bytearray(data.encode('utf-8')), memoryview(data.encode('utf-8'))]:
+            with self.subTest(type=type(d)):
+                self.assertEqual(expected, self.codec.loads(d))
+
+    def test_loads_invalid(self):
+        with self.assertRaises(ValueError):
+            self.codec.loads(b'{"hello": ')
+
+    def test_dumps(self):
+        value = {'hello': 'wörld', 'n': [1, 2.5, None, True], 'big': 2 ** 70}
+        data = self.codec.dumps(value)
+        self.assertIsInstance(data, bytes)
+        self.assertEqual(value, self.codec.loads(data))
+
+
+class TestStdlibJSONCodec(CodecTests, TestCase):
+    codec = StdlibJSONCodec()
+
+    def test_dumps_format(self):
+        self.assertEqual(b'{"code": 200}', self.codec.dumps({'code': 200}))
+
+
+@skipUnless(HAS_ORJSON, 'orjson is not installed')
+class TestOrjsonCodec(CodecTests, TestCase):
+    codec = OrjsonCodec() if HAS_ORJSON else None
+
+    def test_dumps_format(self):
+        self.assertEqual(b'{"code":200}', self.codec.dumps({'code': 200}))
+
+
+class TestGetCodec(TestCase):
+
+    def test_by_name(self):
+        self.assertIsInstance(get_codec('json'), StdlibJSONCodec)
+        self.assertIs(get_codec('json'), get_codec(' JSON '))
+
+    def test_from_env(self):
+        with patch.dict(os.environ, {'CS_FN_JSON_CODEC': 'json'}):
+            self.assertIsInstance(get_codec(), StdlibJSONCodec)
+
+    def test_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsInstance(get_codec(), StdlibJSONCodec)
+
+    def test_auto(self):
+        expected = OrjsonCodec if HAS_ORJSON else StdlibJSONCodec
+        with patch.dict(os.environ, {'CS_FN_JSON_CODEC': 'auto'}):
+            self.assertIsInstance(get_codec(), expected)
+
+    def test_unknown(self):
+        with self.assertRaisesRegex(ValueError, 'unsupported JSON codec: yaml'):
+            get_codec('yaml')
+
+
+class TestFileSystemConfigLoader(TestCase):
+
+    def test_load(self):
+        with patch.dict(os.environ, {'CS_FN_CONFIG_PATH': './test_data/config/valid.json'}):
+            config = FileSystemConfigLoader().load()
+        self.assertEqual({'hostname': 'localhost', 'port': 9876}, config)
+
+    def test_load_without_path(self):
+        with patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(FileSystemConfigLoader().load())
+
+    def test_load_missing_file(self):
+        with patch.dict(os.environ, {'CS_FN_CONFIG_PATH': './test_data/config/missing.json'}):
+            with self.assertRaises(FileNotFoundError):
+                FileSystemConfigLoader().load()
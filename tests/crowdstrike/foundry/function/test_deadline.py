@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import main, TestCase
+from crowdstrike.foundry.function import FDKException, Request, RequestParams, Response
+from crowdstrike.foundry.function.context import ctx_request
+from crowdstrike.foundry.function.deadline import Deadlines, TimeoutOptions
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+def request_with_budget(url: str, budget_ms: str) -> Request:
+    return Request(method='GET', url=url, params=RequestParams(header={'X-Cs-Fn-Deadline-Ms': [budget_ms]}))
+
+
+class TestDeadlines(TestCase):
+
+    def test_no_limit(self):
+        req = Request(deadline=123.0)
+        self.assertIsNone(Deadlines(TimeoutOptions()).start(req))
+        self.assertEqual(0.0, req.deadline)
+        self.assertIsNone(req.time_remaining())
+
+    def test_timeouts(self):
+        deadlines = Deadlines(TimeoutOptions(timeout=10))
+        for route_timeout, budget_ms, expected in [
+            (None, None, 10),
+            (2, None, 2),
+            (0, None, None),
+            (None, '500', 0.5),
+            (0, '500', None),
+            (None, '60000', 10),
+            (None, 'soon', 10),
+            (None, '0', 10),
+            (None, '-500', 10),
+            (None, 'inf', 10),
+            (None, 'nan', 10),
+            (None, '1e300', 10),
+            (None, '1e400', 10),
+            (0, 'inf', None),
+            (0, 'nan', None),
+            (0, '-500', None),
+            (0, '1e300', None),
+        ]:
+            with self.subTest(route_timeout=route_timeout, budget_ms=budget_ms):
+                req = request_with_budget('/', budget_ms) if budget_ms is not None else Request()
+                started = time.monotonic()
+                self.assertEqual(expected, Deadlines(deadlines.options).start(req, route_timeout))
+                if expected is not None:
+                    self.assertAlmostEqual(started + expected, req.deadline, delta=0.1)
+                    self.assertLessEqual(req.time_remaining(), expected)
+
+    def test_header_ignored(self):
+        req = request_with_budget('/', '500')
+        self.assertIsNone(Deadlines(TimeoutOptions(header='')).start(req))
+        self.assertEqual(0.0, req.deadline)
+        self.assertIsNone(Deadlines(TimeoutOptions()).start(req))
+        self.assertEqual(0.0, req.deadline)
+
+    def test_invalid_max_running(self):
+        with self.assertRaises(ValueError):
+            Deadlines(TimeoutOptions(timeout=1, max_running=0))
+
+
+class TestRouterTimeouts(TestCase):
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+        self.router = Router({}, timeouts=TimeoutOptions(timeout=0.2))
+
+        def hang(req):
+            self.release.wait(10)
+            return Response(code=200)
+
+        async def hang_async(req):
+            await asyncio.sleep(10)
+            return Response(code=200)
+
+        def remaining(req):
+            current = ctx_request.get()
+            return Response(body={'remaining': req.time_remaining(), 'current': current is req}, code=200)
+
+        self.router.register(Route(method='GET', path='/hang', func=hang))
+        self.router.register(Route(method='GET', path='/hang-async', func=hang_async))
+        self.router.register(Route(method='GET', path='/unlimited', func=remaining, timeout=0))
+        self.router.register(Route(method='GET', path='/remaining', func=remaining, timeout=5))
+
+    def test_timeout(self):
+        for path in ['/hang', '/hang-async']:
+            with self.subTest(path=path):
+                started = time.monotonic()
+                with self.assertRaises(FDKException) as cm:
+                    self.router.route(Request(method='GET', url=path))
+                self.assertEqual(504, cm.exception.code)
+                self.assertLess(time.monotonic() - started, 5)
+
+    def test_timeout_async(self):
+        executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(executor.shutdown, wait=False)
+        for path in ['/hang', '/hang-async']:
+            with self.subTest(path=path):
+                with self.assertRaises(FDKException) as cm:
+                    asyncio.run(self.router.route_async(Request(method='GET', url=path), executor=executor))
+                self.assertEqual(504, cm.exception.code)
+
+    def test_invalid_budget(self):
+        for path, budget_ms, expected in [
+            ('/remaining', 'inf', 5),
+            ('/remaining', 'nan', 5),
+            ('/remaining', '-1', 5),
+            ('/remaining', '1e300', 5),
+            ('/remaining', '1e400', 5),
+            ('/unlimited', '500', None),
+            ('/unlimited', '1e300', None),
+            ('/unlimited', 'inf', None),
+        ]:
+            with self.subTest(path=path, budget_ms=budget_ms):
+                resp = self.router.route(request_with_budget(path, budget_ms))
+                self.assertEqual(200, resp.code)
+                remaining = resp.body['remaining']
+                if expected is None:
+                    self.assertIsNone(remaining)
+                else:
+                    self.assertAlmostEqual(expected, remaining, delta=0.5)
+
+    def test_deadline_visible_to_handler(self):
+        req = Request(method='GET', url='/remaining')
+        token = ctx_request.set(req)
+        self.addCleanup(ctx_request.reset, token)
+        body = self.router.route(req).body
+        self.assertTrue(4 < body['remaining'] <= 5)
+        self.assertTrue(body['current'])
+        self.assertIsNone(self.router.route(Request(method='GET', url='/unlimited')).body['remaining'])
+
+        remaining = self.router.route(request_with_budget('/remaining', '1000')).body['remaining']
+        self.assertTrue(0 < remaining <= 1)
+
+    def test_handler_errors_pass_through(self):
+        def fail(req):
+            raise FDKException(code=418, message="I'm a teapot")
+
+        self.router.register(Route(method='GET', path='/fail', func=fail))
+        with self.assertRaisesRegex(FDKException, 'teapot'):
+            self.router.route(Request(method='GET', url='/fail'))
+
+    def test_max_running(self):
+        router = Router({}, timeouts=TimeoutOptions(timeout=0.2, max_running=2))
+
+        def hang(req):
+            self.release.wait(10)
+            return Response(code=200)
+
+        router.register(Route(method='GET', path='/hang', func=hang))
+        router.register(Route(method='GET', path='/quick', func=lambda req: Response(code=200)))
+        for _ in range(2):
+            with self.assertRaises(FDKException) as cm:
+                router.route(Request(method='GET', url='/hang'))
+            self.assertEqual(504, cm.exception.code)
+        self.assertEqual(2, router.abandoned())
+        self.assertEqual(2, router.wait_abandoned(0.1))
+
+        with self.assertRaises(FDKException) as cm:
+            router.route(Request(method='GET', url='/quick'))
+        self.assertEqual(503, cm.exception.code)
+
+        self.release.set()
+        self.assertEqual(0, router.wait_abandoned(5))
+        self.assertEqual(200, router.route(Request(method='GET', url='/quick')).code)
@@ -0,0 +1,508 @@
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from socket import SHUT_WR, create_connection, socket
+from subprocess import DEVNULL, Popen
+from threading import Thread
+from unittest import main, skipUnless, TestCase
+from unittest.mock import MagicMock, patch
+from crowdstrike.foundry.function import Response
+from crowdstrike.foundry.function.admission import AdmissionOptions
+from crowdstrike.foundry.function.context import ctx_request
+from crowdstrike.foundry.function.router import Route, Router
+from crowdstrike.foundry.function.runner_http import HTTPRequestHandler, HTTPRunner
+from tests.crowdstrike.foundry.function.utils import NullLogger, wait_for_metrics
+
+if __name__ == '__main__':
+    main()
+
+
+def do_echo(req):
+    return Response(
+        body={
+            'req': req.body,
+            'ctx_trace_id': ctx_request.get().trace_id,
+        },
+        code=200,
+    )
+
+
+def do_raw(req):
+    return Response(
+        body={
+            'raw_body': bytes(req.raw_body).decode('utf-8'),
+            'readonly': req.raw_body.readonly,
+        },
+        code=200,
+    )
+
+
+def do_fail(req):
+    raise RuntimeError('boom')
+
+
+def do_slow(req):
+    time.sleep(0.5)
+    return Response(
+        body={
+            'trace_id': req.trace_id,
+        },
+        code=200,
+    )
+
+
+class HTTPRunnerTestCase(TestCase):
+    runner_kwargs = {}
+
+    def setUp(self):
+        router = Router({})
+        router.register(Route(
+            method='POST',
+            path='/echo',
+            func=do_echo,
+        ))
+        router.register(Route(
+            method='POST',
+            path='/slow',
+            func=do_slow,
+        ))
+        router.register(Route(
+            method='POST',
+            path='/fail',
+            func=do_fail,
+        ))
+        router.register(Route(
+            method='POST',
+            path='/raw',
+            func=do_raw,
+        ))
+        self.router = router
+        with patch.dict(os.environ, {'PORT': '0'}):
+            runner = HTTPRunner(**self.runner_kwargs)
+        runner.bind_router(router)
+        runner._bind_handler(NullLogger())
+        self.server = runner._new_server()
+        self.port = self.server.server_address[1]
+        self.thread = Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def post(self, payload: dict, headers=None):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('POST', '/', body=json.dumps(payload), headers=headers or {})
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+
+class TestSerialHTTPRunner(HTTPRunnerTestCase):
+
+    def test_request(self):
+        status, body = self.post({'method': 'POST', 'url': '/echo', 'body': {'hello': 'world'}, 'trace_id': 'abc'})
+        self.assertEqual(200, status)
+        self.assertDictEqual({'req': {'hello': 'world'}, 'ctx_trace_id': 'abc'}, body['body'])
+
+    def test_raw_body(self):
+        payload = {'method': 'POST', 'url': '/raw', 'body': {'hello': 'wörld'}}
+        status, body = self.post(payload)
+        self.assertEqual(200, status)
+        self.assertEqual({'raw_body': json.dumps(payload), 'readonly': True}, body['body'])
+
+    def test_truncated_request(self):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.putrequest('POST', '/')
+            conn.putheader('Content-Length', '100')
+            conn.endheaders(b'{"method": "POST"}')
+            conn.sock.shutdown(SHUT_WR)
+            resp = conn.getresponse()
+            self.assertEqual(400, resp.status)
+        finally:
+            conn.close()
+
+    def test_malformed_request(self):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('POST', '/', body='{"method": ')
+            resp = conn.getresponse()
+            payload = resp.read()
+        finally:
+            conn.close()
+        self.assertEqual(400, resp.status)
+        self.assertEqual(len(payload), int(resp.getheader('Content-Length')))
+        self.assertEqual([{'code': 400, 'message': 'Bad Request'}], json.loads(payload)['errors'])
+
+    def test_handler_exception(self):
+        status, body = self.post({'method': 'POST', 'url': '/fail'})
+        self.assertEqual(500, status)
+        self.assertEqual([{'code': 500, 'message': 'Internal Server Error'}], body['errors'])
+
+    def test_metrics(self):
+        for _ in range(3):
+            self.post({'method': 'POST', 'url': '/echo'})
+        self.post({'method': 'POST', 'url': '/fail'})
+        self.post({'method': 'GET', 'url': '/nowhere'})
+
+        metrics = wait_for_metrics(self.router, 5)
+        self.assertEqual({'POST /echo', 'POST /fail', ' '}, set(metrics))
+        self.assertEqual(3, metrics['POST /echo']['requests'])
+        self.assertEqual({}, metrics['POST /echo']['errors'])
+        for phase in ['read', 'handler', 'write']:
+            self.assertEqual(3, metrics['POST /echo']['phases'][phase]['count'])
+        self.assertEqual({500: 1}, metrics['POST /fail']['errors'])
+        self.assertEqual({404: 1}, metrics[' ']['errors'])
+
+
+class TestKeepAliveHTTPRunner(HTTPRunnerTestCase):
+    runner_kwargs = {'keep_alive': True, 'max_requests_per_connection': 3}
+
+    def test_connection_is_reused(self):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            socks = []
+            for i in range(3):
+                payload = json.dumps({'method': 'POST', 'url': '/echo' if i != 1 else '/xyz', 'trace_id': str(i)})
+                conn.request('POST', '/', body=payload)
+                socks.append(conn.sock)
+                resp = conn.getresponse()
+                body = resp.read()
+                self.assertEqual(11, resp.version)
+                self.assertEqual(len(body), int(resp.getheader('Content-Length')))
+            self.assertEqual(1, len(set(socks)), 'connection was not reused')
+            self.assertEqual('close', resp.getheader('Connection'))
+        finally:
+            conn.close()
+
+    def test_head_has_no_body(self):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('HEAD', '/', body=json.dumps({'method': 'POST', 'url': '/echo'}))
+            resp = conn.getresponse()
+            self.assertEqual(b'', resp.read())
+            self.assertGreater(int(resp.getheader('Content-Length')), 0)
+
+            conn.request('POST', '/', body=json.dumps({'method': 'POST', 'url': '/echo', 'trace_id': 'after-head'}))
+            resp = conn.getresponse()
+            self.assertEqual('after-head', json.loads(resp.read())['body']['ctx_trace_id'])
+        finally:
+            conn.close()
+
+
+class TestPooledHTTPRunner(HTTPRunnerTestCase):
+    runner_kwargs = {'concurrency': 'pool', 'max_in_flight': 4}
+
+    def test_requests_are_served_concurrently(self):
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(
+                lambda i: self.post({'method': 'POST', 'url': '/slow', 'trace_id': str(i)}),
+                range(4),
+            ))
+        elapsed = time.monotonic() - start
+
+        self.assertLess(elapsed, 1.5, f'requests appear to have been served serially, took {elapsed:.2f}s')
+        self.assertEqual([str(i) for i in range(4)], [body['body']['trace_id'] for _, body in results])
+
+    def test_request_context_is_isolated(self):
+        for i in range(8):
+            status, body = self.post({'method': 'POST', 'url': '/echo', 'trace_id': f'trace-{i}'})
+            self.assertEqual(200, status)
+            self.assertEqual(f'trace-{i}', body['body']['ctx_trace_id'])
+
+
+class TestAdmissionHTTPRunner(HTTPRunnerTestCase):
+    runner_kwargs = {'concurrency': 'threaded', 'admission': AdmissionOptions(max_concurrent=1, retry_after=2)}
+
+    def test_excess_requests_are_rejected(self):
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(self.post, {'method': 'POST', 'url': '/slow', 'trace_id': 'slow'})
+            while self.router.metrics.admission_stats()['active'] == 0:
+                time.sleep(0.01)
+
+            conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+            try:
+                conn.request('POST', '/', body=json.dumps({'method': 'POST', 'url': '/echo'}))
+                resp = conn.getresponse()
+                body = json.loads(resp.read())
+            finally:
+                conn.close()
+            self.assertEqual(503, resp.status)
+            self.assertEqual('2', resp.getheader('Retry-After'))
+            self.assertEqual([{'code': 503, 'message': 'Service Unavailable: too many requests waiting'}],
+                             body['errors'])
+            self.assertEqual(200, slow.result()[0])
+
+        self.assertEqual(200, self.post({'method': 'POST', 'url': '/echo'})[0])
+        stats = self.router.metrics.admission_stats()
+        self.assertEqual({'admitted': 2, 'rejected': 1, 'shed': 0}, {k: stats[k] for k in ('admitted', 'rejected', 'shed')})
+
+
+class TestPooledAdmissionHTTPRunner(TestAdmissionHTTPRunner):
+    # Fewer than max_in_flight between them, leaving a worker free to turn requests away.
+    runner_kwargs = {
+        'concurrency': 'pool',
+        'max_in_flight': 2,
+        'admission': AdmissionOptions(max_concurrent=1, retry_after=2),
+    }
+
+
+class TestQueueAgeHTTPRunner(HTTPRunnerTestCase):
+    runner_kwargs = {
+        'concurrency': 'pool',
+        'max_in_flight': 1,
+        'admission': AdmissionOptions(max_concurrent=1, max_queue_age=0.1),
+    }
+
+    def test_wait_for_worker_counts_towards_queue_age(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            slow = pool.submit(self.post, {'method': 'POST', 'url': '/slow'})
+            while self.router.metrics.admission_stats()['active'] == 0:
+                time.sleep(0.01)
+            # Accepted straight away, but waits for the only worker until the slow request is done.
+            status, body = self.post({'method': 'POST', 'url': '/echo'})
+            self.assertEqual(200, slow.result()[0])
+        self.assertEqual(503, status)
+        self.assertEqual([{'code': 503, 'message': 'Service Unavailable: waited too long to be handled'}],
+                         body['errors'])
+
+
+class TestHTTPRunnerConfig(TestCase):
+
+    def test_concurrency_from_env(self):
+        with patch.dict(os.environ, {'CS_FN_HTTP_CONCURRENCY': 'Threaded', 'CS_FN_HTTP_BACKLOG': '8'}):
+            runner = HTTPRunner()
+        self.assertEqual('threaded', runner._concurrency)
+        self.assertEqual(8, runner._backlog)
+
+    def test_unknown_concurrency(self):
+        with self.assertRaisesRegex(ValueError, 'unsupported concurrency mode'):
+            HTTPRunner(concurrency='forking')
+
+    def test_idle_timeout_needs_keep_alive(self):
+        for keep_alive, timeout in [(False, None), (True, 2.5)]:
+            with self.subTest(keep_alive=keep_alive):
+                runner = HTTPRunner(keep_alive=keep_alive, idle_timeout=2.5)
+                runner._bind_handler(NullLogger())
+                self.assertEqual(timeout, HTTPRequestHandler.timeout)
+
+    def test_admission_warnings(self):
+        admission = AdmissionOptions(max_concurrent=2, max_queued=2)
+        for kwargs, warned in [
+            ({'concurrency': 'serial'}, True),
+            ({'concurrency': 'threaded'}, False),
+            ({'concurrency': 'pool', 'max_in_flight': 4}, True),
+            ({'concurrency': 'pool', 'max_in_flight': 5}, False),
+        ]:
+            with self.subTest(**kwargs):
+                logger = MagicMock()
+                HTTPRunner(admission=admission, **kwargs)._check_admission(logger)
+                self.assertEqual(warned, logger.warning.called)
+
+
+PREFORK_FUNCTION = '''
+import os
+from crowdstrike.foundry.function import Function, Response
+from crowdstrike.foundry.function.router import Router
+from crowdstrike.foundry.function.runner import Runner
+from crowdstrike.foundry.function.runner_http import HTTPRequestHandler, HTTPRunner
+
+router = Router({})
+func = Function(config={}, router=router, runner=Runner(HTTPRunner(processes=2)))
+func._runner.bind_router(router)
+
+
+@func.handler(method='GET', path='/pid')
+def on_pid(req):
+    return Response(body={'pid': os.getpid()}, code=200)
+
+
+@func.handler(method='GET', path='/crash')
+def on_crash(req):
+    os._exit(1)
+
+
+func.run()
+'''
+
+
+@skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+class TestPreforkHTTPRunner(TestCase):
+
+    def setUp(self):
+        with socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        env = dict(os.environ, PORT=str(self.port), PYTHONPATH=os.pathsep.join(['.', 'src']))
+        self.proc = Popen([sys.executable, '-c', PREFORK_FUNCTION], env=env, stdout=DEVNULL, stderr=DEVNULL)
+        self.addCleanup(self.stop)
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait(timeout=10)
+
+    def get(self, url: str):
+        conn = HTTPConnection('127.0.0.1', self.port, timeout=10)
+        try:
+            conn.request('POST', '/', body=json.dumps({'method': 'GET', 'url': url}))
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def wait_until_serving(self):
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                return self.get('/pid')
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def test_workers_serve_requests_and_are_restarted(self):
+        status, body = self.wait_until_serving()
+        self.assertEqual(200, status)
+        self.assertNotEqual(self.proc.pid, body['body']['pid'], 'request was served by the supervisor')
+
+        with self.assertRaises(OSError):
+            self.get('/crash')
+
+        pids = set()
+        for _ in range(10):
+            status, body = self.get('/pid')
+            self.assertEqual(200, status)
+            pids.add(body['body']['pid'])
+        self.assertNotIn(self.proc.pid, pids)
+        self.assertIsNone(self.proc.poll(), 'supervisor exited after a worker crashed')
+
+
+DRAIN_FUNCTION = '''
+import sys
+import time
+from crowdstrike.foundry.function import Function, Response
+from crowdstrike.foundry.function.router import Router
+from crowdstrike.foundry.function.runner import Runner
+from crowdstrike.foundry.function.runner_http import HTTPRequestHandler, HTTPRunner
+
+router = Router({})
+runner = HTTPRunner(concurrency=sys.argv[3], processes=int(sys.argv[1]))
+func = Function(config={}, router=router, runner=Runner(runner, drain_timeout=float(sys.argv[2])))
+func._runner.bind_router(router)
+
+
+@func.handler(method='GET', path='/slow')
+def on_slow(req):
+    time.sleep(1)
+    return Response(body={'done': True}, code=200)
+
+
+@func.handler(method='GET', path='/stuck')
+def on_stuck(req):
+    time.sleep(60)
+    return Response(body={'done': True}, code=200)
+
+
+func.run()
+'''
+
+
+@skipUnless(hasattr(os, 'fork'), 'requires os.fork')
+class TestGracefulShutdown(TestCase):
+
+    def start(self, processes: int, drain_timeout: float, concurrency: str = 'threaded', **kwargs):
+        with socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        env = dict(os.environ, PORT=str(port), PYTHONPATH=os.pathsep.join(['.', 'src']))
+        proc = Popen([sys.executable, '-c', DRAIN_FUNCTION, str(processes), str(drain_timeout), concurrency],
+                     env=env, stdout=DEVNULL, stderr=DEVNULL, **kwargs)
+        self.addCleanup(proc.kill)
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                # Connections are accepted into the backlog before the workers are ready, so wait for an answer.
+                self.get(port, '/ready')
+                return proc, port
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def get(self, port: int, url: str):
+        conn = HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request('POST', '/', body=json.dumps({'method': 'GET', 'url': url}))
+            resp = conn.getresponse()
+            return resp.status, json.loads(resp.read())
+        finally:
+            conn.close()
+
+    def get_slow(self, port: int):
+        return self.get(port, '/slow')
+
+    def test_requests_in_flight_finish(self):
+        for processes in [1, 2]:
+            with self.subTest(processes=processes):
+                proc, port = self.start(processes, drain_timeout=10)
+                with ThreadPoolExecutor(max_workers=1) as pool:
+                    slow = pool.submit(self.get_slow, port)
+                    time.sleep(0.3)
+                    proc.terminate()
+                    self.assertEqual((200, {'done': True}), (slow.result()[0], slow.result()[1]['body']))
+                self.assertEqual(0, proc.wait(timeout=10))
+                with self.assertRaises(OSError):
+                    self.get_slow(port)
+
+    def test_process_group_interrupt(self):
+        # Ctrl+C interrupts every process in the group, after which the supervisor also signals its workers.
+        proc, port = self.start(2, drain_timeout=10, start_new_session=True)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(self.get_slow, port)
+            time.sleep(0.3)
+            os.killpg(proc.pid, signal.SIGINT)
+            self.assertEqual((200, {'done': True}), (slow.result()[0], slow.result()[1]['body']))
+        self.assertEqual(0, proc.wait(timeout=10))
+
+    def test_idle_connection(self):
+        for concurrency in ['serial', 'threaded', 'pool']:
+            with self.subTest(concurrency=concurrency):
+                proc, port = self.start(1, drain_timeout=10, concurrency=concurrency)
+                # Connects without ever sending a request.
+                with create_connection(('127.0.0.1', port), timeout=10) as idle:
+                    time.sleep(0.3)
+                    proc.terminate()
+                    self.assertEqual(0, proc.wait(timeout=5))
+                    self.assertEqual(b'', idle.recv(1))
+
+    def test_stuck_handler(self):
+        # A serial server cannot return from serving until the handler does, so the process is ended regardless.
+        proc, port = self.start(1, drain_timeout=0.2, concurrency='serial')
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            stuck = pool.submit(self.get, port, '/stuck')
+            time.sleep(0.3)
+            start = time.monotonic()
+            proc.terminate()
+            self.assertEqual(1, proc.wait(timeout=10))
+            self.assertLess(time.monotonic() - start, 5)
+            with self.assertRaises(OSError):
+                stuck.result()
+
+    def test_drain_timeout(self):
+        proc, port = self.start(1, drain_timeout=0.1)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            slow = pool.submit(self.get_slow, port)
+            time.sleep(0.3)
+            proc.terminate()
+            self.assertEqual(1, proc.wait(timeout=10))
+            with self.assertRaises(OSError):
+                slow.result()
@@ -0,0 +1,158 @@
+import json
+import os
+import threading
+from io import StringIO
+from logging import INFO, WARNING, getLogger
+from unittest import main, TestCase
+from unittest.mock import patch
+from crowdstrike.foundry.function import Request
+from crowdstrike.foundry.function.context import ctx_request
+from crowdstrike.foundry.function.log import (
+    LOGGER_NAME,
+    dropped_records,
+    flush_logs,
+    setup_logger,
+    shutdown_logging,
+)
+
+if __name__ == '__main__':
+    main()
+
+
+class BlockingStream(StringIO):
+    """Stream whose writes wait until released, recording the threads which wrote to it."""
+
+    def __init__(self):
+        StringIO.__init__(self)
+        self.release = threading.Event()
+        self.threads = set()
+
+    def write(self, s):
+        self.release.wait(timeout=10)
+        self.threads.add(threading.get_ident())
+        return StringIO.write(self, s)
+
+
+class TestSetupLogger(TestCase):
+
+    def setUp(self):
+        shutdown_logging()
+        self.addCleanup(shutdown_logging)
+
+    def test_idempotent(self):
+        logger = setup_logger(queue_size=0, stream=StringIO())
+        self.assertIs(logger, setup_logger(queue_size=0, stream=StringIO()))
+        self.assertIs(logger, getLogger(LOGGER_NAME))
+        self.assertEqual(1, len(logger.handlers))
+
+    def test_level(self):
+        with patch.dict(os.environ, {'CS_FN_LOG_LEVEL': 'warning'}):
+            logger = setup_logger(queue_size=0, stream=StringIO())
+        self.assertEqual(WARNING, logger.level)
+        setup_logger(level='INFO')
+        self.assertEqual(INFO, logger.level)
+
+    def test_synchronous(self):
+        stream = StringIO()
+        logger = setup_logger(level='INFO', queue_size=0, stream=stream)
+        logger.info('hello %s', 'world')
+        self.assertIn('[INFO]  test_log.py test_synchronous:', stream.getvalue())
+        self.assertIn('->  hello world', stream.getvalue())
+
+    def test_queued(self):
+        stream = BlockingStream()
+        stream.release.set()
+        logger = setup_logger(level='INFO', queue_size=100, stream=stream)
+        try:
+            raise RuntimeError('boom')
+        except RuntimeError:
+            logger.exception('failed')
+        flush_logs()
+
+        self.assertIn('test_log.py test_queued:', stream.getvalue())
+        self.assertIn('RuntimeError: boom', stream.getvalue())
+        self.assertNotIn(threading.get_ident(), stream.threads, 'record was written by the logging thread')
+
+        logger.info('after flush')
+        shutdown_logging()
+        self.assertIn('after flush', stream.getvalue())
+
+    def test_full_queue_drops_records(self):
+        stream = BlockingStream()
+        logger = setup_logger(level='INFO', queue_size=2, stream=stream)
+        for i in range(10):
+            logger.info(f'record {i}')
+        # The listener holds one record while blocked on the stream, and the queue another two.
+        self.assertGreaterEqual(dropped_records(), 7)
+        self.assertLessEqual(dropped_records(), 8)
+
+        stream.release.set()
+        flush_logs()
+        written = stream.getvalue().count('record ')
+        self.assertEqual(10, written + dropped_records())
+
+
+class TestJSONFormat(TestCase):
+
+    def setUp(self):
+        shutdown_logging()
+        self.addCleanup(shutdown_logging)
+
+    def log(self, queue_size: int, f) -> list:
+        stream = StringIO()
+        logger = setup_logger(level='INFO', queue_size=queue_size, stream=stream, log_format='json')
+        f(logger)
+        flush_logs()
+        return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+    def test_request_fields(self):
+        req = Request(trace_id='abc', fn_id='fn', fn_version=3, route='/hosts/{id}')
+
+        def f(logger):
+            logger.info('outside')
+            token = ctx_request.set(req)
+            try:
+                logger.info('inside %d', 1)
+                logger.debug('disabled %s', Unprintable())
+            finally:
+                ctx_request.reset(token)
+
+        for queue_size in [0, 100]:
+            with self.subTest(queue_size=queue_size):
+                shutdown_logging()
+                outside, inside = self.log(queue_size, f)
+                self.assertEqual('outside', outside['message'])
+                self.assertEqual('', outside['trace_id'])
+                self.assertEqual('inside 1', inside['message'])
+                self.assertEqual('INFO', inside['level'])
+                self.assertEqual('test_log.py', inside['file'])
+                self.assertEqual('f', inside['func'])
+                self.assertTrue(inside['time'].endswith('Z'))
+                self.assertEqual(
+                    {'trace_id': 'abc', 'fn_id': 'fn', 'fn_version': 3, 'route': '/hosts/{id}'},
+                    {k: inside[k] for k in ['trace_id', 'fn_id', 'fn_version', 'route']},
+                )
+
+    def test_exception(self):
+        def f(logger):
+            try:
+                raise RuntimeError('boom')
+            except RuntimeError:
+                logger.exception('failed')
+
+        for queue_size in [0, 100]:
+            with self.subTest(queue_size=queue_size):
+                shutdown_logging()
+                record, = self.log(queue_size, f)
+                self.assertEqual('failed', record['message'])
+                self.assertIn('RuntimeError: boom', record['exception'])
+
+    def test_unsupported_format(self):
+        with self.assertRaisesRegex(ValueError, 'unsupported log format: xml'):
+            setup_logger(log_format='xml', stream=StringIO())
+
+
+class Unprintable:
+
+    def __str__(self):
+        raise AssertionError('message at a disabled level was formatted')
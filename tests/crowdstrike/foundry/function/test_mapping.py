@@ -1,10 +1,17 @@
 import unittest
+from dataclasses import dataclass, field
 from crowdstrike.foundry.function.model import (
+    APIError,
     RequestParams,
     Request,
+    Response,
 )
 from crowdstrike.foundry.function.mapping import (
+    canonize_header,
+    compile_mapper,
+    dict_to_dataclass,
     dict_to_request,
+    response_to_dict,
 )
 
 if __name__ == '__main__':
@@ -62,3 +69,75 @@ class TestRequest(unittest.TestCase):
         actual = dict_to_request(payload)
 
         self.assertEqual(expected, actual, f'expected={expected} but got {actual}')
+
+    def test_fdk_fields_are_not_mapped(self):
+        actual = dict_to_request({'url': '/qwerty', 'route': '/evil', 'raw_body': 'x', 'deadline': 1.0})
+        self.assertEqual(Request(url='/qwerty'), actual)
+        self.assertEqual(b'', actual.raw_body)
+
+
+@dataclass
+class Keyed:
+    name: str = field(default='')
+    trace_id: str = field(default='', metadata={'key': 'traceId'})
+
+
+class TestDataclass(unittest.TestCase):
+
+    def test_dict_to_dataclass(self):
+        actual = dict_to_dataclass({'name': 'a', 'traceId': 'b', 'trace_id': 'c', 'other': 'd'}, Keyed())
+        self.assertEqual(Keyed(name='a', trace_id='b'), actual)
+
+    def test_dict_to_dataclass_keeps_defaults(self):
+        actual = dict_to_dataclass({'name': None}, Keyed(name='x'))
+        self.assertEqual(Keyed(name='x'), actual)
+        self.assertEqual(Keyed(name='y'), dict_to_dataclass(None, Keyed(name='y')))
+
+    def test_dict_to_dataclass_requires_dataclass(self):
+        with self.assertRaises(TypeError):
+            dict_to_dataclass({}, {})
+        with self.assertRaises(TypeError):
+            dict_to_dataclass({}, Keyed)
+
+    def test_compile_mapper_is_cached(self):
+        self.assertIs(compile_mapper(Keyed), compile_mapper(Keyed))
+
+
+class TestResponse(unittest.TestCase):
+
+    def test_response_to_dict(self):
+        resp = Response(
+            body={'hello': 'world'},
+            code=400,
+            errors=[APIError(code=400, message='bad')],
+            header={'X-Abc': ['1']},
+        )
+        self.assertEqual(
+            {
+                'code': 400,
+                'body': {'hello': 'world'},
+                'errors': [{'code': 400, 'message': 'bad'}],
+                'header': {'X-Abc': ['1']},
+            },
+            response_to_dict(resp),
+        )
+
+    def test_response_to_dict_omits_empty(self):
+        self.assertEqual({'code': 200}, response_to_dict(Response(body=None, code=200, errors=None, header=None)))
+
+
+class TestCanonizeHeader(unittest.TestCase):
+
+    def test_canonize_header(self):
+        for h, expected in [
+            ('content-type', 'Content-Type'),
+            ('CONTENT-TYPE', 'Content-Type'),
+            ('Content-Type', 'Content-Type'),
+            ('x-cs-traceid', 'X-Cs-Traceid'),
+            ('x--double', 'X--Double'),
+            ('-leading', '-Leading'),
+            ('accept', 'Accept'),
+            ('', ''),
+        ]:
+            with self.subTest(h=h):
+                self.assertEqual(expected, canonize_header(h))
@@ -0,0 +1,82 @@
+from http.client import HTTPConnection
+from unittest import main, TestCase
+from crowdstrike.foundry.function.metrics import Histogram, Metrics, percentile, start_metrics_server
+from crowdstrike.foundry.function.model import Request
+
+if __name__ == '__main__':
+    main()
+
+
+class TestHistogram(TestCase):
+
+    def test_cumulative(self):
+        h = Histogram(buckets=[0.1, 1.0])
+        for v in [0.05, 0.1, 0.5, 2.0]:
+            h.observe(v)
+        self.assertEqual([(0.1, 2), (1.0, 3), (float('inf'), 4)], h.cumulative())
+        self.assertEqual(4, h.count)
+        self.assertAlmostEqual(2.65, h.sum)
+
+
+class TestPercentile(TestCase):
+
+    def test_nearest_rank(self):
+        ordered = [float(i) for i in range(1, 11)]
+        for p, expected in [(0, 1.0), (50, 5.0), (95, 10.0), (100, 10.0)]:
+            with self.subTest(p=p):
+                self.assertEqual(expected, percentile(ordered, p))
+        self.assertEqual(0.0, percentile([], 50))
+
+
+class TestMetrics(TestCase):
+
+    def setUp(self):
+        self.metrics = Metrics(buckets=[0.1, 1.0])
+        req = Request(method='get', route='/hosts/{id}')
+        self.metrics.observe_request(req, 200, read=0.01, handler=0.2, write=0.01)
+        self.metrics.observe_request(req, 404, read=0.01, handler=0.05, write=0.01)
+        self.metrics.observe_request(None, 400, read=0.01, write=0.01)
+
+    def test_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        self.assertEqual({'GET /hosts/{id}', ' '}, set(snapshot))
+        route = snapshot['GET /hosts/{id}']
+        self.assertEqual(2, route['requests'])
+        self.assertEqual({404: 1}, route['errors'])
+        self.assertEqual([(0.1, 1), (1.0, 2), (float('inf'), 2)], route['phases']['handler']['buckets'])
+        self.assertEqual(0, snapshot[' ']['phases']['handler']['count'])
+        self.assertEqual(1, snapshot[' ']['phases']['read']['count'])
+
+        self.metrics.reset()
+        self.assertEqual({}, self.metrics.snapshot())
+
+    def test_render(self):
+        text = self.metrics.render()
+        self.assertIn('cs_fn_requests_total{method="GET",route="/hosts/{id}"} 2\n', text)
+        self.assertIn('cs_fn_request_errors_total{method="GET",route="/hosts/{id}",code="404"} 1\n', text)
+        self.assertIn('cs_fn_request_errors_total{method="",route="",code="400"} 1\n', text)
+        self.assertIn(
+            'cs_fn_request_phase_seconds_bucket{method="GET",route="/hosts/{id}",phase="handler",le="0.1"} 1\n', text)
+        self.assertIn(
+            'cs_fn_request_phase_seconds_bucket{method="GET",route="/hosts/{id}",phase="handler",le="+Inf"} 2\n', text)
+        self.assertIn('cs_fn_request_phase_seconds_count{method="GET",route="/hosts/{id}",phase="read"} 2\n', text)
+
+    def test_server(self):
+        server = start_metrics_server(self.metrics, 0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        conn = HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+        try:
+            conn.request('GET', '/metrics')
+            resp = conn.getresponse()
+            self.assertEqual(200, resp.status)
+            self.assertTrue(resp.getheader('Content-Type').startswith('text/plain; version=0.0.4'))
+            self.assertEqual(self.metrics.render(), resp.read().decode('utf-8'))
+
+            conn.request('GET', '/other')
+            resp = conn.getresponse()
+            resp.read()
+            self.assertEqual(404, resp.status)
+        finally:
+            conn.close()
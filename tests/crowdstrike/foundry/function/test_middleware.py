@@ -0,0 +1,124 @@
+import asyncio
+from unittest import main, TestCase
+from crowdstrike.foundry.function import APIError, Request, Response
+from crowdstrike.foundry.function.cache import CachePolicy
+from crowdstrike.foundry.function.middleware import Middleware, compose
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+class Recorder(Middleware):
+
+    def __init__(self, name: str, events: list):
+        self.name = name
+        self.events = events
+
+    def before(self, req):
+        self.events.append(f'{self.name}.before')
+
+    def after(self, req, resp):
+        self.events.append(f'{self.name}.after')
+        resp.header[f'X-{self.name}'] = ['1']
+
+
+class AsyncRecorder(Recorder):
+
+    async def before(self, req):
+        await asyncio.sleep(0)
+        return Recorder.before(self, req)
+
+    async def after(self, req, resp):
+        await asyncio.sleep(0)
+        return Recorder.after(self, req, resp)
+
+
+class RequireToken(Middleware):
+
+    def before(self, req):
+        if req.access_token == '':
+            return Response(code=401, errors=[APIError(code=401, message='Unauthorized')])
+        return None
+
+
+class BeforeOnly(Middleware):
+
+    def before(self, req):
+        return None
+
+
+class TestCompose(TestCase):
+
+    def test_only_overridden_hooks(self):
+        m = BeforeOnly()
+        hooks, is_async = compose([Middleware(), m, AsyncRecorder('a', [])])
+        self.assertEqual(2, len(hooks))
+        self.assertEqual((m.before, None), hooks[0])
+        self.assertTrue(is_async)
+        self.assertFalse(compose([m])[1])
+
+    def test_not_middleware(self):
+        with self.assertRaisesRegex(TypeError, 'middleware must be an instance of Middleware'):
+            compose([lambda req: None])
+
+
+class TestRouterMiddleware(TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.router = Router({})
+
+        def handle(req):
+            self.events.append('handler')
+            return Response(body={'ok': True}, code=200)
+
+        async def handle_async(req):
+            return handle(req)
+
+        self.router.use(Recorder('global', self.events))
+        self.router.register(Route(method='GET', path='/sync', func=handle, middleware=[Recorder('route', self.events)]))
+        self.router.register(Route(
+            method='GET', path='/async', func=handle_async, middleware=[AsyncRecorder('route', self.events)]))
+        self.router.register(Route(
+            method='GET', path='/secure', func=handle, middleware=[RequireToken(), Recorder('route', self.events)],
+            cache=CachePolicy()))
+
+    def test_order(self):
+        resp = self.router.route(Request(method='GET', url='/sync'))
+        self.assertEqual(['global.before', 'route.before', 'handler', 'route.after', 'global.after'], self.events)
+        self.assertEqual({'X-global': ['1'], 'X-route': ['1']}, resp.header)
+
+    def test_async_hooks(self):
+        expected = ['global.before', 'route.before', 'handler', 'route.after', 'global.after']
+        self.router.route(Request(method='GET', url='/async'))
+        self.assertEqual(expected, self.events)
+
+        self.events.clear()
+        asyncio.run(self.router.route_async(Request(method='GET', url='/async')))
+        self.assertEqual(expected, self.events)
+
+        self.events.clear()
+        asyncio.run(self.router.route_async(Request(method='GET', url='/sync')))
+        self.assertEqual(expected, self.events)
+
+    def test_short_circuit(self):
+        resp = self.router.route(Request(method='GET', url='/secure'))
+        self.assertEqual(401, resp.code)
+        self.assertEqual(['global.before', 'global.after'], self.events)
+
+        self.events.clear()
+        for _ in range(2):
+            resp = self.router.route(Request(method='GET', url='/secure', access_token='t'))
+            self.assertEqual(200, resp.code)
+        # The second request is answered from the cache, but still passes through the middleware.
+        self.assertEqual(['global.before', 'route.before', 'handler', 'route.after', 'global.after'] +
+                         ['global.before', 'route.before', 'route.after', 'global.after'], self.events)
+
+    def test_use_after_registration(self):
+        self.router.use(Recorder('late', self.events))
+        self.router.route(Request(method='GET', url='/sync'))
+        self.assertEqual(
+            ['global.before', 'late.before', 'route.before', 'handler', 'route.after', 'late.after', 'global.after'],
+            self.events,
+        )
@@ -0,0 +1,73 @@
+from io import BytesIO
+from unittest import main, TestCase
+from crowdstrike.foundry.function import FDKException
+from crowdstrike.foundry.function.codec import get_codec
+from crowdstrike.foundry.function.mapping import dict_to_request
+from crowdstrike.foundry.function.multipart import MultipartOptions, close_files, read_multipart_payload
+from tests.crowdstrike.foundry.function.utils import multipart_body
+
+if __name__ == '__main__':
+    main()
+
+
+class TestReadMultipartPayload(TestCase):
+
+    def setUp(self):
+        self.files = {
+            'small.txt': b'hello world',
+            'large.bin': bytes(range(256)) * 1024,
+        }
+        content_type, self.body = multipart_body(
+            meta={'method': 'POST', 'url': '/upload'},
+            body={'name': 'test'},
+            files=self.files,
+        )
+        self.headers = {'Content-Type': content_type, 'Content-Length': str(len(self.body))}
+
+    def read(self, options: MultipartOptions) -> dict:
+        return read_multipart_payload(self.headers, BytesIO(self.body), get_codec('json'), options)
+
+    def test_files_as_bytes(self):
+        payload = self.read(MultipartOptions())
+        self.assertEqual('POST', payload['method'])
+        self.assertEqual('/upload', payload['url'])
+        self.assertEqual({'name': 'test'}, payload['body'])
+        self.assertEqual(self.files, payload['files'])
+
+    def test_streamed_files(self):
+        payload = self.read(MultipartOptions(stream_files=True, memory_limit=1024))
+        req = dict_to_request(payload)
+        small = req.files['small.txt']
+        large = req.files['large.bin']
+        try:
+            self.assertFalse(small._rolled, 'small file was written to disk')
+            self.assertTrue(large._rolled, 'large file was kept in memory')
+            self.assertEqual(self.files['small.txt'], small.read())
+            self.assertEqual(self.files['large.bin'], large.read())
+            large.seek(10)
+            self.assertEqual(self.files['large.bin'][10:20], large.read(10))
+        finally:
+            close_files(req)
+        self.assertTrue(small.closed)
+        self.assertTrue(large.closed)
+
+    def test_max_file_size(self):
+        with self.assertRaisesRegex(FDKException, 'file large.bin exceeds 65536 bytes') as ctx:
+            self.read(MultipartOptions(stream_files=True, max_file_size=65536))
+        self.assertEqual(413, ctx.exception.code)
+
+    def test_max_total_size(self):
+        with self.assertRaisesRegex(FDKException, 'request exceeds 1000 bytes') as ctx:
+            self.read(MultipartOptions(max_total_size=1000))
+        self.assertEqual(413, ctx.exception.code)
+
+    def test_max_total_size_without_length(self):
+        del self.headers['Content-Length']
+        with self.assertRaisesRegex(FDKException, 'request exceeds 1000 bytes') as ctx:
+            self.read(MultipartOptions(max_total_size=1000))
+        self.assertEqual(413, ctx.exception.code)
+
+    def test_missing_boundary(self):
+        self.headers['Content-Type'] = 'multipart/form-data'
+        with self.assertRaisesRegex(FDKException, 'missing multipart boundary'):
+            self.read(MultipartOptions())
@@ -0,0 +1,99 @@
+import asyncio
+import os
+import pstats
+import tempfile
+import time
+from unittest import main, TestCase
+from crowdstrike.foundry.function import Request, RequestParams, Response
+from crowdstrike.foundry.function.profiling import ProfileOptions, Profiler
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+def do_busy_work(req):
+    deadline = time.monotonic() + 0.05
+    while time.monotonic() < deadline:
+        sum(range(100))
+    return Response(code=200)
+
+
+async def do_busy_work_async(req):
+    return do_busy_work(req)
+
+
+def profiled_request(url: str = '/work', trace_id: str = 'trace-1') -> Request:
+    return Request(
+        method='GET',
+        url=url,
+        trace_id=trace_id,
+        params=RequestParams(header={'X-Cs-Fn-Profile': ['true']}),
+    )
+
+
+class TestProfiler(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def new_router(self, **kwargs) -> Router:
+        profiler = Profiler(ProfileOptions(directory=self.directory, **kwargs))
+        router = Router({}, profiler=profiler)
+        router.register(Route(method='GET', path='/work', func=do_busy_work))
+        router.register(Route(method='GET', path='/work-async', func=do_busy_work_async))
+        return router
+
+    def test_wants(self):
+        req = profiled_request()
+        self.assertFalse(Profiler(ProfileOptions()).wants(req))
+        self.assertTrue(Profiler(ProfileOptions(profiler='cprofile')).wants(req))
+        self.assertFalse(Profiler(ProfileOptions(profiler='cprofile', header='')).wants(req))
+        self.assertTrue(Profiler(ProfileOptions(profiler='cprofile', header='x-cs-fn-profile')).wants(req))
+        self.assertFalse(Profiler(ProfileOptions(profiler='cprofile')).wants(Request()))
+        self.assertTrue(Profiler(ProfileOptions(profiler='cprofile', sample_rate=1.0)).wants(Request()))
+
+    def test_unsupported_profiler(self):
+        with self.assertRaisesRegex(ValueError, 'unsupported profiler: yappi'):
+            Profiler(ProfileOptions(profiler='yappi'))
+
+    def test_cprofile(self):
+        router = self.new_router(profiler='cprofile')
+        self.assertEqual(200, router.route(profiled_request()).code)
+        self.assertEqual(200, router.route(Request(method='GET', url='/work', trace_id='not-profiled')).code)
+
+        self.assertEqual(['trace-1.prof'], os.listdir(self.directory))
+        stats = pstats.Stats(os.path.join(self.directory, 'trace-1.prof'))
+        self.assertIn('do_busy_work', {name for _, _, name in stats.stats})
+
+    def test_cprofile_async(self):
+        router = self.new_router(profiler='cprofile')
+        resp = asyncio.run(router.route_async(profiled_request('/work-async')))
+        self.assertEqual(200, resp.code)
+
+        stats = pstats.Stats(os.path.join(self.directory, 'trace-1.prof'))
+        self.assertIn('do_busy_work_async', {name for _, _, name in stats.stats})
+
+    def test_sampling(self):
+        router = self.new_router(profiler='sampling', interval=0.001)
+        self.assertEqual(200, router.route(profiled_request()).code)
+
+        with open(os.path.join(self.directory, 'trace-1.folded')) as fd:
+            lines = fd.read().splitlines()
+        self.assertGreater(len(lines), 0)
+        self.assertTrue(any('do_busy_work (test_profiling.py:' in line for line in lines))
+        for line in lines:
+            stack, n = line.rsplit(' ', 1)
+            self.assertGreater(int(n), 0)
+
+    def test_file_names(self):
+        router = self.new_router(profiler='cprofile')
+        router.route(profiled_request(trace_id='../a/b'))
+        router.route(profiled_request(trace_id='../a/b'))
+        router.route(profiled_request(trace_id=''))
+
+        names = sorted(os.listdir(self.directory))
+        self.assertEqual(['.._a_b.1.prof', '.._a_b.prof'], names[:2])
+        self.assertTrue(names[2].startswith('untraced-'))
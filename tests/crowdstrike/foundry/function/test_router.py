@@ -0,0 +1,113 @@
+from unittest import main, TestCase
+from crowdstrike.foundry.function import FDKException, Request, Response
+from crowdstrike.foundry.function.mapping import dict_to_request
+from crowdstrike.foundry.function.router import Route, Router
+
+if __name__ == '__main__':
+    main()
+
+
+def handler_named(name: str):
+    def handle(req):
+        return Response(
+            body={
+                'handler': name,
+                'path_params': req.path_params,
+            },
+            code=200,
+        )
+    return handle
+
+
+class TestPathTemplates(TestCase):
+
+    def setUp(self):
+        self.router = Router({})
+        for method, path in [
+            ('GET', '/hosts'),
+            ('GET', '/hosts/all'),
+            ('GET', '/hosts/{id}'),
+            ('DELETE', '/hosts/{host_id}'),
+            ('GET', '/hosts/{id:int}/groups'),
+            ('GET', '/hosts/{name}/groups'),
+            ('GET', '/scores/{score:float}'),
+            ('GET', '/files/{rest:path}'),
+        ]:
+            self.router.register(Route(
+                method=method,
+                path=path,
+                func=handler_named(f'{method} {path}'),
+            ))
+
+    def route(self, method: str, url: str) -> dict:
+        return self.router.route(Request(method=method, url=url)).body
+
+    def test_static_path_wins_over_template(self):
+        self.assertEqual({'handler': 'GET /hosts/all', 'path_params': {}}, self.route('GET', '/hosts/all'))
+
+    def test_route_is_not_taken_from_payload(self):
+        # The route labels the request's metrics, so callers must not be able to choose it.
+        req = dict_to_request({'method': 'GET', 'url': '/nowhere', 'route': '/evil'})
+        with self.assertRaisesRegex(FDKException, 'Not Found'):
+            self.router.route(req)
+        self.assertEqual('', req.route)
+
+    def test_path_params_are_not_taken_from_payload(self):
+        req = dict_to_request({'method': 'GET', 'url': '/hosts/all', 'path_params': {'id': 'x'}})
+        self.assertEqual({'handler': 'GET /hosts/all', 'path_params': {}}, self.router.route(req).body)
+
+    def test_str_parameter(self):
+        self.assertEqual({'handler': 'GET /hosts/{id}', 'path_params': {'id': 'abc'}}, self.route('GET', '/hosts/abc'))
+
+    def test_parameter_names_are_per_route(self):
+        self.assertEqual(
+            {'handler': 'DELETE /hosts/{host_id}', 'path_params': {'host_id': 'abc'}},
+            self.route('delete', '/hosts/abc'),
+        )
+
+    def test_template_serves_method_missing_from_static_path(self):
+        self.assertEqual(
+            {'handler': 'DELETE /hosts/{host_id}', 'path_params': {'host_id': 'all'}},
+            self.route('DELETE', '/hosts/all'),
+        )
+
+    def test_typed_parameters(self):
+        self.assertEqual(
+            {'handler': 'GET /hosts/{id:int}/groups', 'path_params': {'id': 42}},
+            self.route('GET', '/hosts/42/groups'),
+        )
+        self.assertEqual(
+            {'handler': 'GET /hosts/{name}/groups', 'path_params': {'name': 'x42'}},
+            self.route('GET', '/hosts/x42/groups'),
+        )
+        self.assertEqual({'handler': 'GET /scores/{score:float}', 'path_params': {'score': 1.5}},
+                         self.route('GET', '/scores/1.5'))
+
+    def test_path_parameter(self):
+        self.assertEqual(
+            {'handler': 'GET /files/{rest:path}', 'path_params': {'rest': 'a/b/c.txt'}},
+            self.route('GET', '/files/a/b/c.txt'),
+        )
+        self.assertEqual({'handler': 'GET /files/{rest:path}', 'path_params': {'rest': ''}}, self.route('GET', '/files/'))
+
+    def test_not_found(self):
+        with self.assertRaisesRegex(FDKException, 'Not Found: GET /scores/high'):
+            self.route('GET', '/scores/high')
+        with self.assertRaisesRegex(FDKException, 'Not Found: GET /hosts//groups'):
+            self.route('GET', '/hosts//groups')
+
+    def test_method_not_allowed(self):
+        with self.assertRaisesRegex(FDKException, 'Method Not Allowed: POST'):
+            self.route('POST', '/hosts/abc')
+
+    def test_invalid_templates(self):
+        for path, message in [
+            ('/hosts/{id}', 'Duplicate method path combination: GET /hosts/{id}'),
+            ('/hosts/{other}', 'Duplicate method path combination: GET /hosts/{other}'),
+            ('/hosts/{id:uuid}', 'Unsupported path parameter type uuid'),
+            ('/hosts/x{id}', 'Malformed path parameter'),
+            ('/hosts/{id}/{id}', 'Duplicate path parameter id'),
+            ('/hosts/{rest:path}/groups', 'Path parameter rest must end the path'),
+        ]:
+            with self.subTest(path=path), self.assertRaisesRegex(FDKException, message):
+                self.router.register(Route(method='GET', path=path, func=handler_named(path)))
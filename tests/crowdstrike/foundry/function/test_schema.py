@@ -0,0 +1,172 @@
+import asyncio
+import functools
+import importlib.util
+import json
+import os
+import tempfile
+from unittest import main, TestCase
+from crowdstrike.foundry.function import Request, Response
+from crowdstrike.foundry.function.router import Route, Router
+from crowdstrike.foundry.function.schema import ValidationOptions, Validator, load_schema
+
+if __name__ == '__main__':
+    main()
+
+EXAMPLE_DIR = os.path.join(
+    os.path.dirname(__file__), '..', '..', '..', '..', 'examples', 'complex_inputs', 'functions', 'complex_input_tester')
+
+HOST_SCHEMA = {
+    '$schema': 'https://json-schema.org/draft/2020-12/schema',
+    'type': 'object',
+    'properties': {
+        'id': {'type': 'string', 'pattern': '^[0-9a-f]+$', 'maxLength': 8},
+        'port': {'type': 'integer', 'minimum': 1, 'exclusiveMaximum': 65536},
+        'tags': {'type': 'array', 'items': {'$ref': '#/$defs/tag'}, 'maxItems': 2, 'uniqueItems': True},
+        'mode': {'enum': ['block', 'detect']},
+        'owner': {'type': ['string', 'null']},
+    },
+    'required': ['id'],
+    'additionalProperties': False,
+    '$defs': {
+        'tag': {'type': 'string', 'minLength': 1},
+    },
+}
+
+
+class TestValidator(TestCase):
+
+    def test_valid(self):
+        v = Validator(HOST_SCHEMA)
+        self.assertEqual([], v.errors({'id': 'ab12', 'port': 443, 'tags': ['a', 'b'], 'mode': 'block', 'owner': None}))
+        self.assertEqual([], v.errors({'id': 'ab12', 'port': 443.0}))
+
+    def test_invalid(self):
+        v = Validator(HOST_SCHEMA)
+        for value, expected in [
+            ({}, ['$: missing required property id']),
+            ([], ['$: expected object']),
+            ({'id': 'xyz'}, ['$.id: must match ^[0-9a-f]+$']),
+            ({'id': 'a' * 9}, ['$.id: must have at most characters: 8']),
+            ({'id': 'a', 'port': True}, ['$.port: expected integer']),
+            ({'id': 'a', 'port': 65536}, ['$.port: must be less than 65536']),
+            ({'id': 'a', 'tags': ['a', '']}, ['$.tags[1]: must have at least characters: 1']),
+            ({'id': 'a', 'tags': ['a', 'a']}, ['$.tags: items must be unique']),
+            ({'id': 'a', 'mode': 'allow'}, ['$.mode: must be one of ["block", "detect"]']),
+            ({'id': 'a', 'owner': 1}, ['$.owner: expected string or null']),
+            ({'id': 'a', 'other': 1}, ['$.other: not allowed']),
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(expected, v.errors(value))
+
+    def test_combinators(self):
+        v = Validator({'oneOf': [{'type': 'integer'}, {'type': 'number', 'multipleOf': 0.5}], 'not': {'const': 0}})
+        self.assertEqual([], v.errors(1.5))
+        self.assertEqual(['$: must match exactly one schema of oneOf, matched 2'], v.errors(2))
+        self.assertEqual(['$: must match exactly one schema of oneOf, matched 0'], v.errors(0.3))
+        self.assertEqual(['$: must match exactly one schema of oneOf, matched 2', '$: must not match schema of not'],
+                         v.errors(0))
+
+    def test_recursive_ref(self):
+        v = Validator({'type': 'object', 'properties': {'children': {'type': 'array', 'items': {'$ref': '#'}}}})
+        self.assertEqual([], v.errors({'children': [{'children': []}]}))
+        self.assertEqual(['$.children[0].children[0]: expected object'], v.errors({'children': [{'children': [1]}]}))
+
+    def test_unsupported(self):
+        for schema, msg in [
+            ({'type': 'date'}, 'unsupported schema type: date'),
+            ({'dependentRequired': {}}, 'unsupported schema keyword: dependentRequired'),
+            ({'$ref': 'other.json'}, 'unsupported schema reference: other.json'),
+            ({'$ref': '#/$defs/missing'}, 'unresolved schema reference: #/\\$defs/missing'),
+        ]:
+            with self.subTest(schema=schema):
+                with self.assertRaisesRegex(ValueError, msg):
+                    Validator(schema)
+
+    def test_example_schemas(self):
+        v = Validator(load_schema('request_schema.json', EXAMPLE_DIR))
+        self.assertEqual([], v.errors({'name': 'Jane', 'age': 42}))
+        self.assertEqual(['$.age: expected integer'], v.errors({'name': 'Jane', 'age': '42'}))
+
+
+class TestRouterValidation(TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.router = Router({}, validation=ValidationOptions(response_sample_rate=1.0))
+
+        def create_host(req):
+            self.calls += 1
+            # Answers without the ID it was given, against the response schema, when given `bad0`.
+            return Response(body={} if req.body['id'] == 'bad0' else {'id': req.body['id']}, code=201)
+
+        async def create_host_async(req):
+            return create_host(req)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        response_schema = os.path.join(tmp.name, 'response_schema.json')
+        with open(response_schema, 'w') as fd:
+            json.dump({'type': 'object', 'required': ['id']}, fd)
+
+        for path, func in [('/hosts', create_host), ('/hosts-async', create_host_async)]:
+            self.router.register(Route(
+                method='POST', path=path, func=func, request_schema=HOST_SCHEMA, response_schema=response_schema))
+
+    def test_invalid_request(self):
+        for path in ['/hosts', '/hosts-async']:
+            with self.subTest(path=path):
+                req = Request(method='POST', url=path, body={'id': 'xyz', 'port': 0})
+                resp = self.router.route(req)
+                self.assertEqual(400, resp.code)
+                self.assertEqual(
+                    ['Bad Request: $.id: must match ^[0-9a-f]+$', 'Bad Request: $.port: must be at least 1'],
+                    [e.message for e in resp.errors],
+                )
+                resp = asyncio.run(self.router.route_async(Request(method='POST', url=path, body={})))
+                self.assertEqual(['Bad Request: $: missing required property id'], [e.message for e in resp.errors])
+        self.assertEqual(0, self.calls)
+
+    def test_valid_request(self):
+        resp = self.router.route(Request(method='POST', url='/hosts', body={'id': 'ab12'}))
+        self.assertEqual(201, resp.code)
+        self.assertEqual({'id': 'ab12'}, resp.body)
+
+    def test_invalid_response_is_logged(self):
+        with self.assertLogs('cs-logger', level='WARNING') as logs:
+            resp = self.router.route(Request(method='POST', url='/hosts-async', body={'id': 'bad0'}))
+        self.assertEqual(201, resp.code)
+        self.assertEqual(
+            ['WARNING:cs-logger:response of POST /hosts-async does not match its schema: '
+             '$: missing required property id'],
+            logs.output,
+        )
+
+    def test_relative_path_of_decorated_handler(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        with open(os.path.join(tmp.name, 'request_schema.json'), 'w') as fd:
+            json.dump({'type': 'object', 'required': ['id']}, fd)
+        module = os.path.join(tmp.name, 'handlers.py')
+        with open(module, 'w') as fd:
+            fd.write('def create_host(req):\n    return None\n')
+        spec = importlib.util.spec_from_file_location('handlers', module)
+        handlers = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(handlers)
+
+        # Wrapped by a decorator from another directory, against which the schema path must not be resolved.
+        @functools.wraps(handlers.create_host)
+        def wrapper(req):
+            return Response(code=201)
+
+        router = Router({})
+        router.register(Route(method='POST', path='/hosts', func=wrapper, request_schema='request_schema.json'))
+        resp = router.route(Request(method='POST', url='/hosts', body={}))
+        self.assertEqual(['Bad Request: $: missing required property id'], [e.message for e in resp.errors])
+
+    def test_response_sampling(self):
+        router = Router({}, validation=ValidationOptions(response_sample_rate=0.0))
+        router.register(Route(
+            method='GET', path='/hosts', func=lambda req: Response(code=200), response_schema={'required': ['id']}))
+        route = router._find_route(Request(method='GET', url='/hosts'))
+        self.assertEqual([], route.schemas.response_errors(200, {}))
+        self.assertEqual(['$: missing required property id'], route.schemas.response.errors({}))
@@ -1,4 +1,8 @@
+import json
+import time
+from logging import Logger, NullHandler
 from crowdstrike.foundry.function.config_loader import ConfigLoaderBase
+from crowdstrike.foundry.function.router import Router
 from crowdstrike.foundry.function.runner import RunnerBase
 
 
@@ -21,3 +25,42 @@ class StaticConfigLoader(ConfigLoaderBase):
 
     def load(self):
         return self.config
+
+
+class NullLogger(Logger):
+
+    def __init__(self):
+        Logger.__init__(self, 'null')
+        self.addHandler(NullHandler())
+        self.propagate = False
+
+
+def multipart_body(meta: dict, body: dict, files: dict, boundary: str = 'cs-fn-boundary'):
+    """Build a `multipart/form-data` request body, returning its content type and encoded form."""
+    parts = []
+    for name, value in [('meta', meta), ('body', body)]:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'.encode('utf-8')
+            + json.dumps(value).encode('utf-8') + b'\r\n'
+        )
+    for file_name, content in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="{file_name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+            + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return f'multipart/form-data; boundary={boundary}', b''.join(parts)
+
+
+def wait_for_metrics(router: Router, requests: int, timeout: float = 5) -> dict:
+    """Wait for the router's metrics to account for the given number of requests, returning a snapshot of them.
+
+    Runners record metrics once the response has been written, so they may lag behind the caller.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        metrics = router.metrics.snapshot()
+        if sum(m['requests'] for m in metrics.values()) >= requests or time.monotonic() > deadline:
+            return metrics
+        time.sleep(0.01)